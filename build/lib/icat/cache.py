@@ -0,0 +1,321 @@
+"""Persistent caches to speed up the initialization of the client.
+
+.. note::
+   This module is mostly intended for the internal use in python-icat.
+   Most users will not need to use it directly, but rather set the
+   `cacheDir` argument to :class:`icat.client.Client`.
+
+.. versionadded:: 1.8.0
+"""
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import pickle
+import tempfile
+
+import suds
+import suds.cache
+import suds.sudsobject
+
+from .exception import VersionMethodError
+from .helper import Version
+
+__all__ = ['SchemaCache', 'WSDLCache']
+
+log = logging.getLogger(__name__)
+
+
+def _url_hash(url):
+    """Return a hash of an URL, suitable to be used in a file name.
+    """
+    return hashlib.sha1(url.encode('utf8')).hexdigest()
+
+def _atomic_write(path, data):
+    """Write data to a file, replacing an existing file atomically.
+
+    Concurrent readers will either see the old or the new content of
+    the file, but never a partially written one.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmpname = tempfile.mkstemp(dir=str(path.parent),
+                                   prefix=".%s." % path.name)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmpname, str(path))
+    except BaseException:
+        try:
+            os.unlink(tmpname)
+        except OSError:
+            pass
+        raise
+
+def sudsobj2data(obj):
+    """Convert a Suds object into plain data suitable to be serialized.
+
+    Suds objects are converted to a :class:`dict` having an additional
+    special key `__class__` with the name of the object's class.
+    """
+    if isinstance(obj, suds.sudsobject.Object):
+        d = { k: sudsobj2data(v) for k, v in obj }
+        d['__class__'] = obj.__class__.__name__
+        return d
+    elif isinstance(obj, (list, tuple)):
+        return [ sudsobj2data(v) for v in obj ]
+    elif isinstance(obj, str):
+        return str(obj)
+    else:
+        return obj
+
+def data2sudsobj(data):
+    """Convert the data created by :func:`sudsobj2data` back into a
+    Suds object.
+    """
+    if isinstance(data, dict):
+        d = dict(data)
+        classname = d.pop('__class__')
+        d = { k: data2sudsobj(v) for k, v in d.items() }
+        return suds.sudsobject.Factory.object(classname, d)
+    elif isinstance(data, list):
+        return [ data2sudsobj(v) for v in data ]
+    else:
+        return data
+
+
+class SchemaCache():
+    """A persistent cache for schema information from an ICAT server.
+
+    The cache stores the entity names, the entity information, the
+    authenticator information, and the names of the types defined in
+    the service description of an ICAT server in a file in the cache
+    directory.  The file is keyed by the URL of the ICAT
+    service.  It is only considered valid if the API version of the
+    server has not changed since the cache has been written.
+
+    :param cachedir: the cache directory.
+    :type cachedir: :class:`~pathlib.Path` or :class:`str`
+    :param url: the URL of the ICAT service.
+    :type url: :class:`str`
+    """
+
+    FormatVersion = 1
+    """Version of the cache file format."""
+
+    def __init__(self, cachedir, url):
+        self.url = url
+        self.path = Path(cachedir) / ("schema-%s.json" % _url_hash(url))
+        self.apiversion = None
+        self.entityNames = None
+        self.entityInfo = {}
+        self.authenticatorInfo = None
+        self.wsdlTypes = None
+
+    def load(self, apiversion=None):
+        """Load the cache.
+
+        :param apiversion: the API version of the ICAT server.  If
+            this is :const:`None`, the cache will be loaded regardless
+            of the version it has been written for.
+        :type apiversion: :class:`icat.helper.Version`
+        :return: :const:`True` if valid content has been loaded from
+            the cache, :const:`False` otherwise.
+        :rtype: :class:`bool`
+        """
+        try:
+            with self.path.open("rt", encoding="utf8") as f:
+                data = json.load(f)
+            if (data['format'] != self.FormatVersion or
+                data['url'] != self.url or
+                (apiversion is not None and
+                 data['apiversion'] != str(apiversion))):
+                log.debug("Schema cache %s is stale", self.path)
+                return False
+            version = Version(data['apiversion'])
+            entityNames = data['entityNames']
+            entityInfo = { k: data2sudsobj(v)
+                           for k, v in data['entityInfo'].items() }
+            authInfo = data.get('authenticatorInfo')
+            if authInfo is not None:
+                authInfo = data2sudsobj(authInfo)
+            wsdlTypes = data.get('wsdlTypes')
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, LookupError, TypeError) as e:
+            log.warning("Ignoring invalid schema cache %s: %s", self.path, e)
+            return False
+        self.apiversion = version
+        self.entityNames = entityNames
+        self.entityInfo = entityInfo
+        self.authenticatorInfo = authInfo
+        self.wsdlTypes = wsdlTypes
+        log.debug("Schema information loaded from cache %s", self.path)
+        return True
+
+    def save(self, client):
+        """Query the schema information from the server and save it in
+        the cache.
+
+        Errors writing the cache file are logged, but otherwise
+        ignored.
+
+        :param client: the client connected to the ICAT server.
+        :type client: :class:`icat.client.Client`
+        """
+        entityNames = [ str(n) for n in client.getEntityNames() ]
+        entityInfo = {}
+        for n in ['Parameter'] + entityNames:
+            entityInfo[n] = sudsobj2data(client.getEntityInfo(n))
+        data = {
+            'format': self.FormatVersion,
+            'url': self.url,
+            'apiversion': str(client.apiversion),
+            'entityNames': entityNames,
+            'entityInfo': entityInfo,
+        }
+        try:
+            data['authenticatorInfo'] = \
+                sudsobj2data(client.getAuthenticatorInfo())
+        except VersionMethodError:
+            pass
+        wsdl = getattr(client, 'wsdl', None)
+        if wsdl is not None:
+            types = { str(n) for n, ns in wsdl.schema.types.keys() }
+            data['wsdlTypes'] = sorted(types)
+        try:
+            _atomic_write(self.path, json.dumps(data).encode('utf8'))
+        except OSError as e:
+            log.warning("Cannot write schema cache %s: %s", self.path, e)
+            return
+        self.apiversion = client.apiversion
+        self.entityNames = entityNames
+        log.debug("Schema information saved to cache %s", self.path)
+
+
+class WSDLCache(suds.cache.Cache):
+    """A persistent cache for the parsed service definition.
+
+    This is a Suds object cache to be used with the `cachingpolicy`
+    option set to 1.  It stores the pickled WSDL definitions object
+    in the cache directory.  Entries are written atomically, so it is
+    safe for many processes to use the same cache directory
+    concurrently.
+
+    Suds does not know the API version of the ICAT server while
+    reading the WSDL.  The version is recorded separately by
+    :meth:`~icat.cache.WSDLCache.check_version` after the client
+    queried it from the server.  An entry is discarded if the version
+    does not match.
+
+    .. note::
+       Loading pickled data is not secure against maliciously
+       constructed data.  The cache directory must only be writable
+       by trusted users.
+
+    :param cachedir: the cache directory.
+    :type cachedir: :class:`~pathlib.Path` or :class:`str`
+    """
+
+    FormatVersion = 1
+    """Version of the cache file format."""
+
+    protocol = pickle.HIGHEST_PROTOCOL
+    """The pickle protocol to use."""
+
+    def __init__(self, cachedir):
+        self.location = Path(cachedir)
+        self.last_id = None
+        self.last_hit = False
+
+    def _path(self, id, suffix):
+        return self.location / ("wsdl-%s.%s" % (id, suffix))
+
+    def get(self, id):
+        self.last_id = id
+        self.last_hit = False
+        try:
+            with self._path(id, "pickle").open("rb") as f:
+                data = pickle.load(f)
+            if (data['format'] != self.FormatVersion or
+                data['suds'] != suds.__version__):
+                return None
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log.warning("Ignoring invalid WSDL cache entry %s: %s", id, e)
+            return None
+        log.debug("WSDL definitions loaded from cache %s", id)
+        self.last_hit = True
+        return data['object']
+
+    def put(self, id, object):
+        self.last_id = id
+        self.last_hit = False
+        data = {
+            'format': self.FormatVersion,
+            'suds': suds.__version__,
+            'object': object,
+        }
+        try:
+            _atomic_write(self._path(id, "pickle"),
+                          pickle.dumps(data, self.protocol))
+            self._path(id, "version").unlink()
+        except FileNotFoundError:
+            pass
+        except (OSError, pickle.PicklingError) as e:
+            log.warning("Cannot write WSDL cache entry %s: %s", id, e)
+        return object
+
+    def purge(self, id):
+        for suffix in ("pickle", "version"):
+            try:
+                self._path(id, suffix).unlink()
+            except OSError:
+                pass
+
+    def clear(self):
+        for p in self.location.glob("wsdl-*"):
+            try:
+                p.unlink()
+            except OSError:
+                pass
+
+    def check_version(self, apiversion):
+        """Check the API version of the server against the cache.
+
+        This should be called after the API version has been queried
+        from the server.  If the WSDL has been loaded from the cache,
+        verify that it has been cached for the same version.  If the
+        WSDL has been freshly read from the server, record the version
+        in the cache.
+
+        :param apiversion: the API version of the ICAT server.
+        :type apiversion: :class:`icat.helper.Version`
+        :return: :const:`False` if the WSDL has been loaded from a
+            stale cache entry, :const:`True` otherwise.  In the former
+            case, the entry has been discarded from the cache.
+        :rtype: :class:`bool`
+        """
+        if self.last_id is None:
+            return True
+        path = self._path(self.last_id, "version")
+        if self.last_hit:
+            try:
+                with path.open("rt") as f:
+                    if f.read() == str(apiversion):
+                        return True
+            except OSError:
+                pass
+            log.debug("WSDL cache entry %s is stale", self.last_id)
+            self.purge(self.last_id)
+            self.last_hit = False
+            return False
+        else:
+            try:
+                _atomic_write(path, str(apiversion).encode('ascii'))
+            except OSError as e:
+                log.warning("Cannot write WSDL cache entry %s: %s",
+                            self.last_id, e)
+            return True
@@ -0,0 +1,1600 @@
+"""Provide the Client class.
+
+This is the only module that needs to be imported to use the icat.
+"""
+
+import atexit
+import functools
+import heapq
+import logging
+import os
+from pathlib import Path
+import queue
+import re
+import threading
+import time
+import urllib.parse
+from warnings import warn
+import weakref
+
+import suds
+import suds.bindings.multiref
+import suds.client
+import suds.sudsobject
+
+from .cache import SchemaCache, WSDLCache
+from .decoder import SearchDecoder
+from .entities import getTypeMap
+from .entity import Entity
+from .exception import *
+from .helper import (Version, simpleqp_unquote, parse_attr_val,
+                     ms_timestamp, disable_logger)
+from .ids import *
+from .marshaller import RequestMarshaller
+from .query import Query
+from .schemaindex import SchemaIndex
+from .sslcontext import (create_ssl_context, HTTPSTransport,
+                         ThreadLocalTransport)
+
+__all__ = ['Client']
+
+log = logging.getLogger(__name__)
+
+def _complete_url(url, default_path="/ICATService/ICAT?wsdl"):
+    if not url:
+        return url
+    o = urllib.parse.urlparse(url)
+    if o.path or o.query:
+        return url
+    return "%s://%s%s" % (o.scheme, o.netloc, default_path)
+
+class _MultiRef(suds.bindings.multiref.MultiRef):
+    """A variant of the Suds MultiRef that may be used concurrently.
+
+    The original class keeps the state of processing a reply in
+    instance attributes, but Suds shares one instance per binding
+    between all calls.  Use a fresh instance for each reply instead.
+    """
+    def process(self, body):
+        return suds.bindings.multiref.MultiRef().process(body)
+
+def _threadsafe_bindings(wsdl):
+    """Fix the shared state in the SOAP bindings of the service
+    definition, so that calls may be issued concurrently.
+    """
+    for service in wsdl.services:
+        for port in service.ports:
+            for method in port.methods.values():
+                for b in (method.binding.input, method.binding.output):
+                    if b is not None:
+                        b.multiref = _MultiRef()
+
+class _ThreadLocalMessages():
+    """A replacement for the record of the last sent and received
+    messages in the Suds client, keeping a separate record in each
+    thread.
+    """
+    def __init__(self):
+        self._local = threading.local()
+    def get(self, key, default=None):
+        return getattr(self._local, key, default)
+    def __getitem__(self, key):
+        try:
+            return getattr(self._local, key)
+        except AttributeError:
+            raise KeyError(key)
+    def __setitem__(self, key, value):
+        setattr(self._local, key, value)
+
+def _prefetch(iterables, size):
+    """Iterate over iterables in background threads.
+
+    Yield the items of all iterables, taking them from one background
+    thread per iterable that stays up to size items ahead of the
+    consumer.  The items of each iterable are yielded in their order,
+    items from different iterables in the order in which they become
+    available.  If the generator is closed before the end, the
+    background threads are stopped after having completed the
+    retrieval of the current item.
+    """
+    items = queue.Queue()
+    stop = threading.Event()
+    def produce(iterable, slots):
+        try:
+            it = iter(iterable)
+            while True:
+                while not slots.acquire(timeout=0.1):
+                    if stop.is_set():
+                        return
+                if stop.is_set():
+                    return
+                try:
+                    item = next(it)
+                except StopIteration:
+                    items.put((slots, False, None))
+                    return
+                items.put((slots, True, item))
+        except BaseException as e:
+            items.put((slots, False, e))
+    threads = []
+    for iterable in iterables:
+        slots = threading.Semaphore(size)
+        thread = threading.Thread(target=produce, args=(iterable, slots),
+                                  name="prefetch")
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    try:
+        running = len(threads)
+        while running:
+            slots, ok, item = items.get()
+            if not ok:
+                if item is not None:
+                    raise item
+                running -= 1
+                continue
+            slots.release()
+            yield item
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+class _Reversed():
+    """Wrap a value, reversing the comparison with other wrapped values.
+    """
+    __slots__ = ('value',)
+    def __init__(self, value):
+        self.value = value
+    def __eq__(self, other):
+        return self.value == other.value
+    def __lt__(self, other):
+        return other.value < self.value
+
+def _orderKey(query):
+    """Return a function that calculates the sort key for objects
+    according to the ORDER BY clause of query.
+    """
+    items = []
+    for attr, vstr in query.order.items():
+        if vstr in ("%s", "%s ASC"):
+            desc = False
+        elif vstr == "%s DESC":
+            desc = True
+        else:
+            raise ValueError("Cannot merge results ordered by %s"
+                             % (vstr % attr))
+        items.append((attr.split('.'), desc))
+    def key(obj):
+        k = []
+        for path, desc in items:
+            v = obj
+            for a in path:
+                v = getattr(v, a, None)
+                if v is None:
+                    break
+            # Let null values go first.
+            v = (v is not None, v)
+            k.append(_Reversed(v) if desc else v)
+        return tuple(k)
+    return key
+
+def _decorate(chunks, key, index):
+    """Flatten the chunks, decorating each object with a sort key
+    that is unique across all partitions.
+    """
+    n = 0
+    for items in chunks:
+        for obj in items:
+            yield ((key(obj), index, n), obj)
+            n += 1
+
+class _ChunkedSearch():
+    """Generate the queries for the search calls in
+    :meth:`Client.searchChunked`.
+
+    In keyset mode, the chunks are selected by a condition on the id
+    of the objects rather than by the offset in the LIMIT clause.
+    """
+
+    _head_re = re.compile(r"\s*SELECT\s+(DISTINCT\s+)?(\w+)\s+FROM\s+"
+                          r"(\w+)\s+(?:AS\s+)?(\w+)(?=\s|$)", re.I)
+    _clause_re = re.compile(r"'[^']*'|\(|\)|"
+                            r"\b(WHERE|ORDER\s+BY|INCLUDE|LIMIT)\b", re.I)
+
+    def __init__(self, query, skip=0, count=None, chunksize=100,
+                 keyset=False):
+        self.skip = skip
+        self.count = count
+        self.chunksize = max(chunksize, 2)
+        self.keyset = keyset
+        self.delivered = 0
+        self.last = None
+        self.done = False
+        if keyset:
+            if isinstance(query, Query):
+                if query.attributes or query.aggregate not in (None,
+                                                               "DISTINCT"):
+                    raise ValueError("keyset pagination needs a query "
+                                     "returning objects")
+                if query.limit:
+                    raise ValueError("the query must not have a limit")
+                self.query = query.copy()
+                self.query.setOrder(["id"])
+            else:
+                self.query = query
+                self._parseQuery(query)
+        else:
+            if isinstance(query, Query):
+                query = str(query)
+            query = query.replace('%', '%%')
+            if query.startswith("SELECT"):
+                query += " LIMIT %d, %d"
+            else:
+                query = "%d, %d " + query
+            self.query = query
+
+    def _parseQuery(self, query):
+        """Split a query string into the parts needed for keyset mode.
+        """
+        m = self._head_re.match(query)
+        if not m or m.group(2) != m.group(4):
+            raise ValueError("keyset pagination needs a query of the "
+                             "form 'SELECT o FROM Entity o ...'")
+        self.var = m.group(4)
+        self.select = "SELECT %s%s FROM %s %s" % (m.group(1) or "", self.var,
+                                                  m.group(3), self.var)
+        rest = query[m.end():]
+        clauses = []
+        level = 0
+        for c in self._clause_re.finditer(rest):
+            if c.group(0) == "(":
+                level += 1
+            elif c.group(0) == ")":
+                level -= 1
+            elif c.group(1) and level == 0:
+                clauses.append((c.group(1).split()[0].upper(), c.start()))
+        self.joins = rest[:clauses[0][1]].strip() if clauses else rest.strip()
+        self.where = None
+        self.include = None
+        for i, (keyword, start) in enumerate(clauses):
+            end = clauses[i+1][1] if i+1 < len(clauses) else len(rest)
+            clause = rest[start:end].strip()
+            if keyword == "WHERE":
+                self.where = clause[5:].strip()
+            elif keyword == "INCLUDE":
+                self.include = clause
+            elif keyword == "LIMIT":
+                raise ValueError("the query must not have a LIMIT clause")
+
+    def _keysetQuery(self, skip):
+        if isinstance(self.query, Query):
+            q = self.query.copy()
+            if self.last is not None:
+                q.addConditions({"id": "> %d" % self.last})
+            q.setLimit((skip, self.chunksize))
+            return str(q)
+        parts = [self.select]
+        if self.joins:
+            parts.append(self.joins)
+        conds = []
+        if self.where:
+            conds.append("(%s)" % self.where)
+        if self.last is not None:
+            conds.append("%s.id > %d" % (self.var, self.last))
+        if conds:
+            parts.append("WHERE " + " AND ".join(conds))
+        parts.append("ORDER BY %s.id" % self.var)
+        if self.include:
+            parts.append(self.include)
+        parts.append("LIMIT %d, %d" % (skip, self.chunksize))
+        return " ".join(parts)
+
+    def nextQuery(self):
+        """Return the query for the next chunk or :const:`None` if
+        there is none.
+        """
+        if self.done:
+            return None
+        if self.count is not None:
+            self.chunksize = min(self.chunksize, self.count - self.delivered)
+        if self.chunksize <= 0:
+            return None
+        if self.keyset:
+            return self._keysetQuery(self.skip if self.last is None else 0)
+        else:
+            return self.query % (self.skip, self.chunksize)
+
+    def addResult(self, items):
+        """Take note of the result of the search call for a chunk.
+        """
+        self.delivered += len(items)
+        if len(items) < self.chunksize:
+            self.done = True
+        elif self.keyset:
+            self.last = items[-1].id
+        else:
+            self.skip += self.chunksize
+
+class Client(suds.client.Client):
+ 
+    """A client accessing an ICAT service.
+
+    This is a subclass of :class:`suds.client.Client` and inherits
+    most of its behavior.  It adds methods for the instantiation of
+    ICAT entities and implementations of the ICAT API methods.
+
+    :param url: The URL pointing to the WSDL of the ICAT service.  If
+        the URL does not contain a path, e.g. contains only a URL
+        scheme and network location part, a default path is assumend.
+    :type url: :class:`str`
+    :param idsurl: The URL pointing to the IDS service.  If set, an
+        :class:`icat.ids.IDSClient` instance will be created.
+    :type idsurl: :class:`str`
+    :param checkCert: Flag whether the server's SSL certificate should
+        be verified if connecting ICAT with HTTPS.
+    :type checkCert: :class:`bool`
+    :param caFile: Path to a file of concatenated trusted CA
+        certificates.  If neither `caFile` nor `caPath` is set, the
+        system's default certificates will be used.
+    :type caFile: :class:`str`
+    :param caPath: Path to a directory containing trusted CA
+        certificates.  If neither `caFile` nor `caPath` is set, the
+        system's default certificates will be used.
+    :type caPath: :class:`str`
+    :param sslContext: A SSL context describing various SSL options to
+        be used in HTTPS connections.  If set, this will override
+        `checkCert`, `caFile`, and `caPath`.
+    :type sslContext: :class:`ssl.SSLContext`
+    :param proxy: HTTP proxy settings.  A map with the keys
+        `http_proxy` and `https_proxy` and the URL of the respective
+        proxy to use as values.
+    :type proxy: :class:`dict`
+    :param cacheDir: Path to a directory to be used for caching
+        information about the ICAT server in order to speed up the
+        initialization of the client.  If set, the parsed service
+        definition (WSDL) and the schema information (entity names,
+        entity info, and authenticator info) will be cached in this
+        directory.  The cache is validated against the API version of
+        the server.  If not set, no caching will be done.
+    :type cacheDir: :class:`~pathlib.Path` or :class:`str`
+    :param connectionPool: If set, the HTTP connections to the ICAT
+        and the IDS server are kept open and taken from and returned
+        to this pool, so that they may be reused for later calls.
+        The pool may be shared between clients, in particular it is
+        shared with clones of this client.
+    :type connectionPool: :class:`icat.keepalive.ConnectionPool`
+    :param compression: If :const:`True`, ask the ICAT and the IDS
+        server to send compressed responses, see
+        :mod:`icat.compression`.  This saves network bandwidth for
+        large search results at the cost of some CPU time on both
+        sides.
+    :type compression: :class:`bool`
+    :param compressRequests: If set, requests to the ICAT server
+        having a body of at least this size in bytes are sent gzip
+        compressed.  This is mostly useful for
+        :meth:`~icat.client.Client.createMany` calls with many
+        objects.  Note that the ICAT server must be configured to
+        accept compressed requests.
+    :type compressRequests: :class:`int`
+    :param lazyTypemap: If :const:`True`, the entity classes in the
+        :attr:`typemap` are only created on demand, when they are
+        needed for the first time.  This saves the queries for the
+        entity info of those entity types that are not used.
+    :type lazyTypemap: :class:`bool`
+    :param fastDecode: If :const:`True`, decode the responses to
+        :meth:`search` calls using the faster decoder from
+        :mod:`icat.decoder`, rather than the generic one from Suds.
+        The decoder falls back to Suds for any response it does not
+        handle.
+    :type fastDecode: :class:`bool`
+    :param threadSafe: If :const:`True`, set up the client so that
+        API calls may be issued concurrently from several threads,
+        e.g. from the workers of a
+        :class:`~concurrent.futures.ThreadPoolExecutor`.  Each thread
+        uses its own transport to send the requests.  The session,
+        the typemap and the entity info cache are shared between all
+        threads.  See :ref:`client-threads` for the details.
+    :type threadSafe: :class:`bool`
+    :param kwargs: additional keyword arguments that will be passed to
+        :class:`suds.client.Client`, see :class:`suds.options.Options`
+        for details.
+
+    .. versionchanged:: 1.8.0
+        add the `cacheDir`, `connectionPool`, `compression`,
+        `compressRequests`, `lazyTypemap`, `fastDecode`, and
+        `threadSafe` arguments.
+    """
+
+    Register = weakref.WeakValueDictionary()
+    """The register of all active clients.
+
+    .. versionchanged:: 1.1.0
+        changed type to :class:`weakref.WeakValueDictionary`.
+    """
+
+    AutoRefreshRemain = 30
+    """Number of minutes to leave in the session before automatic refresh
+    should be called.
+    """
+
+    @classmethod
+    def cleanupall(cls):
+        """Cleanup all class instances.
+
+        Call :meth:`~icat.client.Client.cleanup` on all registered
+        class instances, e.g. on all clients that have not yet been
+        cleaned up.
+        """
+        for r in list(cls.Register.valuerefs()):
+            c = r()
+            if c:
+                c.cleanup()
+
+    def _schedule_auto_refresh(self, t=None):
+        now = time.time()
+        if t == "never":
+            # Schedule it very far in the future.  This is just to
+            # make sure that self._next_refresh has a formally valid
+            # value.
+            year = 365.25 * (24 * 60 * 60)
+            self._next_refresh = now + year
+        elif t:
+            self._next_refresh = t
+        else:
+            wait = max(self.getRemainingMinutes() - self.AutoRefreshRemain, 0)
+            self._next_refresh = now + 60*wait
+
+    def __init__(self, url, idsurl=None,
+                 checkCert=True, caFile=None, caPath=None, sslContext=None,
+                 proxy=None, cacheDir=None, connectionPool=None,
+                 compression=False, compressRequests=None,
+                 lazyTypemap=False, fastDecode=False, threadSafe=False,
+                 **kwargs):
+
+        """Initialize the client.
+
+        Extend the inherited constructor.  Query the API version from
+        the ICAT server and initialize the typemap accordingly.
+        """
+
+        self.url = _complete_url(url)
+        self.kwargs = dict(kwargs)
+        self.kwargs['idsurl'] = idsurl
+        self.kwargs['checkCert'] = checkCert
+        self.kwargs['caFile'] = caFile
+        self.kwargs['caPath'] = caPath
+        self.kwargs['sslContext'] = sslContext
+        self.kwargs['proxy'] = proxy
+        self.kwargs['cacheDir'] = cacheDir
+        self.kwargs['connectionPool'] = connectionPool
+        self.kwargs['compression'] = compression
+        self.kwargs['compressRequests'] = compressRequests
+        self.kwargs['lazyTypemap'] = lazyTypemap
+        self.kwargs['fastDecode'] = fastDecode
+        self.kwargs['threadSafe'] = threadSafe
+        idsurl = _complete_url(idsurl, default_path="/ids")
+
+        self.apiversion = None
+        self.entityInfoCache = {}
+        self.schemaCache = None
+        self.requestMarshaller = RequestMarshaller(self)
+        self.schemaIndex = SchemaIndex(self)
+        self.searchDecoder = SearchDecoder(self)
+        self.typemap = None
+        self.ids = None
+        self.sessionId = None
+        self.autoLogout = True
+        self._refreshLock = threading.Lock()
+        self._schedule_auto_refresh("never")
+
+        if sslContext:
+            self.sslContext = sslContext
+        else:
+            self.sslContext = create_ssl_context(checkCert, caFile, caPath)
+
+        if not proxy:
+            proxy = {}
+        if threadSafe:
+            factory = functools.partial(HTTPSTransport, self.sslContext,
+                                        pool=connectionPool,
+                                        compression=compression,
+                                        compressRequests=compressRequests)
+            kwargs['transport'] = ThreadLocalTransport(factory, proxy=proxy)
+        else:
+            kwargs['transport'] = HTTPSTransport(self.sslContext,
+                                                 pool=connectionPool,
+                                                 compression=compression,
+                                                 compressRequests=compressRequests,
+                                                 proxy=proxy)
+        wsdlCache = None
+        if cacheDir and 'cache' not in kwargs:
+            wsdlCache = WSDLCache(cacheDir)
+            kwargs['cache'] = wsdlCache
+            kwargs['cachingpolicy'] = 1
+        super().__init__(self.url, **kwargs)
+        _threadsafe_bindings(self.wsdl)
+        self.apiversion = Version(self.getApiVersion())
+        if wsdlCache and not wsdlCache.check_version(self.apiversion):
+            # The service definition has been taken from a stale
+            # cache entry.  Need to read it again from the server.
+            super().__init__(self.url, **kwargs)
+            _threadsafe_bindings(self.wsdl)
+            self.apiversion = Version(self.getApiVersion())
+            wsdlCache.check_version(self.apiversion)
+        if threadSafe:
+            self.messages = _ThreadLocalMessages()
+        log.debug("Connect to %s, ICAT version %s", url, self.apiversion)
+
+        if self.apiversion < '4.3.0':
+            warn(ClientVersionWarning(self.apiversion, "too old"))
+        if cacheDir:
+            self.schemaCache = SchemaCache(cacheDir, self.url)
+            if self.schemaCache.load(self.apiversion):
+                self.entityInfoCache.update(self.schemaCache.entityInfo)
+        self.typemap = getTypeMap(self, lazy=lazyTypemap)
+        if self.schemaCache and self.schemaCache.entityNames is None:
+            self.schemaCache.save(self)
+
+        if idsurl:
+            self.add_ids(idsurl)
+        self.Register[id(self)] = self
+
+    def __del__(self):
+        """Call :meth:`~icat.client.Client.cleanup`."""
+        self.cleanup()
+
+    def cleanup(self):
+        """Release resources allocated by the client.
+
+        Logout from the active ICAT session (if :attr:`autoLogout` is
+        :const:`True`).  The client should not be used any more after
+        calling this method.
+        """
+        if self.autoLogout:
+            self.logout()
+        if id(self) in self.Register:
+            del self.Register[id(self)]
+
+    def add_ids(self, url, proxy=None):
+        """Add the URL to an ICAT Data Service."""
+        if proxy is None:
+            proxy = self.options.proxy
+        idsargs = {}
+        if self.sessionId:
+            idsargs['sessionId'] = self.sessionId
+        idsargs['sslContext'] = self.sslContext
+        if self.kwargs.get('connectionPool') is not None:
+            idsargs['connectionPool'] = self.kwargs['connectionPool']
+        if self.kwargs.get('compression'):
+            idsargs['compression'] = True
+        if proxy:
+            idsargs['proxy'] = proxy
+        self.ids = IDSClient(url, **idsargs)
+
+    def __setattr__(self, attr, value):
+        super().__setattr__(attr, value)
+        if attr == 'sessionId' and self.ids:
+            self.ids.sessionId = self.sessionId
+
+    def clone(self):
+        """Create a clone.
+
+        Return a clone of the :class:`Client` object.  That is, a
+        client that connects to the same ICAT server and has been
+        created with the same kwargs.  The clone will be in the state
+        as returned from the constructor.  In particular, it does not
+        share the same session if this client object is logged in.
+
+        :return: a clone of the client object.
+        :rtype: :class:`Client`
+        """
+        Class = type(self)
+        return Class(self.url, **self.kwargs)
+
+
+    def _has_wsdl_type(self, name):
+        """Check if this client's WSDL defines a particular type name.
+        """
+        with disable_logger("suds.resolver"):
+            return self.factory.resolver.find(name)
+
+    def new(self, obj, **kwargs):
+
+        """Instantiate a new :class:`icat.entity.Entity` object.
+
+        If obj is a Suds instance object or a string, lookup the
+        corresponding entity class in the :attr:`typemap`.  If obj is
+        a string, this lookup is case insensitive and a new entity
+        object is instantiated.  If obj is a Suds instance object, an
+        entity object corresponding to this instance object is
+        instantiated.  If obj is :const:`None`, do nothing and return
+        :const:`None`.
+        
+        :param obj: either a Suds instance object, a name of an
+            instance type, or :const:`None`.
+        :type obj: :class:`suds.sudsobject.Object` or :class:`str`
+        :param kwargs: attributes passed to the constructor of
+            :class:`icat.entity.Entity`.
+        :return: the new entity object or :const:`None`.
+        :rtype: :class:`icat.entity.Entity`
+        :raise EntityTypeError: if obj is neither a valid instance
+            object, nor a valid name of an entity type, nor None.
+
+        .. versionchanged:: 1.0.0
+            if the `obj` argument is a string, it is taken case
+            insensitive.
+        """
+
+        if isinstance(obj, suds.sudsobject.Object):
+            # obj is already an instance, use it right away
+            instance = obj
+            instancetype = instance.__class__.__name__
+            try:
+                Class = self.typemap[instancetype]
+            except KeyError:
+                raise EntityTypeError("Invalid instance type '%s'." 
+                                      % instancetype)
+        elif isinstance(obj, str):
+            # obj is the name of an instance type, create the instance
+            try:
+                Class = self.typemap[obj.lower()]
+            except KeyError:
+                raise EntityTypeError("Invalid instance type '%s'." 
+                                      % obj)
+            instancetype = Class.getInstanceName()
+            instance = self.factory.create(instancetype)
+            # The factory creates a whole tree of dummy objects for
+            # all relationships of the instance object and the
+            # relationships of the related objects and so on.  These
+            # dummy objects are of no use, discard them.
+            for r in (Class.InstRel | Class.InstMRel):
+                delattr(instance, r)
+        elif obj is None:
+            return None
+        else:
+            raise EntityTypeError("Invalid argument type '%s'." % type(obj))
+
+        if Class is None:
+            raise EntityTypeError("Instance type '%s' is not supported." 
+                                  % instancetype)
+        if Class.BeanName is None:
+            raise EntityTypeError("Refuse to create an instance of "
+                                  "abstract type '%s'." % instancetype)
+
+        return Class(self, instance, **kwargs)
+
+    def getEntityClass(self, name):
+        """Return the Entity class corresponding to a BeanName.
+        """
+        return self.schemaIndex.getEntityClass(name)
+
+    def getEntity(self, obj):
+        """Get the corresponding :class:`icat.entity.Entity` for an object.
+
+        if obj is a `fieldSet`, return a tuple of the fields.  If obj
+        is any other Suds instance object, create a new entity object
+        with :meth:`~icat.client.Client.new`.  Otherwise do nothing
+        and return obj unchanged.
+        
+        :param obj: either a Suds instance object or anything.
+        :type obj: :class:`suds.sudsobject.Object` or any type
+        :return: the new entity object or obj.
+        :rtype: :class:`tuple` or :class:`icat.entity.Entity` or any type
+
+        .. versionchanged:: 0.18.0
+            add support of `fieldSet`.
+
+        .. versionchanged:: 0.18.1
+            changed the return type from :class:`list` to
+            :class:`tuple` in the case of `fieldSet`.
+        """
+        if obj.__class__.__name__ == 'fieldSet':
+            return tuple(obj.fields)
+        elif isinstance(obj, suds.sudsobject.Object):
+            return self.new(obj)
+        else:
+            return obj
+
+    # ==================== ICAT API methods ====================
+
+    def login(self, auth, credentials):
+        self.logout()
+        cred = self.factory.create("credentials")
+        for k in credentials:
+            cred.entry.append({ 'key': k, 'value': credentials[k] })
+        try:
+            self.sessionId = self.service.login(auth, cred)
+        except suds.WebFault as e:
+            raise translateError(e)
+        self._schedule_auto_refresh()
+        return self.sessionId
+
+    def logout(self):
+        if self.sessionId:
+            try:
+                try:
+                    self.service.logout(self.sessionId)
+                except suds.WebFault as e:
+                    raise translateError(e)
+                finally:
+                    self.sessionId = None
+            except ICATSessionError:
+                # silently ignore ICATSessionError, e.g. an expired session.
+                pass
+
+    def create(self, bean):
+        if getattr(bean, 'validate', None):
+            bean.validate()
+        try:
+            return self.requestMarshaller.call("create", self.sessionId,
+                                               Entity.getInstance(bean))
+        except suds.WebFault as e:
+            raise translateError(e)
+
+    def createMany(self, beans):
+        for b in beans:
+            if getattr(b, 'validate', None):
+                b.validate()
+        try:
+            return self.requestMarshaller.call("createMany", self.sessionId,
+                                               Entity.getInstances(beans))
+        except suds.WebFault as e:
+            raise translateError(e)
+
+    def delete(self, bean):
+        try:
+            self.service.delete(self.sessionId, Entity.getInstance(bean))
+        except suds.WebFault as e:
+            raise translateError(e)
+
+    def deleteMany(self, beans):
+        try:
+            self.service.deleteMany(self.sessionId, Entity.getInstances(beans))
+        except suds.WebFault as e:
+            raise translateError(e)
+
+    def get(self, query, primaryKey):
+        try:
+            instance = self.requestMarshaller.call("get", self.sessionId,
+                                                   str(query), primaryKey)
+            return self.getEntity(instance)
+        except suds.WebFault as e:
+            raise translateError(e)
+
+    def getApiVersion(self):
+        try:
+            return self.service.getApiVersion()
+        except suds.WebFault as e:
+            raise translateError(e)
+
+    def getAuthenticatorInfo(self):
+        if self.schemaCache and self.schemaCache.authenticatorInfo:
+            return self.schemaCache.authenticatorInfo
+        try:
+            return self.service.getAuthenticatorInfo()
+        except suds.WebFault as e:
+            raise translateError(e)
+        except suds.MethodNotFound as e:
+            if self.apiversion < '4.9.0':
+                raise VersionMethodError("getAuthenticatorInfo", 
+                                         self.apiversion)
+            else:
+                raise
+
+    def getEntityInfo(self, beanName):
+        if self.entityInfoCache and beanName in self.entityInfoCache:
+            return self.entityInfoCache[beanName]
+        try:
+            info = self.service.getEntityInfo(beanName)
+        except suds.WebFault as e:
+            raise translateError(e)
+        if isinstance(self.entityInfoCache, dict):
+            self.entityInfoCache[beanName] = info
+        return info
+
+    def getEntityNames(self):
+        if self.schemaCache and self.schemaCache.entityNames is not None:
+            return list(self.schemaCache.entityNames)
+        try:
+            return self.service.getEntityNames()
+        except suds.WebFault as e:
+            raise translateError(e)
+
+    def getProperties(self):
+        try:
+            return self.service.getProperties(self.sessionId)
+        except suds.WebFault as e:
+            raise translateError(e)
+
+    def getRemainingMinutes(self):
+        try:
+            return self.service.getRemainingMinutes(self.sessionId)
+        except suds.WebFault as e:
+            raise translateError(e)
+
+    def getUserName(self):
+        try:
+            return self.service.getUserName(self.sessionId)
+        except suds.WebFault as e:
+            raise translateError(e)
+
+    def getVersion(self):
+        try:
+            return self.service.getVersion()
+        except suds.WebFault as e:
+            raise translateError(e)
+        except suds.MethodNotFound as e:
+            return self.getApiVersion()
+
+    def isAccessAllowed(self, bean, accessType):
+        try:
+            return self.service.isAccessAllowed(self.sessionId, Entity.getInstance(bean), accessType)
+        except suds.WebFault as e:
+            raise translateError(e)
+
+    def refresh(self):
+        try:
+            self.service.refresh(self.sessionId)
+        except suds.WebFault as e:
+            raise translateError(e)
+
+    def search(self, query):
+        try:
+            if self.kwargs['fastDecode']:
+                return self.searchDecoder.search(self.sessionId, str(query))
+            instances = self.requestMarshaller.call("search", self.sessionId,
+                                                    str(query))
+            return [self.getEntity(i) for i in instances]
+        except suds.WebFault as e:
+            raise translateError(e)
+
+    def update(self, bean):
+        try:
+            self.service.update(self.sessionId, Entity.getInstance(bean))
+        except suds.WebFault as e:
+            raise translateError(e)
+
+
+    # =================== custom API methods ===================
+
+    def autoRefresh(self):
+        """Call :meth:`~icat.client.Client.refresh` only if needed.
+
+        Call :meth:`~icat.client.Client.refresh` if less then
+        :attr:`AutoRefreshRemain` minutes remain in the current
+        session.  Do not make any client calls if not.  This method is
+        supposed to be very cheap if enough time remains in the
+        session so that it may be called often in a loop without
+        causing too much needless load.
+        """
+        if time.time() > self._next_refresh:
+            # Make sure that concurrent calls from several threads
+            # only refresh once.
+            with self._refreshLock:
+                if time.time() > self._next_refresh:
+                    self.refresh()
+                    self._schedule_auto_refresh()
+
+    def assertedSearch(self, query, assertmin=1, assertmax=1):
+        """Search with an assertion on the result.
+
+        Perform a search and verify that the number of items found
+        lies within the bounds of `assertmin` and `assertmax`.  Raise
+        an error if this assertion fails.
+
+        :param query: the search query.
+        :type query: :class:`icat.query.Query` or :class:`str`
+        :param assertmin: minimum number of expected results.
+        :type assertmin: :class:`int`
+        :param assertmax: maximum number of expected results.  A value
+            of :const:`None` is treated as infinity.
+        :type assertmax: :class:`int`
+        :return: search result.
+        :rtype: :class:`list`
+        :raise ValueError: in case of inconsistent arguments.
+        :raise SearchAssertionError: if the assertion on the number of
+            results fails.
+        :raise ICATError: in case of exceptions raised by the ICAT
+            server.
+
+        """
+        if assertmax is not None and assertmin > assertmax:
+            raise ValueError("Minimum (%d) is larger then maximum (%d)."
+                             % (assertmin, assertmax))
+        result = self.search(query)
+        num = len(result)
+        if num >= assertmin and (assertmax is None or num <= assertmax):
+            return result
+        else:
+            raise SearchAssertionError(query, assertmin, assertmax, num)
+
+    def _searchChunks(self, chunked):
+        """Do the search calls for :meth:`searchChunked`, yielding the
+        result of each call.
+        """
+        while True:
+            query = chunked.nextQuery()
+            if query is None:
+                break
+            items = self.search(query)
+            chunked.addResult(items)
+            yield items
+
+    def searchChunked(self, query, skip=0, count=None, chunksize=100,
+                      prefetch=0, keyset=False):
+        """Search the ICAT server.
+
+        Call the ICAT :meth:`~icat.client.Client.search` API method,
+        limiting the number of results in each call and repeat the
+        call as often as needed to retrieve all the results.
+
+        This can be used as a drop in replacement for the search API
+        method most of the times.  It avoids the error if the number
+        of items in the result exceeds the limit imposed by the ICAT
+        server.  There are a few subtle differences though: the query
+        must not contain a LIMIT clause (use the skip and count
+        arguments instead) and should contain an ORDER BY clause.  The
+        return value is a generator yielding successively the items in
+        the search result rather than a list.  The individual search
+        calls are done lazily, e.g. they are not done until needed to
+        yield the next item from the generator.
+
+        .. note::
+            The result may be defective (omissions, duplicates) if the
+            content in the ICAT server changes between individual
+            search calls in a way that would affect the result.  It is
+            a common mistake when looping over items returned from
+            this method to have code with side effects on the search
+            result in the body of the loop.  Example:
+
+            .. code-block:: python
+
+                # Mark all datasets as complete
+                # This will *not* work as expected!
+                query = Query(client, "Dataset", conditions={
+                    "complete": "= False"
+                }, includes="1", order=["id"])
+                for ds in client.searchChunked(query):
+                    ds.complete = True
+                    ds.update()
+
+            This should rather be formulated as:
+
+            .. code-block:: python
+
+                # Mark all datasets as complete
+                # This version works!
+                query = Query(client, "Dataset", includes="1", order=["id"])
+                for ds in client.searchChunked(query):
+                    if ds.complete:
+                        continue
+                    ds.complete = True
+                    ds.update()
+
+            Alternatively, use keyset pagination, see below.
+
+        If `keyset` is :const:`True`, the chunks are not selected by
+        an offset in the LIMIT clause, but by the condition that the
+        id of the objects is larger than the id of the last object in
+        the previous chunk.  The result is ordered by id in this case,
+        any ORDER BY clause in the query is replaced.  The query must
+        return objects, e.g. it must be of the form ``SELECT o FROM
+        Entity o ...``.  The effort on the server side for each
+        search call does not grow with the offset then.  This is
+        significantly more efficient for large results.  Furthermore,
+        the result is not defective if objects are created or
+        deleted while iterating over it: each object that exists
+        during the whole iteration is yielded exactly once.
+
+        :param query: the search query.
+        :type query: :class:`icat.query.Query` or :class:`str`
+        :param skip: offset from within the full list of available results.
+        :type skip: :class:`int`
+        :param count: maximum number of items to return.  A value of
+            :const:`None` means no limit.
+        :type count: :class:`int`
+        :param chunksize: number of items to query in each search
+            call.  This is an internal tuning parameter and does not
+            affect the result.
+        :type chunksize: :class:`int`
+        :param prefetch: if greater than zero, do the search calls in
+            a background thread, fetching up to this number of chunks
+            ahead of the items being yielded.  This allows the
+            processing of the items to overlap with the retrieval of
+            the next chunks.  The background thread is stopped if the
+            generator is closed.  Note that the search calls are then
+            done concurrently to any calls done by the caller while
+            processing the items, consider to create the client with
+            the `threadSafe` argument set in this case.
+        :type prefetch: :class:`int`
+        :param keyset: flag whether to use keyset pagination.
+        :type keyset: :class:`bool`
+        :return: a generator that successively yields the items in the
+            search result.
+        :rtype: generator
+        :raise ValueError: if `keyset` is :const:`True` and the query
+            does not return objects or contains a LIMIT clause.
+
+        .. versionchanged:: 1.8.0
+            add the `prefetch` and `keyset` arguments.
+        """
+        chunked = _ChunkedSearch(query, skip, count, chunksize, keyset)
+        chunks = self._searchChunks(chunked)
+        if prefetch > 0:
+            chunks = _prefetch([chunks], prefetch)
+        for items in chunks:
+            yield from items
+
+    def _idRanges(self, query, partitions):
+        """Split the range of ids of the objects matching query.
+        """
+        q = query.copy()
+        q.setOrder(None)
+        q.includes = set()
+        q.setAttributes("id")
+        bounds = []
+        for function in ("MIN", "MAX"):
+            q.setAggregate(function)
+            res = self.search(q)
+            if not res or res[0] is None:
+                return []
+            bounds.append(int(res[0]))
+        low, high = bounds
+        width = high - low + 1
+        n = max(min(partitions, width), 1)
+        edges = [ low + width * i // n for i in range(n + 1) ]
+        return [ (edges[i], edges[i+1] - 1) for i in range(n) ]
+
+    def searchPartitioned(self, query, partitions=4, ordered=False,
+                          chunksize=100, prefetch=1):
+        """Search the ICAT server, scanning ranges of ids concurrently.
+
+        Determine the minimum and the maximum id of the objects
+        matching the query, split this range into partitions and
+        search each partition with
+        :meth:`~icat.client.Client.searchChunked` in a separate
+        background thread.  This is intended for scanning large parts
+        of the content of an ICAT server, where the search calls
+        should rather be done in parallel.
+
+        The search calls are done concurrently to each other and to
+        any calls done by the caller while processing the items.
+        Consider to create the client with the `threadSafe` argument
+        set.
+
+        :param query: the search query.  It must not have a LIMIT
+            clause.
+        :type query: :class:`icat.query.Query`
+        :param partitions: number of partitions to split the range of
+            ids into.  This is also the number of background threads.
+        :type partitions: :class:`int`
+        :param ordered: if :const:`True`, merge the results from the
+            partitions so that the order defined by the ORDER BY
+            clause of the query is preserved.  This is only supported
+            for queries returning objects, and if the ORDER BY clause
+            consists of plain attributes, without JPQL functions.
+            Note that the order of the merged result follows the
+            comparison of the attribute values in Python, which might
+            differ from the order in the database, in particular for
+            null values and string collation.  Attributes of related
+            objects in the ORDER BY clause must be included in the
+            query.  If `ordered` is :const:`False`, the items from the
+            partitions are yielded in the order in which they arrive.
+        :type ordered: :class:`bool`
+        :param chunksize: number of items to query in each search
+            call.
+        :type chunksize: :class:`int`
+        :param prefetch: number of chunks to fetch ahead in each
+            partition.
+        :type prefetch: :class:`int`
+        :return: a generator that yields the items in the search
+            result.
+        :rtype: generator
+        :raise TypeError: if `query` is not a
+            :class:`~icat.query.Query`.
+        :raise ValueError: if the query has a LIMIT clause or if
+            `ordered` is :const:`True` and the result cannot be
+            merged.
+
+        .. versionadded:: 1.8.0
+        """
+        if not isinstance(query, Query):
+            raise TypeError("query must be a Query object")
+        if query.limit:
+            raise ValueError("the query must not have a limit")
+        returnsObjects = (not query.attributes and
+                          query.aggregate in (None, "DISTINCT"))
+        if ordered:
+            if not returnsObjects:
+                raise ValueError("Cannot merge results of a query "
+                                 "not returning objects")
+            key = _orderKey(query)
+        chunks = []
+        for low, high in self._idRanges(query, partitions):
+            q = query.copy()
+            q.addConditions({"id": [">= %d" % low, "<= %d" % high]})
+            # Keyset pagination is faster, but only possible if we
+            # don't need to keep the order of the query.
+            chunked = _ChunkedSearch(q, chunksize=chunksize,
+                                     keyset=(returnsObjects and not ordered))
+            chunks.append(self._searchChunks(chunked))
+        prefetch = max(prefetch, 1)
+        if ordered:
+            streams = [ _prefetch([c], prefetch) for c in chunks ]
+            try:
+                decorated = [ _decorate(s, key, i)
+                              for i, s in enumerate(streams) ]
+                for k, obj in heapq.merge(*decorated):
+                    yield obj
+            finally:
+                for s in streams:
+                    s.close()
+        else:
+            for items in _prefetch(chunks, prefetch):
+                yield from items
+
+    def searchStream(self, query):
+        """Search the ICAT server, yielding the result while it arrives.
+
+        Call the ICAT :meth:`~icat.client.Client.search` API method,
+        but parse the response incrementally while it is still being
+        received from the server.  The items in the search result are
+        yielded as soon as they are complete, so that processing may
+        start before the full response has arrived.  Only one item at
+        a time needs to be kept in memory, unless the caller keeps
+        references to them.
+
+        The response is always parsed with the decoder from
+        :mod:`icat.decoder`, regardless of the `fastDecode` argument
+        to the client.  Note that unlike
+        :meth:`~icat.client.Client.searchChunked`, this does a single
+        search call, so the number of items in the result is still
+        subject to the limit imposed by the ICAT server.
+
+        :param query: the search query.
+        :type query: :class:`icat.query.Query` or :class:`str`
+        :return: a generator that successively yields the items in the
+            search result.
+        :rtype: generator
+        :raise ICATError: in case of exceptions raised by the ICAT
+            server.
+
+        .. versionadded:: 1.8.0
+        """
+        try:
+            yield from self.searchDecoder.iterSearch(self.sessionId,
+                                                     str(query))
+        except suds.WebFault as e:
+            raise translateError(e)
+
+    def searchUniqueKey(self, key, objindex=None):
+        """Search the object that belongs to a unique key.
+
+        This is in a sense the inverse method to
+        :meth:`icat.entity.Entity.getUniqueKey`, the key must
+        previously have been generated by it.  This method searches
+        the entity object that the key has been generated for from the
+        server.
+
+        if objindex is not :const:`None`, it is used as a cache of
+        previously retrieved objects.  It must be a dict that maps
+        keys to entity objects.  The object retrieved by this method
+        call will be added to this index.
+
+        :param key: the unique key of the object to search for.
+        :type key: :class:`str`
+        :param objindex: cache of entity objects.
+        :type objindex: :class:`dict`
+        :return: the object corresponding to the key.
+        :rtype: :class:`icat.entity.Entity`
+        :raise SearchResultError: if the object has not been found.
+        :raise ValueError: if the key is not well formed.
+        """
+
+        if objindex is not None and key in objindex:
+            return objindex[key]
+        us = key.index('_')
+        beanname = key[:us]
+        av = parse_attr_val(key[us+1:])
+        info = self.getEntityInfo(beanname)
+        query = Query(self, beanname)
+        for f in info.fields:
+            if f.name in av.keys():
+                attr = f.name
+                if f.relType == "ATTRIBUTE":
+                    cond = "= '%s'" % simpleqp_unquote(av[attr])
+                    query.addConditions({attr:cond})
+                elif f.relType == "ONE":
+                    rk = str("%s_%s" % (f.type, av[attr]))
+                    ro = self.searchUniqueKey(rk, objindex)
+                    query.addConditions({"%s.id" % attr:"= %d" % ro.id})
+                else:
+                    raise ValueError("malformed '%s': invalid attribute '%s'" 
+                                     % (key, attr))
+        obj = self.assertedSearch(query)[0]
+        if objindex is not None:
+            objindex[key] = obj
+        return obj
+
+    def searchMatching(self, obj, includes=None):
+        """Search the matching object.
+
+        Search the object from the ICAT server that matches the given
+        object in the uniqueness constraint.
+
+        >>> dataset = client.new("Dataset", investigation=inv, name=dsname)
+        >>> dataset = client.searchMatching(dataset)
+        >>> dataset.id
+        172383
+
+        :param obj: an entity object having the attrinutes for the
+            uniqueness constraint set accordingly.
+        :type obj: :class:`icat.entity.Entity`
+        :param includes: list of related objects to add to the INCLUDE
+            clause of the search query.
+            See :meth:`icat.query.Query.addIncludes` for details.
+        :type includes: iterable of :class:`str`
+        :return: the corresponding object.
+        :rtype: :class:`icat.entity.Entity`
+        :raise SearchResultError: if the object has not been found.
+        :raise ValueError: if the object's class does not have a
+            uniqueness constraint or if any attribute needed for the
+            constraint is not set.
+        """
+        if 'id' in obj.Constraint:
+            raise ValueError("%s does not have a uniqueness constraint.")
+        query = Query(self, obj.BeanName, includes=includes)
+        for a in obj.Constraint:
+            v = getattr(obj, a)
+            if v is None:
+                raise ValueError("%s is not set" % a)
+            if a in obj.InstAttr:
+                query.addConditions({a: "= '%s'" % v})
+            elif a in obj.InstRel:
+                if v.id is None:
+                    raise ValueError("%s.id is not set" % a)
+                query.addConditions({"%s.id" % a: "= %d" % v.id})
+            else:
+                raise InternalError("Invalid constraint '%s' in %s."
+                                    % (a, obj.BeanName))
+        return self.assertedSearch(query)[0]
+
+    def createUser(self, name, search=False, **kwargs):
+        """Search a user by name or create a new user.
+
+        If search is :const:`True` search a user by the given name.  If
+        search is :const:`False` or no user is found, create a new user.
+
+        :param name: username.
+        :type name: :class:`str`
+        :param search: flag whether a user should be searched first.
+        :type search: :class:`bool`
+        :param kwargs: attributes of the user passed to `new`.
+        :return: the user.
+        :rtype: :class:`icat.entity.Entity`
+        """
+        if search:
+            users = self.search("User[name='%s']" % name)
+            if len(users): 
+                log.info("User: '%s' already exists", name)
+                return users[0]
+
+        log.info("User: creating '%s'", name)
+        u = self.new("User", name=name, **kwargs)
+        u.create()
+        return u
+
+    def createGroup(self, name, users=()):
+        """Create a group and add users to it.
+
+        :param name: the name of the group.
+        :type name: :class:`str`
+        :param users: a list of users.
+        :type users: :class:`list` of :class:`icat.entity.Entity`
+        :return: the group.
+        :rtype: :class:`icat.entity.Entity`
+        """
+        log.info("Group: creating '%s'", name)
+        g = self.new("Grouping", name=name)
+        g.create()
+        g.addUsers(users)
+        return g
+
+    def createRules(self, crudFlags, what, group=None):
+        """Create access rules.
+
+        :param crudFlags: access mode.
+        :type crudFlags: :class:`str`
+        :param what: list of items subject to the rule.  The items
+            must be either ICAT search expression strings or
+            :class:`icat.query.Query` objects.
+        :type what: :class:`list`
+        :param group: the group that should be granted access or
+            :const:`None` for everybody.
+        :type group: :class:`icat.entity.Entity`
+        :return: list of the ids of the created rules.
+        :rtype: :class:`list` of :class:`int`
+        """
+        if group:
+            log.info("Rule: adding %s permissions for group '%s'", 
+                     crudFlags, group.name)
+        else:
+            log.info("Rule: adding %s permissions for anybody", crudFlags)
+
+        rules = []
+        for w in what:
+            r = self.new("Rule",
+                         crudFlags=crudFlags, what=str(w), grouping=group)
+            rules.append(r)
+        return self.createMany(rules)
+
+
+    # =================== custom IDS methods ===================
+
+    def putData(self, infile, datafile):
+        """Upload a datafile to IDS.
+
+        The content of the file to upload is read from `infile`,
+        either directly if it is an open file, or a file by that name
+        will be opened for reading.
+
+        The `datafile` object must be initialized but not yet created
+        at the ICAT server.  It will be created by the IDS.  The ids
+        of the Dataset and the DatafileFormat as well as the
+        attributes description, doi, datafileCreateTime, and
+        datafileModTime will be taken from `datafile`.  If
+        datafileModTime is not set, the method will try to
+        :func:`os.fstat` `infile` and use the last modification time
+        from the file system, if available.  If datafileCreateTime is
+        not set, it will be set to datafileModTime.
+
+        Note that only the attributes datafileFormat, dataset,
+        description, doi, datafileCreateTime, and datafileModTime of
+        `datafile` will be taken into account as described above.  All
+        other attributes are ignored and the Datafile object created
+        in the ICAT server might end up with different values for
+        those other attribues.
+
+        :param infile: either a file opened for reading or a file name.
+        :type infile: :class:`file` or :class:`~pathlib.Path` or :class:`str`
+        :param datafile: A Datafile object.
+        :type datafile: :class:`icat.entity.Entity`
+        :return: The Datafile object created by IDS.
+        :rtype: :class:`icat.entity.Entity`
+
+        .. versionchanged:: 1.0.0
+            the `infile` parameter also accepts a
+            :class:`~pathlib.Path` object.
+        """
+
+        if not self.ids:
+            raise RuntimeError("no IDS.")
+        if not datafile.name:
+            raise ValueError("datafile.name is not set.")
+        if not datafile.dataset or not datafile.dataset.id:
+            raise ValueError("datafile.dataset is not set.")
+        if not datafile.datafileFormat or not datafile.datafileFormat.id:
+            raise ValueError("datafile.datafileFormat is not set.")
+
+        if not hasattr(infile, 'read'):
+            # We got a file name as infile.  Open the file and
+            # recursively call the method again with the open file
+            # as argument.  This is the easiest way to guarantee
+            # that the file will finally get closed also in case
+            # of errors.
+            try:
+                infile = Path(infile)
+            except TypeError:
+                raise TypeError("invalid infile type '%s': "
+                                "must either be a file or a file name." % 
+                                type(infile)) from None
+            else:
+                with infile.open('rb') as f:
+                    return self.putData(f, datafile)
+
+        modTime = ms_timestamp(datafile.datafileModTime)
+        if not modTime:
+            try:
+                # Try our best to get the mtime from the fileno, but
+                # don't bother if this doesn't work, e.g. if it cannot
+                # be fstated.  Note that fstat() yields seconds since
+                # epoch as float, while IDS expects milliseconds since
+                # epoch as int.
+                modTime = int(1000*os.fstat(infile.fileno()).st_mtime)
+            except:
+                pass
+        createTime = ms_timestamp(datafile.datafileCreateTime)
+        if not createTime:
+            createTime = modTime
+
+        dfid = self.ids.put(infile, datafile.name, 
+                            datafile.dataset.id, datafile.datafileFormat.id, 
+                            datafile.description, datafile.doi, 
+                            createTime, modTime)
+        return self.get(datafile.BeanName, dfid)
+
+    def getData(self, objs, compressFlag=False, zipFlag=False, outname=None, 
+                offset=0):
+        """Retrieve the requested data from IDS.
+
+        The data objects to retrieve are given in objs.  This can be
+        any combination of single Datafiles, Datasets, or complete
+        Investigations.
+
+        :param objs: either a dict having some of the keys
+            `investigationIds`, `datasetIds`, and `datafileIds` with a
+            list of object ids as value respectively, or a list of
+            entity objects, or a data selection, or an id returned by
+            :meth:`~icat.client.Client.prepareData`.
+        :type objs: :class:`dict`, :class:`list` of
+            :class:`icat.entity.Entity`,
+            :class:`icat.ids.DataSelection`, or :class:`str`
+        :param compressFlag: flag whether to use a zip format with an
+            implementation defined compression level, otherwise use no
+            (or minimal) compression.
+        :type compressFlag: :class:`bool`
+        :param zipFlag: flag whether return a single datafile in zip
+            format.  For multiple files zip format is always used.
+        :type zipFlag: :class:`bool`
+        :param outname: the preferred name for the downloaded file to
+            specify in the Content-Disposition header.
+        :type outname: :class:`str`
+        :param offset: if larger then zero, add Range header to the
+            HTTP request with the indicated bytes offset.
+        :type offset: :class:`int`
+        :return: a file-like object as returned by
+            :meth:`urllib.request.OpenerDirector.open`.
+
+        .. versionchanged:: 0.17.0
+            accept a prepared id in `objs`.
+        """
+        if not self.ids:
+            raise RuntimeError("no IDS.")
+        if not isinstance(objs, (DataSelection, str)):
+            objs = DataSelection(objs)
+        return self.ids.getData(objs, compressFlag, zipFlag, outname, offset)
+
+    def getDataUrl(self, objs, compressFlag=False, zipFlag=False, outname=None):
+        """Get the URL to retrieve the requested data from IDS.
+
+        The data objects to retrieve are given in objs.  This can be
+        any combination of single Datafiles, Datasets, or complete
+        Investigations.
+
+        Note that the URL contains the session id of the current ICAT
+        session.  It will become invalid if the client logs out.
+
+        :param objs: either a dict having some of the keys
+            `investigationIds`, `datasetIds`, and `datafileIds`
+            with a list of object ids as value respectively, or a list
+            of entity objects, or a data selection, or an id returned by
+            :meth:`~icat.client.Client.prepareData`.
+        :type objs: :class:`dict`, :class:`list` of
+            :class:`icat.entity.Entity`,
+            :class:`icat.ids.DataSelection`, or :class:`str`
+        :param compressFlag: flag whether to use a zip format with an
+            implementation defined compression level, otherwise use no
+            (or minimal) compression.
+        :type compressFlag: :class:`bool`
+        :param zipFlag: flag whether return a single datafile in zip
+            format.  For multiple files zip format is always used.
+        :type zipFlag: :class:`bool`
+        :param outname: the preferred name for the downloaded file to
+            specify in the Content-Disposition header.
+        :type outname: :class:`str`
+        :return: the URL for the data at the IDS.
+        :rtype: :class:`str`
+
+        .. versionchanged:: 0.17.0
+            accept a prepared id in `objs`.
+        """
+        if not self.ids:
+            raise RuntimeError("no IDS.")
+        if not isinstance(objs, (DataSelection, str)):
+            objs = DataSelection(objs)
+        return self.ids.getDataUrl(objs, compressFlag, zipFlag, outname)
+
+    def prepareData(self, objs, compressFlag=False, zipFlag=False):
+        """Prepare data at IDS to be retrieved in subsequent calls.
+
+        The data objects to retrieve are given in objs.  This can be
+        any combination of single Datafiles, Datasets, or complete
+        Investigations.
+
+        :param objs: either a dict having some of the keys
+            `investigationIds`, `datasetIds`, and `datafileIds`
+            with a list of object ids as value respectively, or a list
+            of entity objects, or a data selection.
+        :type objs: :class:`dict`, :class:`list` of
+            :class:`icat.entity.Entity`, or
+            :class:`icat.ids.DataSelection`
+        :param compressFlag: flag whether to use a zip format with an
+            implementation defined compression level, otherwise use no
+            (or minimal) compression.
+        :type compressFlag: :class:`bool`
+        :param zipFlag: flag whether return a single datafile in zip
+            format.  For multiple files zip format is always used.
+        :type zipFlag: :class:`bool`
+        :return: `preparedId`, an opaque string which may be used as an
+            argument to :meth:`~icat.client.Client.isDataPrepared` and
+            :meth:`~icat.client.Client.getData` calls.
+        :rtype: :class:`str`
+        """
+        if not self.ids:
+            raise RuntimeError("no IDS.")
+        if not isinstance(objs, DataSelection):
+            objs = DataSelection(objs)
+        return self.ids.prepareData(objs, compressFlag, zipFlag)
+
+    def isDataPrepared(self, preparedId):
+        """Check if prepared data is ready at IDS.
+
+        :param preparedId: the id returned by
+            :meth:`~icat.client.Client.prepareData`.
+        :type preparedId: :class:`str`
+        :return: :const:`True` if the data is ready, otherwise :const:`False`.
+        :rtype: :class:`bool`
+        """
+        if not self.ids:
+            raise RuntimeError("no IDS.")
+        return self.ids.isPrepared(preparedId)
+
+    def deleteData(self, objs):
+        """Delete data from IDS.
+
+        The data objects to delete are given in objs.  This can be
+        any combination of single Datafiles, Datasets, or complete
+        Investigations.
+
+        :param objs: either a dict having some of the keys
+            `investigationIds`, `datasetIds`, and `datafileIds`
+            with a list of object ids as value respectively, or a list
+            of entity objects, or a data selection.
+        :type objs: :class:`dict`, :class:`list` of
+            :class:`icat.entity.Entity`, or
+            :class:`icat.ids.DataSelection`
+        """
+        if not self.ids:
+            raise RuntimeError("no IDS.")
+        if not isinstance(objs, DataSelection):
+            objs = DataSelection(objs)
+        self.ids.delete(objs)
+
+    def restoreData(self, objs):
+        """Request IDS to restore data.
+
+        Check the status of the data, request a restore if needed and
+        wait for the restore to complete.
+
+        :param objs: either a dict having some of the keys
+            `investigationIds`, `datasetIds`, and `datafileIds`
+            with a list of object ids as value respectively, or a list
+            of entity objects, or a data selection.
+        :type objs: :class:`dict`, :class:`list` of
+            :class:`icat.entity.Entity`, or
+            :class:`icat.ids.DataSelection`
+
+        .. versionadded:: 1.6.0
+        """
+        if not self.ids:
+            raise RuntimeError("no IDS.")
+        if not isinstance(objs, DataSelection):
+            objs = DataSelection(objs)
+        while True:
+            self.autoRefresh()
+            status = self.ids.getStatus(objs)
+            if status == "ONLINE":
+                break
+            elif status == "RESTORING":
+                pass
+            elif status == "ARCHIVED":
+                self.ids.restore(objs)
+            else:
+                # Should never happen
+                raise IDSResponseError("unexpected response from "
+                                       "IDS getStatus() call: %s" % status)
+            time.sleep(30)
+
+
+atexit.register(Client.cleanupall)
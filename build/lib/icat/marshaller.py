@@ -0,0 +1,344 @@
+"""Fast marshalling of the requests for the most frequent API calls.
+
+.. note::
+   This module is mostly intended for the internal use in python-icat.
+   Most users will not need to use it directly.
+
+Suds builds the SOAP envelope for each call by walking the WSDL
+binding and resolving each argument against the schema.  For small
+requests such as a search with a short query string, this may take
+more CPU time than the ICAT server needs to answer.  This module
+renders the envelope for a method only once with Suds, using
+placeholders for the arguments, and keeps the result as a template.
+For subsequent calls, the arguments are marshalled directly and
+filled into the template.  The result is the same, byte for byte, as
+Suds would have sent.
+
+The marshaller only handles what python-icat actually sends to the
+ICAT server.  If it encounters anything else, it leaves the call to
+the regular processing in Suds.
+
+.. versionadded:: 1.8.0
+"""
+
+import logging
+import re
+import uuid
+import weakref
+
+import suds
+import suds.client
+from suds.sax.element import Element
+from suds.sax.text import Text
+from suds.sudsobject import Object, Property
+
+__all__ = ['RequestMarshaller']
+
+log = logging.getLogger(__name__)
+
+XSI_NS = "http://www.w3.org/2001/XMLSchema-instance"
+
+
+class _Unsupported(Exception):
+    """The request contains something that the marshaller does not handle.
+    """
+    pass
+
+
+class _Envelope():
+    """A pre-rendered SOAP envelope.
+
+    This stands in for the :class:`suds.sax.document.Document` that
+    :meth:`suds.client._SoapClient.send` expects.
+    """
+
+    def __init__(self, text):
+        self.text = text
+
+    def __str__(self):
+        return self.text
+
+    def root(self):
+        return None
+
+    def plain(self):
+        return self.text
+
+    def str(self):
+        return self.text
+
+
+class _ComplexType():
+    """Information needed to marshal objects of a complex type.
+    """
+
+    def __init__(self, sxtype):
+        self.sxtype = sxtype
+        # The order of the child elements, the same as
+        # suds.mx.literal.Typed.ordering() yields.
+        self.ordering = []
+        for child, ancestry in sxtype.resolve():
+            if child.name is None:
+                continue
+            if child.isattr():
+                self.ordering.append("_%s" % child.name)
+            else:
+                self.ordering.append(child.name)
+        self.orderset = frozenset(self.ordering)
+        self.fields = dict()
+
+    def getField(self, name):
+        try:
+            return self.fields[name]
+        except KeyError:
+            pass
+        if name.startswith('_'):
+            raise _Unsupported("attribute %s" % name)
+        child, ancestry = self.sxtype.get_child(name)
+        if child is None:
+            raise _Unsupported("unknown element %s" % name)
+        if child.any():
+            raise _Unsupported("wildcard element %s" % name)
+        field = _getElementInfo(child, ancestry)
+        self.fields[name] = field
+        return field
+
+
+def _getElementInfo(element, ancestry):
+    """Return a tuple (element, optional flag) for a schema element.
+    """
+    if element.form_qualified:
+        raise _Unsupported("qualified element %s" % element.name)
+    optional = element.optional() or any(a.optional() for a in ancestry)
+    return (element, optional)
+
+
+class RequestMarshaller():
+    """Marshal the requests for API calls using cached templates.
+
+    :param client: the client.
+    :type client: :class:`icat.client.Client`
+    """
+
+    def __init__(self, client):
+        # Only keep a weak reference to the client to avoid a
+        # reference cycle.
+        self._client = weakref.ref(client)
+        self._templates = dict()
+        self._types = dict()
+
+    def _getClient(self):
+        client = self._client()
+        if client is None:
+            raise RuntimeError("The client of this marshaller is gone.")
+        return client
+
+    def _getComplexType(self, sxtype):
+        try:
+            return self._types[sxtype.qname]
+        except KeyError:
+            pass
+        t = _ComplexType(sxtype)
+        self._types[sxtype.qname] = t
+        return t
+
+    def _getTemplate(self, method):
+        """Return the template for a method.
+
+        The template is a tuple (params, pieces, prefixes): params is
+        a list of element info tuples for each parameter, pieces the
+        list of the text segments between the parameters, and
+        prefixes maps namespaces to the prefixes declared in the
+        envelope.
+        """
+        try:
+            template = self._templates[method.name]
+        except KeyError:
+            pass
+        else:
+            if template is None:
+                raise _Unsupported("method %s" % method.name)
+            return template
+        try:
+            template = self._renderTemplate(method)
+        except _Unsupported:
+            self._templates[method.name] = None
+            raise
+        self._templates[method.name] = template
+        return template
+
+    def _renderTemplate(self, method):
+        binding = method.binding.input
+        if not method.soap.input.body.wrapped:
+            raise _Unsupported("unwrapped method %s" % method.name)
+        params = []
+        for name, element, ancestry in binding.param_defs(method):
+            if any(a.choice() for a in ancestry):
+                raise _Unsupported("choice parameter %s" % name)
+            # Parameters are marshalled without ancestry in Suds.
+            params.append(_getElementInfo(element, ()))
+        # Let Suds render the envelope with a unique placeholder for
+        # each argument and cut it into pieces at the placeholders.
+        tokens = [ "@%s@" % uuid.uuid4().hex for p in params ]
+        soapenv = binding.get_message(method, tokens, {})
+        text = soapenv.plain()
+        pieces = []
+        for (element, optional), token in zip(params, tokens):
+            placeholder = "<%s>%s</%s>" % (element.name, token, element.name)
+            head, sep, text = text.partition(placeholder)
+            if not sep or placeholder in text:
+                raise _Unsupported("cannot render %s" % method.name)
+            pieces.append(head)
+        pieces.append(text)
+        root = re.match(r'<\?xml[^>]*\?>\s*<[^>]*>', pieces[0])
+        if not root:
+            raise _Unsupported("cannot render %s" % method.name)
+        prefixes = { ns: prefix for prefix, ns in
+                     re.findall(r'xmlns:([\w.-]+)="([^"]*)"', root.group(0)) }
+        return (params, pieces, prefixes)
+
+    def _marshalValue(self, parts, prefixes, name, element, optional, value):
+        """Marshal a value, appending the result to parts.
+
+        This follows what suds.mx.literal.Typed does for each content
+        item.
+        """
+        if value is not None:
+            if isinstance(value, dict):
+                raise _Unsupported("dict value")
+            if isinstance(value, Object):
+                real = getattr(value.__metadata__, 'sxtype', None)
+                if real is None:
+                    raise _Unsupported("object without type information")
+            else:
+                real = element.resolve()
+                value = real.translate(value, False)
+        if optional:
+            if value is None:
+                return
+            if isinstance(value, (list, tuple)) and not value:
+                return
+        if isinstance(value, (list, tuple)):
+            for v in value:
+                self._marshalValue(parts, prefixes, name, element, optional, v)
+        elif value is None or isinstance(value, suds.null):
+            if element.default is not None:
+                self._marshalText(parts, name, Text(element.default))
+            elif element.nillable:
+                try:
+                    parts.append('<%s %s:nil="true"/>'
+                                 % (name, prefixes[XSI_NS]))
+                except KeyError:
+                    raise _Unsupported("nil value")
+            else:
+                parts.append("<%s/>" % name)
+        elif isinstance(value, Object):
+            ctype = self._getComplexType(real)
+            if (not element.any() and real.extension() and
+                element.resolve() != real):
+                ns = real.namespace()[1]
+                try:
+                    attr = ' %s:type="%s:%s"' % (prefixes[XSI_NS],
+                                                 prefixes[ns], real.name)
+                except KeyError:
+                    raise _Unsupported("namespace of type %s" % real.name)
+            else:
+                attr = ""
+            keylist = value.__keylist__
+            if ctype.orderset.issuperset(keylist):
+                keylist = ctype.ordering
+            start = len(parts)
+            parts.append("<%s%s>" % (name, attr))
+            d = value.__dict__
+            for k in keylist:
+                if k not in d:
+                    continue
+                celement, coptional = ctype.getField(k)
+                self._marshalValue(parts, prefixes, k, celement, coptional,
+                                   d[k])
+            if len(parts) > start + 1:
+                parts.append("</%s>" % name)
+            else:
+                parts[start] = "<%s%s/>" % (name, attr)
+        elif isinstance(value, (Element, Property)):
+            raise _Unsupported("value of type %s" % type(value).__name__)
+        elif isinstance(value, Text):
+            self._marshalText(parts, name, value)
+        else:
+            self._marshalText(parts, name, Text(suds.tostr(value)))
+
+    def _marshalText(self, parts, name, text):
+        # Note that Suds renders an empty text as an element with
+        # start and end tag.
+        parts.append("<%s>%s</%s>" % (name, text.escape(), name))
+
+    def marshal(self, method, args):
+        """Render the SOAP envelope for a call.
+
+        :param method: the Suds method.
+        :type method: :class:`suds.wsdl.Method`
+        :param args: the arguments for the call.
+        :type args: :class:`tuple`
+        :return: the SOAP envelope.  This is the same as Suds would
+            send to the server.
+        :rtype: :class:`str`
+        :raise ValueError: if the arguments contain anything that the
+            marshaller does not handle.
+        """
+        try:
+            params, pieces, prefixes = self._getTemplate(method)
+            if len(args) != len(params):
+                raise _Unsupported("wrong number of arguments")
+            parts = [pieces[0]]
+            for (element, optional), value, piece in zip(params, args,
+                                                         pieces[1:]):
+                self._marshalValue(parts, prefixes, element.name,
+                                   element, optional, value)
+                parts.append(piece)
+            if len(parts) == len(pieces):
+                # Suds would render an empty element for the method.
+                raise _Unsupported("no arguments")
+            return "".join(parts)
+        except _Unsupported as e:
+            raise ValueError("Cannot marshal %s request: %s"
+                             % (method.name, e))
+
+    def invoke(self, soapclient, args):
+        """Invoke a call using a pre-rendered envelope.
+
+        Fall back to the regular processing in Suds for anything that
+        the marshaller does not handle.
+
+        :param soapclient: the Suds SOAP client for the method.
+        :type soapclient: :class:`suds.client._SoapClient`
+        :param args: the arguments for the call.
+        :type args: :class:`tuple`
+        :return: the result of the call.
+        """
+        options = soapclient.options
+        if (not options.plugins and not options.prettyxml and
+            not options.soapheaders and options.prefixes and options.xstq):
+            try:
+                envelope = self.marshal(soapclient.method, args)
+            except ValueError as e:
+                log.debug("%s, falling back to Suds", e)
+            else:
+                return soapclient.send(_Envelope(envelope))
+        return soapclient.invoke(args, {})
+
+    def call(self, name, *args):
+        """Call an API method of the ICAT server.
+
+        This is equivalent to ``client.service.name(*args)``, but
+        uses a pre-rendered envelope if possible.
+
+        :param name: the name of the API method.
+        :type name: :class:`str`
+        :param args: the arguments for the call.
+        :return: the result of the call.
+        :raise suds.WebFault: if the server responded with a fault.
+        """
+        client = self._getClient()
+        method = getattr(client.service, name).method
+        soapclient = suds.client._SoapClient(client, method)
+        return self.invoke(soapclient, args)
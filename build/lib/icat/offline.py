@@ -0,0 +1,164 @@
+"""Work with the ICAT schema without connecting to an ICAT server.
+
+This module provides :class:`~icat.offline.OfflineClient`, a
+client-like object that is built from the schema information saved
+by a previous :class:`icat.client.Client` in its cache directory,
+see the `cacheDir` argument of the latter.  It allows to create
+entity objects, to build queries, to generate unique keys, and to
+convert data files, without any network connection.  Obviously, it
+does not support any method that needs to talk to the server, such
+as searching objects.
+
+.. versionadded:: 1.8.0
+"""
+
+import itertools
+import weakref
+
+import suds.sudsobject
+
+from .cache import SchemaCache
+from .client import Client, _complete_url
+from .entities import getTypeMap
+from .exception import EntityTypeError
+from .helper import parse_attr_val, simpleqp_unquote
+from .schemaindex import SchemaIndex
+
+__all__ = ['OfflineClient']
+
+
+class _OfflineFactory():
+    """Emulate the part of the Suds factory used in python-icat.
+
+    Instance objects are created according to the entity info
+    rather than the types in the service description.
+    """
+
+    def __init__(self, client):
+        self._client = weakref.ref(client)
+
+    def create(self, name):
+        attrs = dict()
+        client = self._client()
+        cls = client.typemap.get(name) if client else None
+        if cls is not None and cls.BeanName is not None:
+            for f in client.getEntityInfo(cls.BeanName).fields:
+                attrs[str(f.name)] = None
+        return suds.sudsobject.Factory.object(name, attrs)
+
+
+class OfflineClient():
+    """A client-like object built from a schema snapshot.
+
+    The snapshot is the schema information that a
+    :class:`icat.client.Client` saves in its cache directory, if the
+    `cacheDir` argument has been set.  The cache directory may be
+    copied to other hosts to be used there.
+
+    The offline client provides the attributes and methods of
+    :class:`icat.client.Client` needed to create entity objects,
+    build queries, and to read and write data files:
+    :meth:`~icat.client.Client.new`,
+    :meth:`~icat.client.Client.getEntity`,
+    :meth:`~icat.client.Client.getEntityClass`,
+    :meth:`~icat.client.Client.getEntityInfo`,
+    :meth:`~icat.client.Client.getEntityNames`, and
+    :meth:`~icat.offline.OfflineClient.searchUniqueKey`.
+
+    :param cacheDir: the cache directory of the client that saved the
+        snapshot.
+    :type cacheDir: :class:`~pathlib.Path` or :class:`str`
+    :param url: the URL of the ICAT service that the snapshot has
+        been taken from.
+    :type url: :class:`str`
+    :raise ValueError: if no valid snapshot for `url` is found in
+        `cacheDir`.
+    """
+
+    def __init__(self, cacheDir, url):
+        self.url = _complete_url(url)
+        self.kwargs = dict(cacheDir=cacheDir)
+        self.schemaCache = SchemaCache(cacheDir, self.url)
+        if not self.schemaCache.load():
+            raise ValueError("No schema snapshot for %s found in %s"
+                             % (self.url, cacheDir))
+        self.apiversion = self.schemaCache.apiversion
+        self.entityInfoCache = dict(self.schemaCache.entityInfo)
+        self.schemaIndex = SchemaIndex(self)
+        self.factory = _OfflineFactory(self)
+        self.ids = None
+        self.sessionId = None
+        self._idcounter = itertools.count(1)
+        self.typemap = getTypeMap(self, lazy=True)
+
+    new = Client.new
+    getEntityClass = Client.getEntityClass
+    getEntity = Client.getEntity
+
+    def __str__(self):
+        return "OfflineClient(%s)" % self.url
+
+    def _has_wsdl_type(self, name):
+        wsdlTypes = self.schemaCache.wsdlTypes
+        return wsdlTypes is not None and name in wsdlTypes
+
+    def getApiVersion(self):
+        return str(self.apiversion)
+
+    def getEntityInfo(self, beanName):
+        try:
+            return self.entityInfoCache[beanName]
+        except KeyError:
+            raise EntityTypeError("Invalid entity type '%s'." % beanName)
+
+    def getEntityNames(self):
+        return list(self.schemaCache.entityNames)
+
+    def getAuthenticatorInfo(self):
+        return self.schemaCache.authenticatorInfo
+
+    def autoRefresh(self):
+        """Do nothing, there is no session to refresh.
+        """
+        pass
+
+    def searchUniqueKey(self, key, objindex=None):
+        """Return the object that belongs to a unique key.
+
+        This emulates :meth:`icat.client.Client.searchUniqueKey`.  If
+        the key is not found in `objindex`, the object is
+        reconstructed from the attributes encoded in the key.  Related
+        objects are reconstructed recursively.  The reconstructed
+        objects get a locally generated id, that is only meaningful
+        within this offline client.
+
+        :param key: the unique key of the object.
+        :type key: :class:`str`
+        :param objindex: cache of entity objects.
+        :type objindex: :class:`dict`
+        :return: the object corresponding to the key.
+        :rtype: :class:`icat.entity.Entity`
+        :raise ValueError: if the key is not well formed.
+        """
+        if objindex is not None and key in objindex:
+            return objindex[key]
+        us = key.index('_')
+        beanname = key[:us]
+        av = parse_attr_val(key[us+1:])
+        obj = self.new(self.getEntityClass(beanname).getInstanceName())
+        info = self.getEntityInfo(beanname)
+        for f in info.fields:
+            if f.name in av.keys():
+                attr = f.name
+                if f.relType == "ATTRIBUTE":
+                    setattr(obj, attr, simpleqp_unquote(av[attr]))
+                elif f.relType == "ONE":
+                    rk = str("%s_%s" % (f.type, av[attr]))
+                    setattr(obj, attr, self.searchUniqueKey(rk, objindex))
+                else:
+                    raise ValueError("malformed '%s': invalid attribute '%s'"
+                                     % (key, attr))
+        obj.id = next(self._idcounter)
+        if objindex is not None:
+            objindex[key] = obj
+        return obj
@@ -0,0 +1,202 @@
+"""Provide an index of the ICAT schema for fast lookups.
+
+.. note::
+   This module is mostly intended for the internal use in python-icat.
+   Most users will not need to use it directly.
+
+.. versionadded:: 1.8.0
+"""
+
+import weakref
+
+from .exception import EntityTypeError, InternalError
+
+__all__ = ['SchemaIndex']
+
+
+class SchemaIndex():
+    """An index of the schema information of an ICAT server.
+
+    Looking up entity classes by their BeanName, information on
+    attributes, attribute paths, and the natural order of entity
+    classes happens frequently, e.g. while building queries or reading
+    dump files.  The index computes each of these items on first use
+    and memoizes the result for subsequent lookups.
+
+    Each :class:`icat.client.Client` maintains its own index in the
+    attribute :attr:`~icat.client.Client.schemaIndex`.
+
+    :param client: the client.
+    :type client: :class:`icat.client.Client`
+    """
+
+    def __init__(self, client):
+        # Only keep a weak reference to the client to avoid a
+        # reference cycle.
+        self._client = weakref.ref(client)
+        self._classes = dict()
+        self._fields = dict()
+        self._attrPaths = dict()
+        self._naturalOrders = dict()
+
+    def _getClient(self):
+        client = self._client()
+        if client is None:
+            raise RuntimeError("The client of this schema index is gone.")
+        return client
+
+    def getEntityClass(self, name):
+        """Return the entity class corresponding to a BeanName.
+
+        :param name: the BeanName.
+        :type name: :class:`str`
+        :return: the entity class.
+        :raise EntityTypeError: if there is no entity class by that
+            name.
+        """
+        try:
+            return self._classes[name]
+        except (KeyError, TypeError):
+            pass
+        try:
+            cls = self._getClient().typemap[name[0].lower() + name[1:]]
+        except (KeyError, IndexError, TypeError):
+            cls = None
+        if cls is None or cls.BeanName != name:
+            raise EntityTypeError("Invalid entity type '%s'." % name)
+        self._classes[name] = cls
+        return cls
+
+    def _getFields(self, cls):
+        try:
+            return self._fields[cls.BeanName]
+        except KeyError:
+            pass
+        info = self._getClient().getEntityInfo(cls.BeanName)
+        fields = dict()
+        for f in info.fields:
+            fields.setdefault(str(f.name), f)
+        self._fields[cls.BeanName] = fields
+        return fields
+
+    def getAttrInfo(self, cls, attr):
+        """Get information on an attribute of an entity class.
+
+        :param cls: the entity class.  This must not be an abstract
+            class.
+        :type cls: :class:`type`
+        :param attr: name of the attribute.
+        :type attr: :class:`str`
+        :return: information on the attribute.
+        :raise ValueError: if no attribute by that name is found.
+        """
+        fields = self._getFields(cls)
+        try:
+            return fields[attr]
+        except KeyError:
+            pass
+        if attr in cls.MetaAttr:
+            # ICAT server 4.4 and older did not add the meta
+            # attributes in the entity info.  Create a fake
+            # entityField to emulate the new behavior of ICAT 4.5.0.
+            f = self._getClient().factory.create('entityField')
+            f.name = attr
+            f.notNullable = False
+            f.relType = "ATTRIBUTE"
+            if attr in {'createTime', 'modTime'}:
+                f.type = "Date"
+            else:
+                f.type = "String"
+            fields[attr] = f
+            return f
+        else:
+            raise ValueError("Unknown attribute name '%s'." % attr)
+
+    def getAttrPath(self, cls, attrname):
+        """Follow an attribute path along related objects.
+
+        :param cls: the entity class to start from.
+        :type cls: :class:`type`
+        :param attrname: the attribute path, e.g. a dot separated
+            list of attribute names.
+        :type attrname: :class:`str`
+        :return: a tuple of triples, one for each component of the
+            path.  Each triple consists of the path up to that
+            component, the information on the attribute, and the
+            related entity class or :const:`None` if the component is
+            not a relation.
+        :rtype: :class:`tuple`
+        :raise ValueError: if `attrname` is not a valid attribute path
+            for `cls`.
+        """
+        key = (cls, attrname)
+        try:
+            return self._attrPaths[key]
+        except KeyError:
+            pass
+        path = []
+        rclass = cls
+        pattr = ""
+        for attr in attrname.split('.'):
+            if pattr:
+                pattr += ".%s" % attr
+            else:
+                pattr = attr
+            if rclass is None:
+                # Last component was not a relation, no further components
+                # in the name allowed.
+                raise ValueError("Invalid attrname '%s' for %s."
+                                 % (attrname, cls.BeanName))
+            attrInfo = rclass.getAttrInfo(self._getClient(), attr)
+            if attrInfo.relType == "ATTRIBUTE":
+                rclass = None
+            elif (attrInfo.relType == "ONE" or
+                  attrInfo.relType == "MANY"):
+                rclass = self.getEntityClass(attrInfo.type)
+            else:
+                raise InternalError("Invalid relType: '%s'" % attrInfo.relType)
+            path.append((pattr, attrInfo, rclass))
+        path = tuple(path)
+        self._attrPaths[key] = path
+        return path
+
+    def getNaturalOrder(self, cls):
+        """Return the natural order of an entity class.
+
+        See :meth:`icat.entity.Entity.getNaturalOrder` for details.
+
+        :param cls: the entity class.
+        :type cls: :class:`type`
+        :return: the list of attributes defining the natural order.
+        :rtype: :class:`list`
+        """
+        try:
+            return list(self._naturalOrders[cls])
+        except KeyError:
+            pass
+        client = self._getClient()
+        order = []
+        attrs = list(cls.SortAttrs or cls.Constraint)
+        if "id" in cls.Constraint and "id" not in attrs:
+            attrs.append("id")
+        for a in attrs:
+            attrInfo = cls.getAttrInfo(client, a)
+            if attrInfo.relType == "ATTRIBUTE":
+                order.append(a)
+            elif attrInfo.relType == "ONE":
+                if not attrInfo.notNullable:
+                    # skip, adding a nullable relation to ORDER BY
+                    # would implicitly add a NOT NULL condition.
+                    continue
+                else:
+                    rclass = self.getEntityClass(attrInfo.type)
+                    rorder = rclass.getNaturalOrder(client)
+                    order.extend(["%s.%s" % (a, ra) for ra in rorder])
+            elif attrInfo.relType == "MANY":
+                # skip, one to many relationships cannot be used in an
+                # ORDER BY clause.
+                continue
+            else:
+                raise InternalError("Invalid relType: '%s'" % attrInfo.relType)
+        self._naturalOrders[cls] = tuple(order)
+        return order
@@ -0,0 +1,118 @@
+"""Helper functions and classes related to SSL contexts.
+
+.. note::
+   This module is mostly intended for the internal use in python-icat.
+   Most users will not need to use it directly or even care about it.
+"""
+
+from http.cookiejar import CookieJar
+import ssl
+import threading
+from urllib.request import HTTPSHandler
+import suds.transport
+import suds.transport.http
+from suds.properties import Unskin
+
+from .compression import CompressionHandler
+from .keepalive import KeepAliveHandler
+
+
+def create_ssl_context(verify=True, cafile=None, capath=None):
+    """Set up the SSL context.
+    """
+    context = ssl.create_default_context(cafile=cafile, capath=capath)
+    if not verify:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+class HTTPSTransport(suds.transport.http.HttpTransport):
+    """A modified HttpTransport using an explicit SSL context.
+    """
+
+    def __init__(self, context, pool=None, compression=False,
+                 compressRequests=None, **kwargs):
+        """Initialize the HTTPSTransport instance.
+
+        :param context: The SSL context to use.
+        :type context: :class:`ssl.SSLContext`
+        :param pool: if not :const:`None`, keep connections open and
+            reuse them for later requests.
+        :type pool: :class:`icat.keepalive.ConnectionPool`
+        :param compression: flag whether to ask the server for
+            compressed responses.
+        :type compression: :class:`bool`
+        :param compressRequests: if not :const:`None`, request bodies
+            of at least this size in bytes are sent gzip compressed.
+        :type compressRequests: :class:`int`
+        :param kwargs: keyword arguments.
+        :see: :class:`suds.transport.http.HttpTransport` for the
+            keyword arguments.
+
+        .. versionchanged:: 1.8.0
+            add the `pool`, `compression`, and `compressRequests`
+            arguments.
+        """
+        suds.transport.http.HttpTransport.__init__(self, **kwargs)
+        self.ssl_context = context
+        self.pool = pool
+        self.compression = compression
+        self.compressRequests = compressRequests
+
+    def u2handlers(self):
+        """Get a collection of urllib handlers.
+        """
+        handlers = suds.transport.http.HttpTransport.u2handlers(self)
+        if self.pool is not None:
+            handlers.append(KeepAliveHandler(self.pool, self.ssl_context))
+        elif self.ssl_context:
+            handlers.append(HTTPSHandler(context=self.ssl_context))
+        handlers.append(CompressionHandler(self.compression,
+                                           self.compressRequests))
+        return handlers
+
+
+class ThreadLocalTransport(suds.transport.Transport):
+    """A transport that delegates to a separate transport in each thread.
+
+    The transports for each thread are created on demand by calling
+    `factory`.  They share the options and the cookie jar of this
+    transport.
+
+    .. versionadded:: 1.8.0
+    """
+
+    def __init__(self, factory, **kwargs):
+        """Initialize the ThreadLocalTransport instance.
+
+        :param factory: a callable without arguments returning a new
+            transport.
+        :param kwargs: keyword arguments.
+        :see: :class:`suds.transport.http.HttpTransport` for the
+            keyword arguments.
+        """
+        suds.transport.Transport.__init__(self)
+        Unskin(self.options).update(kwargs)
+        self.factory = factory
+        self.cookiejar = CookieJar()
+        self._local = threading.local()
+
+    @property
+    def transport(self):
+        """The transport for the current thread.
+        """
+        try:
+            return self._local.transport
+        except AttributeError:
+            transport = self.factory()
+            transport.options = self.options
+            transport.cookiejar = self.cookiejar
+            self._local.transport = transport
+            return transport
+
+    def open(self, request):
+        return self.transport.open(request)
+
+    def send(self, request):
+        return self.transport.send(request)
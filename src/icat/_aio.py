@@ -0,0 +1,460 @@
+"""Implementation of :mod:`icat.aio`.
+
+This module uses syntax that is new in Python 3.6.  It is only
+imported by :mod:`icat.aio` after checking the Python version.
+"""
+
+import asyncio
+import gzip
+import http.client
+import io
+import logging
+import time
+import urllib.parse
+
+import suds
+import suds.client
+from suds.plugin import PluginContainer
+
+from .client import _ChunkedSearch
+from .compression import ACCEPT_ENCODING, decompress
+from .decoder import _requestTarget
+from .entity import Entity
+from .exception import (ICATSessionError, ICATValidationError,
+                        translateError)
+
+__all__ = ['AsyncClient']
+
+log = logging.getLogger("icat.aio")
+
+
+class _StaleConnection(Exception):
+    """The server closed the connection without sending a response.
+    """
+    pass
+
+
+class _Connection():
+    """A connection to the server.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    def close(self):
+        self.writer.close()
+
+
+class _AsyncSoapClient(suds.client._SoapClient):
+    """A Suds SOAP client that renders the request for a call, but
+    leaves the sending to :class:`~icat.aio.AsyncClient`.
+    """
+
+    def send(self, soapenv, timeout=None):
+        plugins = PluginContainer(self.options.plugins)
+        plugins.message.marshalled(envelope=soapenv.root())
+        if self.options.prettyxml:
+            soapenv = soapenv.str()
+        else:
+            soapenv = soapenv.plain()
+        ctx = plugins.message.sending(envelope=soapenv.encode("utf-8"))
+        return ctx.envelope
+
+
+
+class AsyncClient():
+    """A client for the ICAT SOAP API in asyncio programs.
+
+    The client provides coroutine versions of the most important API
+    methods of :class:`icat.client.Client`.  The requests are sent
+    over a pool of persistent connections to the ICAT server.
+
+    The client shares the session with the regular client that it has
+    been set up from: logging in with one of them also sets the
+    session id in the other one.  The entity objects returned from
+    the calls belong to the regular client.  Note that the methods of
+    these objects, such as :meth:`icat.entity.Entity.create`, do
+    blocking calls.
+
+    All calls of a client must be done in the same event loop.
+    Proxies are not supported.
+
+    :param client: the regular client.  The timeout, the SSL context,
+        and the compression settings of this client are used.
+    :type client: :class:`icat.client.Client`
+    :param maxConnections: maximum number of calls that may be in
+        progress at the same time.  Further calls wait for one of
+        them to complete.
+    :type maxConnections: :class:`int`
+    :raise ValueError: if the regular client is configured to use a
+        proxy.
+    """
+
+    def __init__(self, client, maxConnections=10):
+        if client.options.proxy:
+            raise ValueError("AsyncClient does not support proxies.")
+        self.client = client
+        self.maxConnections = maxConnections
+        self._semaphore = None
+        self._idle = dict()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type, value, tb):
+        await self.close()
+
+    @property
+    def sessionId(self):
+        """The session id, the same as in the regular client.
+        """
+        return self.client.sessionId
+
+    @sessionId.setter
+    def sessionId(self, sessionId):
+        self.client.sessionId = sessionId
+
+    async def close(self):
+        """Close all connections that are currently not in use.
+        """
+        connections = [c for conns in self._idle.values() for c in conns]
+        self._idle.clear()
+        for conn in connections:
+            conn.close()
+            # StreamWriter.wait_closed() is new in Python 3.7.
+            if hasattr(conn.writer, "wait_closed"):
+                try:
+                    await conn.writer.wait_closed()
+                except OSError:
+                    pass
+
+    # ==================== HTTP ====================
+
+    def _formatRequest(self, url, body, headers):
+        path = url.path or "/"
+        if url.query:
+            path += "?" + url.query
+        hdrs = [ ("Host", url.netloc.rpartition("@")[2]) ]
+        if self.client.kwargs['compression']:
+            hdrs.append( ("Accept-Encoding", ACCEPT_ENCODING) )
+        threshold = self.client.kwargs['compressRequests']
+        if threshold is not None and len(body) >= threshold:
+            body = gzip.compress(body)
+            hdrs.append( ("Content-Encoding", "gzip") )
+        hdrs.extend(headers.items())
+        hdrs.append( ("Content-Length", str(len(body))) )
+        head = ["POST %s HTTP/1.1\r\n" % path]
+        head.extend("%s: %s\r\n" % h for h in hdrs)
+        head.append("\r\n")
+        return "".join(head).encode("iso-8859-1") + body
+
+    async def _connect(self, url):
+        kwargs = dict()
+        if url.scheme == "https":
+            kwargs['ssl'] = self.client.sslContext
+            kwargs['server_hostname'] = url.hostname
+        port = url.port or (443 if url.scheme == "https" else 80)
+        reader, writer = await asyncio.open_connection(url.hostname, port,
+                                                       **kwargs)
+        return _Connection(reader, writer)
+
+    async def _readResponse(self, reader):
+        """Read a HTTP response.
+
+        Return a tuple (status, reason, content, keepalive).
+        """
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise _StaleConnection()
+            statusline = line.decode("iso-8859-1").rstrip("\r\n")
+            statusline = statusline.split(None, 2)
+            try:
+                version, status = statusline[:2]
+                status = int(status)
+            except ValueError:
+                raise http.client.BadStatusLine(line)
+            reason = statusline[2] if len(statusline) > 2 else ""
+            lines = []
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                lines.append(line)
+            lines.append(b"\r\n")
+            headers = http.client.parse_headers(io.BytesIO(b"".join(lines)))
+            if not 100 <= status < 200:
+                break
+        connection = headers.get("Connection", "").lower()
+        if "close" in connection:
+            keepalive = False
+        elif "keep-alive" in connection:
+            keepalive = True
+        else:
+            keepalive = (version == "HTTP/1.1")
+        if status in (204, 304):
+            content = b""
+        elif "chunked" in headers.get("Transfer-Encoding", "").lower():
+            chunks = []
+            while True:
+                line = await reader.readline()
+                size = int(line.split(b";")[0], 16)
+                if size == 0:
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            # Skip the trailer.
+            while await reader.readline() not in (b"\r\n", b"\n", b""):
+                pass
+            content = b"".join(chunks)
+        elif headers.get("Content-Length") is not None:
+            content = await reader.readexactly(int(headers["Content-Length"]))
+        else:
+            content = await reader.read()
+            keepalive = False
+        encoding = headers.get("Content-Encoding", "").strip().lower()
+        if encoding and encoding != "identity":
+            content = decompress(content, encoding)
+        return (status, reason, content, keepalive)
+
+    async def _exchange(self, conn, request):
+        conn.writer.write(request)
+        await conn.writer.drain()
+        return await self._readResponse(conn.reader)
+
+    async def _post(self, location, body, headers):
+        """Send a POST request to the server.
+
+        Return a tuple (status, reason, content).
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.maxConnections)
+        url = urllib.parse.urlsplit(location)
+        request = self._formatRequest(url, body, headers)
+        key = (url.scheme, url.netloc)
+        timeout = self.client.options.timeout
+        async with self._semaphore:
+            while True:
+                idle = self._idle.get(key)
+                if idle:
+                    conn = idle.pop()
+                    reused = True
+                else:
+                    conn = await asyncio.wait_for(self._connect(url), timeout)
+                    reused = False
+                try:
+                    status, reason, content, keepalive = \
+                        await asyncio.wait_for(self._exchange(conn, request),
+                                               timeout)
+                except (_StaleConnection, ConnectionError) as e:
+                    conn.close()
+                    if reused:
+                        # The server may have closed the idle connection
+                        # in the meantime, try again with a new one.
+                        log.debug("connection lost (%r), retrying", e)
+                        continue
+                    if isinstance(e, _StaleConnection):
+                        raise ConnectionError("Remote end closed connection "
+                                              "without response")
+                    raise
+                except BaseException:
+                    conn.close()
+                    raise
+                if keepalive:
+                    self._idle.setdefault(key, []).append(conn)
+                else:
+                    conn.close()
+                return (status, reason, content)
+
+    # ==================== SOAP ====================
+
+    async def _send(self, name, args):
+        """Send the request for an API call.
+
+        Return a tuple (soapclient, status, reason, reply).
+        """
+        client = self.client
+        method = getattr(client.service, name).method
+        soapclient = _AsyncSoapClient(client, method)
+        envelope = client.requestMarshaller.invoke(soapclient, args)
+        location, headers = _requestTarget(soapclient)
+        status, reason, reply = await self._post(location, envelope, headers)
+        if status == 200:
+            status = None
+        return (soapclient, status, reason, reply)
+
+    async def _call(self, name, *args):
+        soapclient, status, reason, reply = await self._send(name, args)
+        try:
+            return soapclient.process_reply(reply, status, reason)
+        except suds.WebFault as e:
+            raise translateError(e)
+
+    # ==================== API methods ====================
+
+    async def login(self, auth, credentials):
+        """Coroutine version of :meth:`icat.client.Client.login`.
+        """
+        await self.logout()
+        if self.client.identityMap is not None:
+            self.client.identityMap.clear()
+        cred = self.client.factory.create("credentials")
+        for k in credentials:
+            cred.entry.append({ 'key': k, 'value': credentials[k] })
+        self.sessionId = await self._call("login", auth, cred)
+        minutes = await self.getRemainingMinutes()
+        wait = max(minutes - self.client.AutoRefreshRemain, 0)
+        self.client._schedule_auto_refresh(time.time() + 60*wait)
+        return self.sessionId
+
+    async def logout(self):
+        """Coroutine version of :meth:`icat.client.Client.logout`.
+        """
+        if self.sessionId:
+            try:
+                try:
+                    await self._call("logout", self.sessionId)
+                finally:
+                    self.sessionId = None
+                    if self.client.identityMap is not None:
+                        self.client.identityMap.clear()
+            except ICATSessionError:
+                # silently ignore ICATSessionError, e.g. an expired session.
+                pass
+
+    async def create(self, bean):
+        """Coroutine version of :meth:`icat.client.Client.create`.
+        """
+        if getattr(bean, 'validate', None):
+            bean.validate()
+        try:
+            return await self._call("create", self.sessionId,
+                                    Entity.getInstance(bean))
+        finally:
+            self.client._invalidateCache([bean])
+
+    async def createMany(self, beans):
+        """Coroutine version of :meth:`icat.client.Client.createMany`.
+        """
+        for b in beans:
+            if getattr(b, 'validate', None):
+                b.validate()
+        try:
+            return await self._call("createMany", self.sessionId,
+                                    Entity.getInstances(beans))
+        finally:
+            self.client._invalidateCache(beans)
+
+    async def delete(self, bean):
+        """Coroutine version of :meth:`icat.client.Client.delete`.
+        """
+        try:
+            await self._call("delete", self.sessionId,
+                             Entity.getInstance(bean))
+        finally:
+            self.client._invalidateCache([bean], cascade=True)
+
+    async def deleteMany(self, beans):
+        """Coroutine version of :meth:`icat.client.Client.deleteMany`.
+        """
+        try:
+            await self._call("deleteMany", self.sessionId,
+                             Entity.getInstances(beans))
+        finally:
+            self.client._invalidateCache(beans, cascade=True)
+
+    async def get(self, query, primaryKey):
+        """Coroutine version of :meth:`icat.client.Client.get`.
+        """
+        instance = await self._call("get", self.sessionId,
+                                    str(query), primaryKey)
+        return self.client.getEntity(instance)
+
+    async def getRemainingMinutes(self):
+        """Coroutine version of
+        :meth:`icat.client.Client.getRemainingMinutes`.
+        """
+        return await self._call("getRemainingMinutes", self.sessionId)
+
+    async def refresh(self):
+        """Coroutine version of :meth:`icat.client.Client.refresh`.
+        """
+        await self._call("refresh", self.sessionId)
+
+    async def search(self, query):
+        """Coroutine version of :meth:`icat.client.Client.search`.
+
+        The response is decoded with the decoder from
+        :mod:`icat.decoder`, regardless of the `fastDecode` argument
+        to the regular client.
+        """
+        client = self.client
+        soapclient, status, reason, reply = \
+            await self._send("search", (self.sessionId, str(query)))
+        options = client.options
+        if (status is None and options.faults and
+            not options.retxml and not options.plugins):
+            try:
+                return client.searchDecoder.decode(reply)
+            except ValueError as e:
+                log.debug("%s, falling back to Suds", e)
+        try:
+            instances = soapclient.process_reply(reply, status, reason)
+        except suds.WebFault as e:
+            raise translateError(e)
+        return [client.getEntity(i) for i in instances]
+
+    async def searchChunked(self, query, skip=0, count=None, chunksize=100,
+                            keyset=False):
+        """Search the ICAT server in chunks.
+
+        Asynchronous generator version of
+        :meth:`icat.client.Client.searchChunked`, to be used in an
+        ``async for`` loop.  The same remarks apply as for the
+        latter.
+
+        :param query: the search query.
+        :type query: :class:`icat.query.Query` or :class:`str`
+        :param skip: offset from within the full list of available results.
+        :type skip: :class:`int`
+        :param count: maximum number of items to return.  A value of
+            :const:`None` means no limit.
+        :type count: :class:`int`
+        :param chunksize: number of items to query in each search
+            call.  This is an internal tuning parameter and does not
+            affect the result.  If set to ``"auto"``, the chunk size
+            is adjusted automatically, but the `maxEntities` property
+            of the server is not taken into account.
+        :type chunksize: :class:`int` or :class:`str`
+        :param keyset: flag whether to use keyset pagination.
+        :type keyset: :class:`bool`
+        :return: an asynchronous generator that successively yields
+            the items in the search result.
+        :raise ValueError: if `keyset` is :const:`True` and the query
+            does not return objects or contains a LIMIT clause.
+        """
+        chunked = _ChunkedSearch(query, skip, count, chunksize, keyset)
+        while True:
+            query = chunked.nextQuery()
+            if query is None:
+                break
+            start = time.perf_counter()
+            try:
+                items = await self.search(query)
+            except ICATValidationError as e:
+                if chunked.reject(e):
+                    continue
+                raise
+            chunked.addResult(items, time.perf_counter() - start)
+            for o in items:
+                yield o
+
+    async def update(self, bean):
+        """Coroutine version of :meth:`icat.client.Client.update`.
+        """
+        try:
+            await self._call("update", self.sessionId,
+                             Entity.getInstance(bean))
+        finally:
+            self.client._invalidateCache([bean])
@@ -0,0 +1,32 @@
+"""Access ICAT from asyncio programs.
+
+This module provides :class:`~icat.aio.AsyncClient`, a client for the
+ICAT SOAP API that may be used in programs based on :mod:`asyncio`.
+It sends the requests using asyncio streams rather than blocking
+sockets, so that many calls may be in progress at the same time in
+one thread.  For instance, a number of queries may be searched
+concurrently as follows::
+
+    aclient = AsyncClient(client)
+    results = await asyncio.gather(*[aclient.search(q) for q in queries])
+
+:class:`~icat.aio.AsyncClient` does not parse the service description
+from the ICAT server by itself, but is set up from a regular
+:class:`icat.client.Client` that already did this.  It reuses the
+type information, the entity classes, and the options of the latter.
+
+.. note::
+   This module requires Python 3.6 or newer.  Importing it with
+   older Python versions raises :exc:`ImportError`.
+
+.. versionadded:: 1.8.0
+"""
+
+import sys
+
+if sys.version_info < (3, 6):
+    raise ImportError("icat.aio requires Python 3.6 or newer.")
+
+from ._aio import AsyncClient
+
+__all__ = ['AsyncClient']
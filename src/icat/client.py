@@ -4,27 +4,39 @@ This is the only module that needs to be imported to use the icat.
 """
 
 import atexit
+import functools
+import heapq
 import logging
 import os
 from pathlib import Path
+import queue
 import re
+import threading
 import time
 import urllib.parse
 from warnings import warn
 import weakref
 
 import suds
+import suds.bindings.multiref
 import suds.client
 import suds.sudsobject
 
+from .cache import SchemaCache, WSDLCache
+from .decoder import SearchDecoder
 from .entities import getTypeMap
 from .entity import Entity
 from .exception import *
+from .identitymap import IdentityMap
 from .helper import (Version, simpleqp_unquote, parse_attr_val,
-                     ms_timestamp, disable_logger)
+                     parse_attr_string, ms_timestamp, disable_logger)
 from .ids import *
+from .marshaller import RequestMarshaller
 from .query import Query
-from .sslcontext import create_ssl_context, HTTPSTransport
+from .resultcache import _queryTypes
+from .schemaindex import SchemaIndex
+from .sslcontext import (create_ssl_context, HTTPSTransport,
+                         ThreadLocalTransport)
 
 __all__ = ['Client']
 
@@ -38,6 +50,323 @@ def _complete_url(url, default_path="/ICATService/ICAT?wsdl"):
         return url
     return "%s://%s%s" % (o.scheme, o.netloc, default_path)
 
+class _MultiRef(suds.bindings.multiref.MultiRef):
+    """A variant of the Suds MultiRef that may be used concurrently.
+
+    The original class keeps the state of processing a reply in
+    instance attributes, but Suds shares one instance per binding
+    between all calls.  Use a fresh instance for each reply instead.
+    """
+    def process(self, body):
+        return suds.bindings.multiref.MultiRef().process(body)
+
+def _threadsafe_bindings(wsdl):
+    """Fix the shared state in the SOAP bindings of the service
+    definition, so that calls may be issued concurrently.
+    """
+    for service in wsdl.services:
+        for port in service.ports:
+            for method in port.methods.values():
+                for b in (method.binding.input, method.binding.output):
+                    if b is not None:
+                        b.multiref = _MultiRef()
+
+class _ThreadLocalMessages():
+    """A replacement for the record of the last sent and received
+    messages in the Suds client, keeping a separate record in each
+    thread.
+    """
+    def __init__(self):
+        self._local = threading.local()
+    def get(self, key, default=None):
+        return getattr(self._local, key, default)
+    def __getitem__(self, key):
+        try:
+            return getattr(self._local, key)
+        except AttributeError:
+            raise KeyError(key)
+    def __setitem__(self, key, value):
+        setattr(self._local, key, value)
+
+def _prefetch(iterables, size):
+    """Iterate over iterables in background threads.
+
+    Yield the items of all iterables, taking them from one background
+    thread per iterable that stays up to size items ahead of the
+    consumer.  The items of each iterable are yielded in their order,
+    items from different iterables in the order in which they become
+    available.  If the generator is closed before the end, the
+    background threads are stopped after having completed the
+    retrieval of the current item.
+    """
+    items = queue.Queue()
+    stop = threading.Event()
+    def produce(iterable, slots):
+        try:
+            it = iter(iterable)
+            while True:
+                while not slots.acquire(timeout=0.1):
+                    if stop.is_set():
+                        return
+                if stop.is_set():
+                    return
+                try:
+                    item = next(it)
+                except StopIteration:
+                    items.put((slots, False, None))
+                    return
+                items.put((slots, True, item))
+        except BaseException as e:
+            items.put((slots, False, e))
+    threads = []
+    for iterable in iterables:
+        slots = threading.Semaphore(size)
+        thread = threading.Thread(target=produce, args=(iterable, slots),
+                                  name="prefetch")
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    try:
+        running = len(threads)
+        while running:
+            slots, ok, item = items.get()
+            if not ok:
+                if item is not None:
+                    raise item
+                running -= 1
+                continue
+            slots.release()
+            yield item
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+class _Reversed():
+    """Wrap a value, reversing the comparison with other wrapped values.
+    """
+    __slots__ = ('value',)
+    def __init__(self, value):
+        self.value = value
+    def __eq__(self, other):
+        return self.value == other.value
+    def __lt__(self, other):
+        return other.value < self.value
+
+def _orderKey(query):
+    """Return a function that calculates the sort key for objects
+    according to the ORDER BY clause of query.
+    """
+    items = []
+    for attr, vstr in query.order.items():
+        if vstr in ("%s", "%s ASC"):
+            desc = False
+        elif vstr == "%s DESC":
+            desc = True
+        else:
+            raise ValueError("Cannot merge results ordered by %s"
+                             % (vstr % attr))
+        items.append((attr.split('.'), desc))
+    def key(obj):
+        k = []
+        for path, desc in items:
+            v = obj
+            for a in path:
+                v = getattr(v, a, None)
+                if v is None:
+                    break
+            # Let null values go first.
+            v = (v is not None, v)
+            k.append(_Reversed(v) if desc else v)
+        return tuple(k)
+    return key
+
+def _decorate(chunks, key, index):
+    """Flatten the chunks, decorating each object with a sort key
+    that is unique across all partitions.
+    """
+    n = 0
+    for items in chunks:
+        for obj in items:
+            yield ((key(obj), index, n), obj)
+            n += 1
+
+class _ChunkedSearch():
+    """Generate the queries for the search calls in
+    :meth:`Client.searchChunked`.
+
+    In keyset mode, the chunks are selected by a condition on the id
+    of the objects rather than by the offset in the LIMIT clause.
+
+    In adaptive mode, the chunk size is adjusted to the time taken by
+    the search calls.  It is halved if the server rejects a chunk as
+    too large and does not grow beyond the reduced size afterwards.
+    """
+
+    initialChunksize = 100
+    """Chunk size to start with in adaptive mode."""
+
+    targetTime = 1.0
+    """Time in seconds a search call should take in adaptive mode."""
+
+    _head_re = re.compile(r"\s*SELECT\s+(DISTINCT\s+)?(\w+)\s+FROM\s+"
+                          r"(\w+)\s+(?:AS\s+)?(\w+)(?=\s|$)", re.I)
+    _clause_re = re.compile(r"'[^']*'|\(|\)|"
+                            r"\b(WHERE|ORDER\s+BY|INCLUDE|LIMIT)\b", re.I)
+
+    def __init__(self, query, skip=0, count=None, chunksize=100,
+                 keyset=False, maxEntities=None):
+        self.skip = skip
+        self.count = count
+        self.adaptive = (chunksize == "auto")
+        self.maxsize = maxEntities
+        if self.adaptive:
+            chunksize = self.initialChunksize
+        chunksize = max(chunksize, 2)
+        if self.adaptive and maxEntities:
+            # Apply the server's limit after the lower bound, the
+            # first chunk must not already be rejected.
+            chunksize = min(chunksize, maxEntities)
+        self.chunksize = chunksize
+        self.keyset = keyset
+        self.delivered = 0
+        self.last = None
+        self.done = False
+        if keyset:
+            if isinstance(query, Query):
+                if query.attributes or query.aggregate not in (None,
+                                                               "DISTINCT"):
+                    raise ValueError("keyset pagination needs a query "
+                                     "returning objects")
+                if query.limit:
+                    raise ValueError("the query must not have a limit")
+                self.query = query.copy()
+                self.query.setOrder(["id"])
+            else:
+                self.query = query
+                self._parseQuery(query)
+        else:
+            if isinstance(query, Query):
+                query = str(query)
+            query = query.replace('%', '%%')
+            if query.startswith("SELECT"):
+                query += " LIMIT %d, %d"
+            else:
+                query = "%d, %d " + query
+            self.query = query
+
+    def _parseQuery(self, query):
+        """Split a query string into the parts needed for keyset mode.
+        """
+        m = self._head_re.match(query)
+        if not m or m.group(2) != m.group(4):
+            raise ValueError("keyset pagination needs a query of the "
+                             "form 'SELECT o FROM Entity o ...'")
+        self.var = m.group(4)
+        self.select = "SELECT %s%s FROM %s %s" % (m.group(1) or "", self.var,
+                                                  m.group(3), self.var)
+        rest = query[m.end():]
+        clauses = []
+        level = 0
+        for c in self._clause_re.finditer(rest):
+            if c.group(0) == "(":
+                level += 1
+            elif c.group(0) == ")":
+                level -= 1
+            elif c.group(1) and level == 0:
+                clauses.append((c.group(1).split()[0].upper(), c.start()))
+        self.joins = rest[:clauses[0][1]].strip() if clauses else rest.strip()
+        self.where = None
+        self.include = None
+        for i, (keyword, start) in enumerate(clauses):
+            end = clauses[i+1][1] if i+1 < len(clauses) else len(rest)
+            clause = rest[start:end].strip()
+            if keyword == "WHERE":
+                self.where = clause[5:].strip()
+            elif keyword == "INCLUDE":
+                self.include = clause
+            elif keyword == "LIMIT":
+                raise ValueError("the query must not have a LIMIT clause")
+
+    def _keysetQuery(self, skip):
+        if isinstance(self.query, Query):
+            q = self.query.copy()
+            if self.last is not None:
+                q.addConditions({"id": "> %d" % self.last})
+            q.setLimit((skip, self.chunksize))
+            return str(q)
+        parts = [self.select]
+        if self.joins:
+            parts.append(self.joins)
+        conds = []
+        if self.where:
+            conds.append("(%s)" % self.where)
+        if self.last is not None:
+            conds.append("%s.id > %d" % (self.var, self.last))
+        if conds:
+            parts.append("WHERE " + " AND ".join(conds))
+        parts.append("ORDER BY %s.id" % self.var)
+        if self.include:
+            parts.append(self.include)
+        parts.append("LIMIT %d, %d" % (skip, self.chunksize))
+        return " ".join(parts)
+
+    def nextQuery(self):
+        """Return the query for the next chunk or :const:`None` if
+        there is none.
+        """
+        if self.done:
+            return None
+        if self.count is not None:
+            self.chunksize = min(self.chunksize, self.count - self.delivered)
+        if self.chunksize <= 0:
+            return None
+        if self.keyset:
+            return self._keysetQuery(self.skip if self.last is None else 0)
+        else:
+            return self.query % (self.skip, self.chunksize)
+
+    def addResult(self, items, elapsed=None):
+        """Take note of the result of the search call for a chunk.
+
+        In adaptive mode, `elapsed` is the time in seconds that the
+        search call took.
+        """
+        self.delivered += len(items)
+        if len(items) < self.chunksize:
+            self.done = True
+            return
+        elif self.keyset:
+            self.last = items[-1].id
+        else:
+            self.skip += self.chunksize
+        if self.adaptive and elapsed is not None:
+            if elapsed < self.targetTime / 2:
+                chunksize = 2 * self.chunksize
+                if self.maxsize:
+                    chunksize = min(chunksize, self.maxsize)
+                self.chunksize = max(chunksize, self.chunksize)
+            elif elapsed > 2 * self.targetTime:
+                self.chunksize = max(self.chunksize // 2, 1)
+
+    def reject(self, error):
+        """Take note of an error raised by the search call for a chunk.
+
+        Return :const:`True` if the chunk has been rejected as too
+        large and the chunk size has been reduced, so that the search
+        call should be retried.
+        """
+        if not (self.adaptive and isinstance(error, ICATValidationError)
+                and "attempt to return more than" in error.message):
+            return False
+        if self.chunksize <= 1:
+            return False
+        self.chunksize //= 2
+        self.maxsize = self.chunksize
+        log.debug("Chunk rejected as too large, reducing chunksize to %d",
+                  self.chunksize)
+        return True
+
 class Client(suds.client.Client):
  
     """A client accessing an ICAT service.
@@ -72,9 +401,77 @@ class Client(suds.client.Client):
         `http_proxy` and `https_proxy` and the URL of the respective
         proxy to use as values.
     :type proxy: :class:`dict`
+    :param cacheDir: Path to a directory to be used for caching
+        information about the ICAT server in order to speed up the
+        initialization of the client.  If set, the parsed service
+        definition (WSDL) and the schema information (entity names,
+        entity info, and authenticator info) will be cached in this
+        directory.  The cache is validated against the API version of
+        the server.  If not set, no caching will be done.
+    :type cacheDir: :class:`~pathlib.Path` or :class:`str`
+    :param connectionPool: If set, the HTTP connections to the ICAT
+        and the IDS server are kept open and taken from and returned
+        to this pool, so that they may be reused for later calls.
+        The pool may be shared between clients, in particular it is
+        shared with clones of this client.
+    :type connectionPool: :class:`icat.keepalive.ConnectionPool`
+    :param compression: If :const:`True`, ask the ICAT and the IDS
+        server to send compressed responses, see
+        :mod:`icat.compression`.  This saves network bandwidth for
+        large search results at the cost of some CPU time on both
+        sides.
+    :type compression: :class:`bool`
+    :param compressRequests: If set, requests to the ICAT server
+        having a body of at least this size in bytes are sent gzip
+        compressed.  This is mostly useful for
+        :meth:`~icat.client.Client.createMany` calls with many
+        objects.  Note that the ICAT server must be configured to
+        accept compressed requests.
+    :type compressRequests: :class:`int`
+    :param lazyTypemap: If :const:`True`, the entity classes in the
+        :attr:`typemap` are only created on demand, when they are
+        needed for the first time.  This saves the queries for the
+        entity info of those entity types that are not used.
+    :type lazyTypemap: :class:`bool`
+    :param fastDecode: If :const:`True`, decode the responses to
+        :meth:`search` calls using the faster decoder from
+        :mod:`icat.decoder`, rather than the generic one from Suds.
+        The decoder falls back to Suds for any response it does not
+        handle.
+    :type fastDecode: :class:`bool`
+    :param threadSafe: If :const:`True`, set up the client so that
+        API calls may be issued concurrently from several threads,
+        e.g. from the workers of a
+        :class:`~concurrent.futures.ThreadPoolExecutor`.  Each thread
+        uses its own transport to send the requests.  The session,
+        the typemap and the entity info cache are shared between all
+        threads.  See :ref:`client-threads` for the details.
+    :type threadSafe: :class:`bool`
+    :param resultCache: If set, the results of
+        :meth:`~icat.client.Client.search` and
+        :meth:`~icat.client.Client.get` calls are kept in this cache
+        and repeated calls with the same query in the same session
+        are answered from the cache.  The cache is invalidated for
+        the concerned entity types by the write calls of this client.
+        The cache may be shared between clients, in particular it is
+        shared with clones of this client.
+    :type resultCache: :class:`icat.resultcache.ResultCache`
+    :param identityMap: If :const:`True`, keep an
+        :class:`~icat.identitymap.IdentityMap` for the session, so
+        that the same object in the ICAT server is always represented
+        by the same entity object, see
+        :meth:`~icat.client.Client.getEntity`.  This saves memory for
+        search results with INCLUDE clauses, where the same related
+        object appears many times.
+    :type identityMap: :class:`bool`
     :param kwargs: additional keyword arguments that will be passed to
         :class:`suds.client.Client`, see :class:`suds.options.Options`
         for details.
+
+    .. versionchanged:: 1.8.0
+        add the `cacheDir`, `connectionPool`, `compression`,
+        `compressRequests`, `lazyTypemap`, `fastDecode`,
+        `threadSafe`, `resultCache`, and `identityMap` arguments.
     """
 
     Register = weakref.WeakValueDictionary()
@@ -118,7 +515,10 @@ class Client(suds.client.Client):
 
     def __init__(self, url, idsurl=None,
                  checkCert=True, caFile=None, caPath=None, sslContext=None,
-                 proxy=None, **kwargs):
+                 proxy=None, cacheDir=None, connectionPool=None,
+                 compression=False, compressRequests=None,
+                 lazyTypemap=False, fastDecode=False, threadSafe=False,
+                 resultCache=None, identityMap=False, **kwargs):
 
         """Initialize the client.
 
@@ -134,14 +534,31 @@ class Client(suds.client.Client):
         self.kwargs['caPath'] = caPath
         self.kwargs['sslContext'] = sslContext
         self.kwargs['proxy'] = proxy
+        self.kwargs['cacheDir'] = cacheDir
+        self.kwargs['connectionPool'] = connectionPool
+        self.kwargs['compression'] = compression
+        self.kwargs['compressRequests'] = compressRequests
+        self.kwargs['lazyTypemap'] = lazyTypemap
+        self.kwargs['fastDecode'] = fastDecode
+        self.kwargs['threadSafe'] = threadSafe
+        self.kwargs['resultCache'] = resultCache
+        self.kwargs['identityMap'] = identityMap
         idsurl = _complete_url(idsurl, default_path="/ids")
 
         self.apiversion = None
         self.entityInfoCache = {}
+        self._maxEntities = None
+        self.schemaCache = None
+        self.requestMarshaller = RequestMarshaller(self)
+        self.resultCache = resultCache
+        self.identityMap = IdentityMap() if identityMap else None
+        self.schemaIndex = SchemaIndex(self)
+        self.searchDecoder = SearchDecoder(self)
         self.typemap = None
         self.ids = None
         self.sessionId = None
         self.autoLogout = True
+        self._refreshLock = threading.Lock()
         self._schedule_auto_refresh("never")
 
         if sslContext:
@@ -151,14 +568,45 @@ class Client(suds.client.Client):
 
         if not proxy:
             proxy = {}
-        kwargs['transport'] = HTTPSTransport(self.sslContext, proxy=proxy)
+        if threadSafe:
+            factory = functools.partial(HTTPSTransport, self.sslContext,
+                                        pool=connectionPool,
+                                        compression=compression,
+                                        compressRequests=compressRequests)
+            kwargs['transport'] = ThreadLocalTransport(factory, proxy=proxy)
+        else:
+            kwargs['transport'] = HTTPSTransport(self.sslContext,
+                                                 pool=connectionPool,
+                                                 compression=compression,
+                                                 compressRequests=compressRequests,
+                                                 proxy=proxy)
+        wsdlCache = None
+        if cacheDir and 'cache' not in kwargs:
+            wsdlCache = WSDLCache(cacheDir)
+            kwargs['cache'] = wsdlCache
+            kwargs['cachingpolicy'] = 1
         super().__init__(self.url, **kwargs)
         self.apiversion = Version(self.getApiVersion())
+        if wsdlCache and not wsdlCache.check_version(self.apiversion):
+            # The service definition has been taken from a stale
+            # cache entry.  Need to read it again from the server.
+            super().__init__(self.url, **kwargs)
+            self.apiversion = Version(self.getApiVersion())
+            wsdlCache.check_version(self.apiversion)
+        if threadSafe:
+            _threadsafe_bindings(self.wsdl)
+            self.messages = _ThreadLocalMessages()
         log.debug("Connect to %s, ICAT version %s", url, self.apiversion)
 
         if self.apiversion < '4.3.0':
             warn(ClientVersionWarning(self.apiversion, "too old"))
-        self.typemap = getTypeMap(self)
+        if cacheDir:
+            self.schemaCache = SchemaCache(cacheDir, self.url)
+            if self.schemaCache.load(self.apiversion):
+                self.entityInfoCache.update(self.schemaCache.entityInfo)
+        self.typemap = getTypeMap(self, lazy=lazyTypemap)
+        if self.schemaCache and self.schemaCache.entityNames is None:
+            self.schemaCache.save(self)
 
         if idsurl:
             self.add_ids(idsurl)
@@ -188,6 +636,10 @@ class Client(suds.client.Client):
         if self.sessionId:
             idsargs['sessionId'] = self.sessionId
         idsargs['sslContext'] = self.sslContext
+        if self.kwargs.get('connectionPool') is not None:
+            idsargs['connectionPool'] = self.kwargs['connectionPool']
+        if self.kwargs.get('compression'):
+            idsargs['compression'] = True
         if proxy:
             idsargs['proxy'] = proxy
         self.ids = IDSClient(url, **idsargs)
@@ -287,11 +739,7 @@ class Client(suds.client.Client):
     def getEntityClass(self, name):
         """Return the Entity class corresponding to a BeanName.
         """
-        for c in self.typemap.values():
-            if name == c.BeanName:
-                return c
-        else:
-            raise EntityTypeError("Invalid entity type '%s'." % name)
+        return self.schemaIndex.getEntityClass(name)
 
     def getEntity(self, obj):
         """Get the corresponding :class:`icat.entity.Entity` for an object.
@@ -300,6 +748,11 @@ class Client(suds.client.Client):
         is any other Suds instance object, create a new entity object
         with :meth:`~icat.client.Client.new`.  Otherwise do nothing
         and return obj unchanged.
+
+        If the client has an :attr:`identityMap`, obj and all related
+        objects are first replaced by the canonical objects having
+        the same type and id and the same entity object is returned
+        for the same object each time.
         
         :param obj: either a Suds instance object or anything.
         :type obj: :class:`suds.sudsobject.Object` or any type
@@ -312,18 +765,46 @@ class Client(suds.client.Client):
         .. versionchanged:: 0.18.1
             changed the return type from :class:`list` to
             :class:`tuple` in the case of `fieldSet`.
+
+        .. versionchanged:: 1.8.0
+            use the :attr:`identityMap`.
         """
         if obj.__class__.__name__ == 'fieldSet':
             return tuple(obj.fields)
         elif isinstance(obj, suds.sudsobject.Object):
+            if self.identityMap is not None:
+                return self.identityMap.getEntity(obj, self.new)
             return self.new(obj)
         else:
             return obj
 
+    def _invalidateCache(self, beans, cascade=False):
+        """Invalidate the result cache for the types of beans.
+
+        If cascade is :const:`True`, also invalidate the types of
+        the objects that are deleted along with beans.
+        """
+        if self.resultCache is None:
+            return
+        types = set()
+        todo = [ Entity.getInstance(b).__class__.__name__ for b in beans ]
+        while todo:
+            t = todo.pop().lower()
+            if t in types:
+                continue
+            types.add(t)
+            if cascade:
+                cls = self.typemap[t]
+                for r in cls.InstMRel:
+                    todo.append(self.schemaIndex.getAttrInfo(cls, r).type)
+        self.resultCache.invalidate(types)
+
     # ==================== ICAT API methods ====================
 
     def login(self, auth, credentials):
         self.logout()
+        if self.identityMap is not None:
+            self.identityMap.clear()
         cred = self.factory.create("credentials")
         for k in credentials:
             cred.entry.append({ 'key': k, 'value': credentials[k] })
@@ -343,6 +824,8 @@ class Client(suds.client.Client):
                     raise translateError(e)
                 finally:
                     self.sessionId = None
+                    if self.identityMap is not None:
+                        self.identityMap.clear()
             except ICATSessionError:
                 # silently ignore ICATSessionError, e.g. an expired session.
                 pass
@@ -351,37 +834,58 @@ class Client(suds.client.Client):
         if getattr(bean, 'validate', None):
             bean.validate()
         try:
-            return self.service.create(self.sessionId, Entity.getInstance(bean))
+            return self.requestMarshaller.call("create", self.sessionId,
+                                               Entity.getInstance(bean))
         except suds.WebFault as e:
             raise translateError(e)
+        finally:
+            self._invalidateCache([bean])
 
     def createMany(self, beans):
         for b in beans:
             if getattr(b, 'validate', None):
                 b.validate()
         try:
-            return self.service.createMany(self.sessionId, Entity.getInstances(beans))
+            return self.requestMarshaller.call("createMany", self.sessionId,
+                                               Entity.getInstances(beans))
         except suds.WebFault as e:
             raise translateError(e)
+        finally:
+            self._invalidateCache(beans)
 
     def delete(self, bean):
         try:
             self.service.delete(self.sessionId, Entity.getInstance(bean))
         except suds.WebFault as e:
             raise translateError(e)
+        finally:
+            self._invalidateCache([bean], cascade=True)
 
     def deleteMany(self, beans):
         try:
             self.service.deleteMany(self.sessionId, Entity.getInstances(beans))
         except suds.WebFault as e:
             raise translateError(e)
+        finally:
+            self._invalidateCache(beans, cascade=True)
 
     def get(self, query, primaryKey):
+        query = str(query)
+        if self.resultCache is not None:
+            key = (self.url, self.sessionId, "get", query, primaryKey)
+            instance = self.resultCache.get(key)
+            if instance is not None:
+                return self.getEntity(instance)
         try:
-            instance = self.service.get(self.sessionId, str(query), primaryKey)
-            return self.getEntity(instance)
+            instance = self.requestMarshaller.call("get", self.sessionId,
+                                                   query, primaryKey)
         except suds.WebFault as e:
             raise translateError(e)
+        if self.resultCache is not None:
+            self.resultCache.put(key, instance,
+                                 _queryTypes(query, self.typemap,
+                                             self.schemaIndex))
+        return self.getEntity(instance)
 
     def getApiVersion(self):
         try:
@@ -390,6 +894,8 @@ class Client(suds.client.Client):
             raise translateError(e)
 
     def getAuthenticatorInfo(self):
+        if self.schemaCache and self.schemaCache.authenticatorInfo:
+            return self.schemaCache.authenticatorInfo
         try:
             return self.service.getAuthenticatorInfo()
         except suds.WebFault as e:
@@ -413,6 +919,8 @@ class Client(suds.client.Client):
         return info
 
     def getEntityNames(self):
+        if self.schemaCache and self.schemaCache.entityNames is not None:
+            return list(self.schemaCache.entityNames)
         try:
             return self.service.getEntityNames()
         except suds.WebFault as e:
@@ -457,17 +965,36 @@ class Client(suds.client.Client):
             raise translateError(e)
 
     def search(self, query):
+        query = str(query)
+        if self.resultCache is not None:
+            key = (self.url, self.sessionId, "search", query)
+            instances = self.resultCache.get(key)
+            if instances is not None:
+                return [self.getEntity(i) for i in instances]
         try:
-            instances = self.service.search(self.sessionId, str(query))
-            return [self.getEntity(i) for i in instances]
+            if self.kwargs['fastDecode']:
+                result = self.searchDecoder.search(self.sessionId, query)
+            else:
+                instances = self.requestMarshaller.call("search",
+                                                        self.sessionId, query)
+                result = [self.getEntity(i) for i in instances]
         except suds.WebFault as e:
             raise translateError(e)
+        if self.resultCache is not None:
+            instances = [ i.instance if isinstance(i, Entity) else i
+                          for i in result ]
+            self.resultCache.put(key, instances,
+                                 _queryTypes(query, self.typemap,
+                                             self.schemaIndex))
+        return result
 
     def update(self, bean):
         try:
             self.service.update(self.sessionId, Entity.getInstance(bean))
         except suds.WebFault as e:
             raise translateError(e)
+        finally:
+            self._invalidateCache([bean])
 
 
     # =================== custom API methods ===================
@@ -483,8 +1010,12 @@ class Client(suds.client.Client):
         causing too much needless load.
         """
         if time.time() > self._next_refresh:
-            self.refresh()
-            self._schedule_auto_refresh()
+            # Make sure that concurrent calls from several threads
+            # only refresh once.
+            with self._refreshLock:
+                if time.time() > self._next_refresh:
+                    self.refresh()
+                    self._schedule_auto_refresh()
 
     def assertedSearch(self, query, assertmin=1, assertmax=1):
         """Search with an assertion on the result.
@@ -519,7 +1050,41 @@ class Client(suds.client.Client):
         else:
             raise SearchAssertionError(query, assertmin, assertmax, num)
 
-    def searchChunked(self, query, skip=0, count=None, chunksize=100):
+    def _getMaxEntities(self):
+        """Return the maximum number of entities the ICAT server
+        returns in a search call or :const:`None` if not known.
+
+        The value is taken from the server properties once and then
+        cached.
+        """
+        if self._maxEntities is None:
+            try:
+                props = self.getProperties()
+                self._maxEntities = getattr(props, 'maxEntities', None) or 0
+            except suds.MethodNotFound:
+                self._maxEntities = 0
+        return self._maxEntities or None
+
+    def _searchChunks(self, chunked):
+        """Do the search calls for :meth:`searchChunked`, yielding the
+        result of each call.
+        """
+        while True:
+            query = chunked.nextQuery()
+            if query is None:
+                break
+            start = time.perf_counter()
+            try:
+                items = self.search(query)
+            except ICATValidationError as e:
+                if chunked.reject(e):
+                    continue
+                raise
+            chunked.addResult(items, time.perf_counter() - start)
+            yield items
+
+    def searchChunked(self, query, skip=0, count=None, chunksize=100,
+                      prefetch=0, keyset=False):
         """Search the ICAT server.
 
         Call the ICAT :meth:`~icat.client.Client.search` API method,
@@ -569,6 +1134,32 @@ class Client(suds.client.Client):
                     ds.complete = True
                     ds.update()
 
+            Alternatively, use keyset pagination, see below.
+
+        If `keyset` is :const:`True`, the chunks are not selected by
+        an offset in the LIMIT clause, but by the condition that the
+        id of the objects is larger than the id of the last object in
+        the previous chunk.  The result is ordered by id in this case,
+        any ORDER BY clause in the query is replaced.  The query must
+        return objects, e.g. it must be of the form ``SELECT o FROM
+        Entity o ...``.  The effort on the server side for each
+        search call does not grow with the offset then.  This is
+        significantly more efficient for large results.  Furthermore,
+        the result is not defective if objects are created or
+        deleted while iterating over it: each object that exists
+        during the whole iteration is yielded exactly once.
+
+        If `chunksize` is ``"auto"``, the chunk size starts with a
+        moderate value, but not more than the `maxEntities` property
+        of the ICAT server.  It is doubled after each search call
+        that took less than half a second and halved after each call
+        that took more than two seconds.  If the server rejects a
+        search call because the result would contain more than
+        `maxEntities` objects, which may happen for queries having
+        INCLUDE clauses, the chunk size is halved and the call is
+        repeated.  The chunk size does not grow beyond the reduced
+        size after that.
+
         :param query: the search query.
         :type query: :class:`icat.query.Query` or :class:`str`
         :param skip: offset from within the full list of available results.
@@ -578,34 +1169,198 @@ class Client(suds.client.Client):
         :type count: :class:`int`
         :param chunksize: number of items to query in each search
             call.  This is an internal tuning parameter and does not
-            affect the result.
-        :type chunksize: :class:`int`
+            affect the result.  If set to ``"auto"``, the chunk size
+            is adjusted automatically, see below.
+        :type chunksize: :class:`int` or :class:`str`
+        :param prefetch: if greater than zero, do the search calls in
+            a background thread, fetching up to this number of chunks
+            ahead of the items being yielded.  This allows the
+            processing of the items to overlap with the retrieval of
+            the next chunks.  The background thread is stopped if the
+            generator is closed.  Since the search calls are then
+            done concurrently to any calls done by the caller while
+            processing the items, this requires the client to be
+            created with the `threadSafe` argument set.
+        :type prefetch: :class:`int`
+        :param keyset: flag whether to use keyset pagination.
+        :type keyset: :class:`bool`
         :return: a generator that successively yields the items in the
             search result.
         :rtype: generator
+        :raise ValueError: if `keyset` is :const:`True` and the query
+            does not return objects or contains a LIMIT clause or if
+            `prefetch` is set and the client is not thread safe.
+
+        .. versionchanged:: 1.8.0
+            add the `prefetch` and `keyset` arguments and the
+            ``"auto"`` value for `chunksize`.
+        """
+        if prefetch > 0 and not self.kwargs['threadSafe']:
+            raise ValueError("prefetch requires a thread safe client.")
+        maxEntities = self._getMaxEntities() if chunksize == "auto" else None
+        chunked = _ChunkedSearch(query, skip, count, chunksize, keyset,
+                                 maxEntities)
+        chunks = self._searchChunks(chunked)
+        if prefetch > 0:
+            chunks = _prefetch([chunks], prefetch)
+        for items in chunks:
+            yield from items
+
+    def _idRanges(self, query, partitions):
+        """Split the range of ids of the objects matching query.
         """
-        if isinstance(query, Query):
-            query = str(query)
-        query = query.replace('%', '%%')
-        if query.startswith("SELECT"):
-            query += " LIMIT %d, %d"
+        q = query.copy()
+        q.setOrder(None)
+        q.includes = set()
+        q.setAttributes("id")
+        bounds = []
+        for function in ("MIN", "MAX"):
+            q.setAggregate(function)
+            res = self.search(q)
+            if not res or res[0] is None:
+                return []
+            bounds.append(int(res[0]))
+        low, high = bounds
+        width = high - low + 1
+        n = max(min(partitions, width), 1)
+        edges = [ low + width * i // n for i in range(n + 1) ]
+        return [ (edges[i], edges[i+1] - 1) for i in range(n) ]
+
+    def searchPartitioned(self, query, partitions=4, ordered=False,
+                          chunksize=100, prefetch=1):
+        """Search the ICAT server, scanning ranges of ids concurrently.
+
+        Determine the minimum and the maximum id of the objects
+        matching the query, split this range into partitions and
+        search each partition with
+        :meth:`~icat.client.Client.searchChunked`.  This is intended
+        for scanning large parts of the content of an ICAT server,
+        where the search calls should rather be done in parallel.
+
+        If the client has been created with the `threadSafe` argument
+        set, each partition is searched in a separate background
+        thread.  The search calls are then done concurrently to each
+        other and to any calls done by the caller while processing
+        the items.  Otherwise, the partitions are searched one after
+        the other in the thread of the caller.
+
+        :param query: the search query.  It must not have a LIMIT
+            clause.
+        :type query: :class:`icat.query.Query`
+        :param partitions: number of partitions to split the range of
+            ids into.  This is also the number of background threads
+            for a thread safe client.
+        :type partitions: :class:`int`
+        :param ordered: if :const:`True`, merge the results from the
+            partitions so that the order defined by the ORDER BY
+            clause of the query is preserved.  This is only supported
+            for queries returning objects, and if the ORDER BY clause
+            consists of plain attributes, without JPQL functions.
+            Note that the order of the merged result follows the
+            comparison of the attribute values in Python, which might
+            differ from the order in the database, in particular for
+            null values and string collation.  Attributes of related
+            objects in the ORDER BY clause must be included in the
+            query.  If `ordered` is :const:`False`, the items from the
+            partitions are yielded in the order in which they arrive.
+        :type ordered: :class:`bool`
+        :param chunksize: number of items to query in each search
+            call.  May be ``"auto"`` as in
+            :meth:`~icat.client.Client.searchChunked`.
+        :type chunksize: :class:`int` or :class:`str`
+        :param prefetch: number of chunks to fetch ahead in each
+            partition.  This is ignored if the client is not thread
+            safe.
+        :type prefetch: :class:`int`
+        :return: a generator that yields the items in the search
+            result.
+        :rtype: generator
+        :raise TypeError: if `query` is not a
+            :class:`~icat.query.Query`.
+        :raise ValueError: if the query has a LIMIT clause or if
+            `ordered` is :const:`True` and the result cannot be
+            merged.
+
+        .. versionadded:: 1.8.0
+        """
+        if not isinstance(query, Query):
+            raise TypeError("query must be a Query object")
+        if query.limit:
+            raise ValueError("the query must not have a limit")
+        returnsObjects = (not query.attributes and
+                          query.aggregate in (None, "DISTINCT"))
+        if ordered:
+            if not returnsObjects:
+                raise ValueError("Cannot merge results of a query "
+                                 "not returning objects")
+            key = _orderKey(query)
+        maxEntities = self._getMaxEntities() if chunksize == "auto" else None
+        chunks = []
+        for low, high in self._idRanges(query, partitions):
+            q = query.copy()
+            q.addConditions({"id": [">= %d" % low, "<= %d" % high]})
+            # Keyset pagination is faster, but only possible if we
+            # don't need to keep the order of the query.
+            chunked = _ChunkedSearch(q, chunksize=chunksize,
+                                     keyset=(returnsObjects and not ordered),
+                                     maxEntities=maxEntities)
+            chunks.append(self._searchChunks(chunked))
+        prefetch = max(prefetch, 1)
+        threaded = self.kwargs['threadSafe']
+        if ordered:
+            if threaded:
+                streams = [ _prefetch([c], prefetch) for c in chunks ]
+            else:
+                streams = chunks
+            try:
+                decorated = [ _decorate(s, key, i)
+                              for i, s in enumerate(streams) ]
+                for k, obj in heapq.merge(*decorated):
+                    yield obj
+            finally:
+                for s in streams:
+                    s.close()
+        elif threaded:
+            for items in _prefetch(chunks, prefetch):
+                yield from items
         else:
-            query = "%d, %d " + query
-        if chunksize < 2:
-            chunksize = 2
-        delivered = 0
-        while True:
-            if count is not None and count - delivered < chunksize:
-                chunksize = count - delivered
-            if chunksize == 0:
-                break
-            items = self.search(query % (skip, chunksize))
-            skip += chunksize
-            for o in items:
-                yield o
-                delivered += 1
-            if len(items) < chunksize:
-                break
+            for c in chunks:
+                for items in c:
+                    yield from items
+
+    def searchStream(self, query):
+        """Search the ICAT server, yielding the result while it arrives.
+
+        Call the ICAT :meth:`~icat.client.Client.search` API method,
+        but parse the response incrementally while it is still being
+        received from the server.  The items in the search result are
+        yielded as soon as they are complete, so that processing may
+        start before the full response has arrived.  Only one item at
+        a time needs to be kept in memory, unless the caller keeps
+        references to them.
+
+        The response is always parsed with the decoder from
+        :mod:`icat.decoder`, regardless of the `fastDecode` argument
+        to the client.  Note that unlike
+        :meth:`~icat.client.Client.searchChunked`, this does a single
+        search call, so the number of items in the result is still
+        subject to the limit imposed by the ICAT server.
+
+        :param query: the search query.
+        :type query: :class:`icat.query.Query` or :class:`str`
+        :return: a generator that successively yields the items in the
+            search result.
+        :rtype: generator
+        :raise ICATError: in case of exceptions raised by the ICAT
+            server.
+
+        .. versionadded:: 1.8.0
+        """
+        try:
+            yield from self.searchDecoder.iterSearch(self.sessionId,
+                                                     str(query))
+        except suds.WebFault as e:
+            raise translateError(e)
 
     def searchUniqueKey(self, key, objindex=None):
         """Search the object that belongs to a unique key.
@@ -633,28 +1388,145 @@ class Client(suds.client.Client):
 
         if objindex is not None and key in objindex:
             return objindex[key]
+        beanname, attrs, rels = self._parseUniqueKey(key)
+        query = Query(self, beanname)
+        for attr, value in attrs.items():
+            query.addConditions({attr: "= '%s'" % value})
+        for attr, rk in rels.items():
+            ro = self.searchUniqueKey(rk, objindex)
+            query.addConditions({"%s.id" % attr: "= %d" % ro.id})
+        obj = self.assertedSearch(query)[0]
+        if objindex is not None:
+            objindex[key] = obj
+        return obj
+
+    def _parseUniqueKey(self, key):
+        """Parse a unique key into the BeanName, the values of the
+        attributes, and the keys of the related objects.
+        """
         us = key.index('_')
         beanname = key[:us]
         av = parse_attr_val(key[us+1:])
         info = self.getEntityInfo(beanname)
-        query = Query(self, beanname)
+        attrs = {}
+        rels = {}
         for f in info.fields:
             if f.name in av.keys():
                 attr = f.name
                 if f.relType == "ATTRIBUTE":
-                    cond = "= '%s'" % simpleqp_unquote(av[attr])
-                    query.addConditions({attr:cond})
+                    attrs[attr] = simpleqp_unquote(av[attr])
                 elif f.relType == "ONE":
-                    rk = str("%s_%s" % (f.type, av[attr]))
-                    ro = self.searchUniqueKey(rk, objindex)
-                    query.addConditions({"%s.id" % attr:"= %d" % ro.id})
+                    rels[attr] = str("%s_%s" % (f.type, av[attr]))
                 else:
                     raise ValueError("malformed '%s': invalid attribute '%s'" 
                                      % (key, attr))
-        obj = self.assertedSearch(query)[0]
-        if objindex is not None:
-            objindex[key] = obj
-        return obj
+        return beanname, attrs, rels
+
+    def _searchUniqueKeyBatch(self, beanname, keys, parsed, objindex):
+        """Search the objects for a batch of unique keys of the same
+        type in one query and add those found to objindex.
+        """
+        def signature(attrs, relids):
+            return (tuple(sorted(attrs.items())),
+                    tuple(sorted(relids.items())))
+        conditions = []
+        signatures = {}
+        includes = set()
+        for key in keys:
+            _, attrs, rels = parsed[key]
+            relids = { a: objindex[rk].id for a, rk in rels.items() }
+            conds = [ "o.%s = '%s'" % (a, v.replace("'", "''"))
+                      for a, v in sorted(attrs.items()) ]
+            conds += [ "o.%s.id = %d" % (a, relids[a]) for a in sorted(relids) ]
+            conditions.append("(%s)" % " AND ".join(conds))
+            signatures[signature(attrs, relids)] = key
+            includes.update("o.%s" % a for a in rels)
+        query = ("SELECT o FROM %s o WHERE %s"
+                 % (beanname, " OR ".join(conditions)))
+        if includes:
+            query += " INCLUDE %s" % ", ".join(sorted(includes))
+        _, attrs, rels = parsed[keys[0]]
+        matches = {}
+        for obj in self.search(query):
+            objattrs = { a: str(getattr(obj, a, None)) for a in attrs }
+            relids = {}
+            for a in rels:
+                robj = getattr(obj, a, None)
+                relids[a] = robj.id if robj is not None else None
+            key = signatures.get(signature(objattrs, relids))
+            if key is not None:
+                matches.setdefault(key, []).append(obj)
+        for key, objs in matches.items():
+            # Leave any ambiguous results, e.g. due to case
+            # insensitive collation in the database, to the fallback
+            # in searchUniqueKeys().
+            if len(objs) == 1:
+                objindex[key] = objs[0]
+
+    def searchUniqueKeys(self, keys, objindex=None, chunksize=100):
+        """Search the objects that belong to a list of unique keys.
+
+        This is a batched version of
+        :meth:`~icat.client.Client.searchUniqueKey`.  The keys,
+        including the keys of related objects they refer to, are
+        grouped by their entity type.  The objects for each group
+        are searched in a few queries combining the conditions for
+        the individual keys with OR.  Related objects are searched
+        before the objects referring to them.  Any key that could not
+        be resolved this way is finally searched individually using
+        :meth:`~icat.client.Client.searchUniqueKey`, which raises the
+        appropriate error if the object is not found.
+
+        :param keys: the unique keys of the objects to search for.
+        :type keys: iterable of :class:`str`
+        :param objindex: cache of entity objects, see
+            :meth:`~icat.client.Client.searchUniqueKey`.  All objects
+            retrieved, including the related objects, will be added
+            to this index.
+        :type objindex: :class:`dict`
+        :param chunksize: maximum number of keys to search for in one
+            query.  This is an internal tuning parameter and does not
+            affect the result.
+        :type chunksize: :class:`int`
+        :return: the objects corresponding to the keys, in the same
+            order.
+        :rtype: :class:`list` of :class:`icat.entity.Entity`
+        :raise SearchResultError: if any of the objects has not been
+            found.
+        :raise ValueError: if any of the keys is not well formed.
+
+        .. versionadded:: 1.8.0
+        """
+        keys = list(keys)
+        if objindex is None:
+            objindex = {}
+        parsed = {}
+        todo = list(keys)
+        while todo:
+            key = todo.pop()
+            if key in parsed or key in objindex:
+                continue
+            parsed[key] = self._parseUniqueKey(key)
+            todo.extend(parsed[key][2].values())
+        while parsed:
+            # Resolve the keys whose related objects are all known.
+            ready = [ k for k, (_, _, rels) in parsed.items()
+                      if all(rk in objindex for rk in rels.values()) ]
+            groups = {}
+            for k in ready:
+                beanname, attrs, rels = parsed[k]
+                sig = (beanname, tuple(sorted(attrs)), tuple(sorted(rels)))
+                groups.setdefault(sig, []).append(k)
+            for (beanname, _, _), group in groups.items():
+                for i in range(0, len(group), chunksize):
+                    self._searchUniqueKeyBatch(beanname,
+                                               group[i:i+chunksize],
+                                               parsed, objindex)
+            for k in ready:
+                if k not in objindex:
+                    self.searchUniqueKey(k, objindex)
+                del parsed[k]
+        return [ objindex[k] for k in keys ]
 
     def searchMatching(self, obj, includes=None):
         """Search the matching object.
@@ -681,23 +1553,418 @@ class Client(suds.client.Client):
             uniqueness constraint or if any attribute needed for the
             constraint is not set.
         """
+        query = self._matchingQuery(obj, self._matchingValues(obj), includes)
+        return self.assertedSearch(query)[0]
+
+    def _matchingValues(self, obj):
+        """Return the values of the attributes in the uniqueness
+        constraint of obj, taking the id for related objects.
+        """
         if 'id' in obj.Constraint:
-            raise ValueError("%s does not have a uniqueness constraint.")
-        query = Query(self, obj.BeanName, includes=includes)
+            raise ValueError("%s does not have a uniqueness constraint."
+                             % obj.BeanName)
+        values = {}
         for a in obj.Constraint:
             v = getattr(obj, a)
             if v is None:
                 raise ValueError("%s is not set" % a)
             if a in obj.InstAttr:
-                query.addConditions({a: "= '%s'" % v})
+                values[a] = v
             elif a in obj.InstRel:
                 if v.id is None:
                     raise ValueError("%s.id is not set" % a)
-                query.addConditions({"%s.id" % a: "= %d" % v.id})
+                values[a] = v.id
             else:
                 raise InternalError("Invalid constraint '%s' in %s."
                                     % (a, obj.BeanName))
-        return self.assertedSearch(query)[0]
+        return values
+
+    def _matchingQuery(self, obj, values, includes):
+        """Return the query searching the object matching obj.
+        """
+        query = Query(self, obj.BeanName, includes=includes)
+        for a, v in values.items():
+            if a in obj.InstAttr:
+                v = str(v).replace("'", "''")
+                query.addConditions({a: "= '%s'" % v})
+            else:
+                query.addConditions({"%s.id" % a: "= %d" % v})
+        return query
+
+    def _searchMatchingBatch(self, beanname, items, includes):
+        """Search the objects matching a batch of (index, obj, values)
+        items of the same type in one query.
+
+        Return a dict mapping the indices to the objects found and a
+        list of the items that need to be searched individually.
+        """
+        def signature(values):
+            return tuple(sorted((a, str(v)) for a, v in values.items()))
+        def similar(values, other):
+            # Whether a result having values that could not be
+            # assigned may still match an object having the other
+            # values, e.g. due to case insensitive collation in the
+            # database or different representations of the values.
+            for a in rels:
+                if values[a] != other[a]:
+                    return False
+            for a in attrs:
+                v, w = values[a], other[a]
+                if (isinstance(v, str) and isinstance(w, str) and
+                    v.casefold() != w.casefold()):
+                    return False
+            return True
+        obj = items[0][1]
+        attrs = [ a for a in obj.Constraint if a in obj.InstAttr ]
+        rels = [ a for a in obj.Constraint if a in obj.InstRel ]
+        conditions = []
+        signatures = {}
+        for item in items:
+            _, _, values = item
+            conds = [ "o.%s = '%s'" % (a, str(values[a]).replace("'", "''"))
+                      for a in attrs ]
+            conds += [ "o.%s.id = %d" % (a, values[a]) for a in rels ]
+            conditions.append("(%s)" % " AND ".join(conds))
+            signatures.setdefault(signature(values), []).append(item)
+        query = ("SELECT o FROM %s o WHERE %s"
+                 % (beanname, " OR ".join(conditions)))
+        if includes == "1":
+            incl = set(obj.InstRel)
+        else:
+            incl = set(includes or ())
+        incl.update(rels)
+        if incl:
+            query += " %s" % Query(self, beanname, includes=incl).include_clause
+        matches = {}
+        strays = []
+        for res in self.search(query):
+            values = { a: getattr(res, a, None) for a in attrs }
+            for a in rels:
+                robj = getattr(res, a, None)
+                values[a] = robj.id if robj is not None else None
+            sig = signature(values)
+            if sig in signatures:
+                matches.setdefault(sig, []).append(res)
+            else:
+                strays.append(values)
+        found = {}
+        retry = []
+        for sig, sigitems in signatures.items():
+            objs = matches.get(sig, [])
+            if len(objs) == 1:
+                for idx, _, _ in sigitems:
+                    found[idx] = objs[0]
+            elif objs or any(similar(v, sigitems[0][2]) for v in strays):
+                # Either ambiguous or some result that could not be
+                # assigned may match.  Leave these to an individual
+                # search.
+                retry.extend(sigitems)
+        return found, retry
+
+    def searchMatchingMany(self, objs, includes=None, chunksize=100):
+        """Search the matching objects for a list of objects.
+
+        This is a batched version of
+        :meth:`~icat.client.Client.searchMatching`.  The objects are
+        grouped by their entity type.  The matching objects for each
+        group are searched in a few queries combining the conditions
+        for the individual objects with OR.
+
+        >>> datasets = [ client.new("Dataset", investigation=inv, name=n)
+        ...              for n in ("e201215", "e201216", "nonexistent") ]
+        >>> [ ds.id if ds else None
+        ...   for ds in client.searchMatchingMany(datasets) ]
+        [172383, 172384, None]
+
+        :param objs: entity objects having the attributes for the
+            uniqueness constraint set accordingly.
+        :type objs: iterable of :class:`icat.entity.Entity`
+        :param includes: list of related objects to add to the INCLUDE
+            clause of the search queries.
+            See :meth:`icat.query.Query.addIncludes` for details.
+        :type includes: iterable of :class:`str`
+        :param chunksize: maximum number of objects to search for in
+            one query.  This is an internal tuning parameter and does
+            not affect the result.
+        :type chunksize: :class:`int`
+        :return: the corresponding objects, in the same order as the
+            input.  :const:`None` is taken for any object for which
+            no match has been found.
+        :rtype: :class:`list` of :class:`icat.entity.Entity`
+        :raise SearchAssertionError: if more than one object matches.
+        :raise ValueError: if the class of any of the objects does not
+            have a uniqueness constraint or if any attribute needed
+            for the constraint is not set.
+
+        .. versionadded:: 1.8.0
+        """
+        objs = list(objs)
+        if includes is not None and includes != "1":
+            includes = list(includes)
+        groups = {}
+        for idx, obj in enumerate(objs):
+            values = self._matchingValues(obj)
+            groups.setdefault(obj.BeanName, []).append((idx, obj, values))
+        result = [None] * len(objs)
+        for beanname, group in groups.items():
+            for i in range(0, len(group), chunksize):
+                found, retry = self._searchMatchingBatch(beanname,
+                                                         group[i:i+chunksize],
+                                                         includes)
+                for idx, obj in found.items():
+                    result[idx] = obj
+                for idx, obj, values in retry:
+                    query = self._matchingQuery(obj, values, includes)
+                    res = self.assertedSearch(query, assertmin=0)
+                    if res:
+                        result[idx] = res[0]
+        return result
+
+    def _itemSize(self, instance):
+        """Return the approximate size in bytes of an object in the
+        request of a createMany call.
+        """
+        try:
+            return self.requestMarshaller.itemSize("createMany", 1, instance)
+        except ValueError:
+            # Not handled by the marshaller.  Take a rough guess,
+            # the XML is somewhat more verbose than the string
+            # representation of the Suds object.
+            return 2 * len(str(instance))
+
+    def createStream(self, objs, batchSize="auto", maxBytes=1048576):
+        """Create objects from an iterable in batches.
+
+        Consume the objects from the iterable and create them in the
+        ICAT server with :meth:`~icat.client.Client.createMany` calls.
+        The ids returned from the server are set in the objects.  As
+        opposed to calling :meth:`~icat.client.Client.createMany`
+        directly, the iterable may be a generator and need not fit
+        into memory at once.
+
+        If `batchSize` is "auto", each batch is filled until the
+        size of the request reaches `maxBytes`.  An object too large
+        on its own is sent in a batch of its own.
+
+        The throughput is logged at the end.  In case of an error,
+        the objects from previous batches have been created and have
+        their ids set, while the objects in the failing batch and the
+        remaining objects have not been created.
+
+        >>> datafiles = ( client.new("Datafile", dataset=dataset, name=n)
+        ...               for n in names )
+        >>> client.createStream(datafiles)
+        12000
+
+        :param objs: new objects to create.
+        :type objs: iterable of :class:`icat.entity.Entity`
+        :param batchSize: the number of objects to send in one call
+            or "auto" to determine it from the size of the objects.
+        :type batchSize: :class:`int` or :class:`str`
+        :param maxBytes: the maximum size of a request in bytes if
+            `batchSize` is "auto".  The size is an estimate.  It
+            should stay below the limit for requests configured in
+            the application server of the ICAT server.
+        :type maxBytes: :class:`int`
+        :return: the number of objects created.
+        :rtype: :class:`int`
+        :raise ICATError: in case of exceptions raised by the ICAT
+            server.
+
+        .. versionadded:: 1.8.0
+        """
+        if batchSize == "auto":
+            maxcount = None
+        elif isinstance(batchSize, int) and batchSize > 0:
+            maxcount = batchSize
+            maxBytes = None
+        else:
+            raise ValueError("Invalid batchSize %r." % (batchSize,))
+        count = 0
+        nbytes = 0
+        start = time.monotonic()
+        batch = []
+        batchBytes = 0
+
+        def flush():
+            ids = self.createMany(batch)
+            for obj, objid in zip(batch, ids):
+                obj.id = objid
+            log.debug("createStream: created %d objects in %d bytes",
+                      len(batch), batchBytes)
+
+        for obj in objs:
+            size = self._itemSize(Entity.getInstance(obj)) if maxBytes else 0
+            if batch and ((maxcount and len(batch) >= maxcount) or
+                          (maxBytes and batchBytes + size > maxBytes)):
+                flush()
+                count += len(batch)
+                nbytes += batchBytes
+                batch = []
+                batchBytes = 0
+            batch.append(obj)
+            batchBytes += size
+        if batch:
+            flush()
+            count += len(batch)
+            nbytes += batchBytes
+        elapsed = time.monotonic() - start
+        if count and elapsed > 0:
+            if maxBytes:
+                log.info("createStream: created %d objects in %.2f s "
+                         "(%.1f objects/s, %.1f kB/s)", count, elapsed,
+                         count / elapsed, nbytes / elapsed / 1024)
+            else:
+                log.info("createStream: created %d objects in %.2f s "
+                         "(%.1f objects/s)", count, elapsed, count / elapsed)
+        return count
+
+    def tryCreateMany(self, beans):
+        """Create many objects, skipping those that fail.
+
+        The ICAT server rolls back a
+        :meth:`~icat.client.Client.createMany` call as a whole if
+        any of the objects fails, but indicates the failing object in
+        the `offset` attribute of the error.
+        This method takes this object out and repeats the call with
+        the remaining objects, until all of them are either created
+        or have failed.  This takes one call per failing object, plus
+        one.  The ids of the objects created are set in the objects.
+
+        >>> objs = [ client.new("Dataset", investigation=inv, name=n)
+        ...          for n in ("e201215", "e201216", "e201217") ]
+        >>> client.tryCreateMany(objs)
+        [172385, ICATObjectExistsError('Dataset exists ...'), 172386]
+
+        :param beans: the objects to create.
+        :type beans: iterable of :class:`icat.entity.Entity`
+        :return: the outcome for each of the objects, in the same
+            order: either the id of the object created or the
+            exception raised for the object.  The exception is either
+            an :exc:`~icat.exception.ICATError` raised by the ICAT
+            server or a :exc:`ValueError` raised by the validation
+            hook of the object.
+        :rtype: :class:`list`
+        :raise ICATError: if the server raises an error that does not
+            refer to a particular object, such as
+            :exc:`~icat.exception.ICATSessionError`.
+
+        .. versionadded:: 1.8.0
+        """
+        beans = list(beans)
+        outcome = [None] * len(beans)
+        pending = []
+        for i, b in enumerate(beans):
+            try:
+                if getattr(b, 'validate', None):
+                    b.validate()
+            except ValueError as e:
+                outcome[i] = e
+            else:
+                pending.append(i)
+        while pending:
+            try:
+                ids = self.createMany([ beans[i] for i in pending ])
+            except ICATError as e:
+                if e.offset is None or e.offset >= len(pending):
+                    raise
+                log.debug("tryCreateMany: %s at offset %d, retrying %d "
+                          "objects", e.type, e.offset, len(pending) - 1)
+                outcome[pending.pop(e.offset)] = e
+            else:
+                for i, objid in zip(pending, ids):
+                    outcome[i] = objid
+                    beans[i].id = objid
+                break
+        return outcome
+
+    def upsertMany(self, objs, mode="OVERWRITE"):
+        """Create objects or take the matching existing ones.
+
+        This does for a list of objects what the `--duplicate` option
+        of :ref:`icatingest` does for each object.  The existing
+        objects matching the objects in their uniqueness constraint
+        are searched with
+        :meth:`~icat.client.Client.searchMatchingMany`.  The objects
+        having no match are created with
+        :meth:`~icat.client.Client.createStream`.  For those having a
+        match, `mode` determines what happens:
+
+        IGNORE
+            The existing object is taken as is.
+
+        CHECK
+            The attributes set in the object are compared to the
+            existing one.  If any of them differs,
+            :exc:`~icat.exception.ICATObjectExistsError` is raised.
+            The check is done for all objects before creating any.
+
+        OVERWRITE
+            The attributes set in the object are set in the existing
+            one.  The existing object is updated if any of them
+            differs.
+
+        In all cases, the ids of the created or existing objects are
+        set in the objects.  Only objects having no one to many
+        relations set are supported, as with :ref:`icatingest`.
+
+        :param objs: the objects.
+        :type objs: iterable of :class:`icat.entity.Entity`
+        :param mode: what to do with existing objects, one of
+            "IGNORE", "CHECK", or "OVERWRITE".
+        :type mode: :class:`str`
+        :return: the ids of the objects, in the same order.
+        :rtype: :class:`list` of :class:`int`
+        :raise ValueError: if `mode` is invalid, if any of the objects
+            has one to many relations set, or see
+            :meth:`~icat.client.Client.searchMatchingMany`.
+        :raise ICATObjectExistsError: if `mode` is "CHECK" and any
+            object differs from the existing one.
+
+        .. versionadded:: 1.8.0
+        """
+        if mode not in ("IGNORE", "CHECK", "OVERWRITE"):
+            raise ValueError("Invalid mode '%s'." % mode)
+        objs = list(objs)
+        for obj in objs:
+            for r in obj.InstMRel:
+                if getattr(obj, r):
+                    raise ValueError("Cannot %s %s if %s is not empty."
+                                     % (mode, obj.BeanName, r))
+        matches = self.searchMatchingMany(objs, includes="1")
+        updates = []
+        for obj, dobj in zip(objs, matches):
+            if dobj is None or mode == "IGNORE":
+                continue
+            changed = {}
+            for a in obj.InstAttr - {'id'}:
+                v = getattr(obj, a)
+                if v is None:
+                    continue
+                if isinstance(v, str):
+                    cv = parse_attr_string(v, obj.getAttrType(a))
+                else:
+                    cv = v
+                if getattr(dobj, a) != cv:
+                    changed[a] = v
+            if not changed:
+                continue
+            if mode == "CHECK":
+                raise ICATObjectExistsError("%s %s exists with different "
+                                            "values for %s"
+                                            % (obj.BeanName, dobj.id,
+                                               ", ".join(sorted(changed))))
+            for a, v in changed.items():
+                setattr(dobj, a, v)
+            updates.append(dobj)
+        for dobj in updates:
+            self.update(dobj)
+        for obj, dobj in zip(objs, matches):
+            if dobj is not None:
+                obj.id = dobj.id
+        self.createStream(obj for obj, dobj in zip(objs, matches)
+                          if dobj is None)
+        return [ obj.id for obj in objs ]
 
     def createUser(self, name, search=False, **kwargs):
         """Search a user by name or create a new user.
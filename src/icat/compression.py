@@ -0,0 +1,256 @@
+"""HTTP compression for urllib.
+
+.. note::
+   This module is mostly intended for the internal use in python-icat.
+   Most users will not need to use it directly, but rather set the
+   `compression` argument of :class:`icat.client.Client`.
+
+The urllib handlers from the standard library neither ask the server
+for compressed responses nor decode them.  This module provides a
+handler that does both: it sends an ``Accept-Encoding`` header and
+wraps compressed responses in a reader that decompresses the content
+on the fly while it is being read, so that the caller sees the plain
+content.  Optionally, the handler also compresses request bodies
+exceeding a given size.
+
+.. versionadded:: 1.8.0
+"""
+
+import gzip
+import http.client
+import logging
+import urllib.request
+import zlib
+
+__all__ = ['CompressionHandler', 'DecodingResponse', 'decompress']
+
+log = logging.getLogger(__name__)
+
+ACCEPT_ENCODING = "gzip, deflate"
+"""The value of the ``Accept-Encoding`` header sent by the handler.
+"""
+
+
+def decompress(data, encoding):
+    """Decode content that has been received in full.
+
+    :param data: the encoded content.
+    :type data: :class:`bytes`
+    :param encoding: the content encoding.  Must either be ``gzip``
+        or ``deflate``.
+    :type encoding: :class:`str`
+    :return: the decoded content.
+    :rtype: :class:`bytes`
+    :raise ValueError: if the encoding is not supported.
+    """
+    encoding = encoding.strip().lower()
+    if encoding in ("gzip", "x-gzip"):
+        return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+    elif encoding == "deflate":
+        # See the comment in DecodingResponse on raw deflate data.
+        try:
+            return zlib.decompress(data)
+        except zlib.error:
+            return zlib.decompress(data, -zlib.MAX_WBITS)
+    else:
+        raise ValueError("unsupported content encoding '%s'" % encoding)
+
+
+class DecodingResponse():
+    """Wrap a HTTP response, decoding the content while reading it.
+
+    The wrapper provides the methods of the response needed to read
+    the content.  All other attributes are taken from the wrapped
+    response.  The headers presented by the wrapper do not contain
+    ``Content-Encoding`` and ``Content-Length``, as these do not
+    apply to the decoded content.
+
+    :param response: the HTTP response.
+    :type response: :class:`http.client.HTTPResponse`
+    :param encoding: the content encoding of the response.  Must
+        either be ``gzip`` or ``deflate``.
+    :type encoding: :class:`str`
+    :raise ValueError: if the encoding is not supported.
+    """
+
+    ChunkSize = 65536
+    """Maximum size of the chunks read from the wrapped response and
+    of the chunks of decoded data produced at a time.
+    """
+
+    def __init__(self, response, encoding):
+        self.response = response
+        encoding = encoding.strip().lower()
+        if encoding in ("gzip", "x-gzip"):
+            self._decomp = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == "deflate":
+            # Many servers send raw deflate data rather than the zlib
+            # format required by the HTTP standard.  Determine the
+            # format from the first chunk.
+            self._decomp = None
+        else:
+            raise ValueError("unsupported content encoding '%s'" % encoding)
+        self.encoding = encoding
+        self._read = getattr(response, "read1", response.read)
+        self._buffer = b""
+        self._eof = False
+        self.headers = http.client.HTTPMessage()
+        for k, v in response.headers.items():
+            if k.lower() not in ('content-encoding', 'content-length'):
+                self.headers[k] = v
+
+    def __getattr__(self, attr):
+        return getattr(self.response, attr)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.close()
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                break
+            yield line
+
+    def _decompress(self, data):
+        if self._decomp is None:
+            try:
+                decomp = zlib.decompressobj()
+                chunk = decomp.decompress(data, self.ChunkSize)
+            except zlib.error:
+                decomp = zlib.decompressobj(-zlib.MAX_WBITS)
+                chunk = decomp.decompress(data, self.ChunkSize)
+            self._decomp = decomp
+            return chunk
+        else:
+            return self._decomp.decompress(data, self.ChunkSize)
+
+    def _fill(self):
+        """Decode more data into the buffer.  Return :const:`False`
+        if the end of the content has been reached.
+        """
+        while not self._buffer:
+            if self._eof:
+                return False
+            if self._decomp is not None and self._decomp.unconsumed_tail:
+                data = self._decomp.unconsumed_tail
+            else:
+                data = self._read(self.ChunkSize)
+            if data:
+                self._buffer = self._decompress(data)
+            else:
+                if self._decomp is not None:
+                    self._buffer = self._decomp.flush()
+                self._eof = True
+        return True
+
+    def info(self):
+        return self.headers
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name, default)
+
+    def getheaders(self):
+        return self.headers.items()
+
+    def read1(self, amt=-1):
+        """Read and return up to `amt` bytes of decoded data, with at
+        most one read from the wrapped response.
+        """
+        if not self._fill():
+            return b""
+        if amt is None or amt < 0 or amt >= len(self._buffer):
+            data, self._buffer = self._buffer, b""
+        else:
+            data, self._buffer = self._buffer[:amt], self._buffer[amt:]
+        return data
+
+    def read(self, amt=None):
+        """Read and return up to `amt` bytes of decoded data, or all
+        remaining data if `amt` is :const:`None`.
+        """
+        chunks = []
+        while amt is None or amt < 0 or amt > 0:
+            data = self.read1(amt)
+            if not data:
+                break
+            chunks.append(data)
+            if amt is not None and amt >= 0:
+                amt -= len(data)
+        return b"".join(chunks)
+
+    def readline(self, limit=-1):
+        """Read and return one line of decoded data.
+        """
+        chunks = []
+        while limit < 0 or limit > 0:
+            if not self._fill():
+                break
+            pos = self._buffer.find(b"\n") + 1
+            if not pos:
+                pos = len(self._buffer)
+            if limit >= 0:
+                pos = min(pos, limit)
+                limit -= pos
+            chunks.append(self._buffer[:pos])
+            self._buffer = self._buffer[pos:]
+            if chunks[-1].endswith(b"\n"):
+                break
+        return b"".join(chunks)
+
+    def close(self):
+        self._buffer = b""
+        self.response.close()
+
+
+class CompressionHandler(urllib.request.BaseHandler):
+    """A urllib handler for HTTP compression.
+
+    Ask the server for compressed responses and decode them.  This
+    handler must be combined with the regular handlers for HTTP or
+    HTTPS.
+
+    :param acceptEncoding: flag whether to ask the server for
+        compressed responses.  Compressed responses are decoded in
+        any case.
+    :type acceptEncoding: :class:`bool`
+    :param compressRequests: if not :const:`None`, request bodies
+        of at least this size in bytes are sent gzip compressed.  Note
+        that the server must support this.
+    :type compressRequests: :class:`int`
+    """
+
+    # Make sure to process the requests before AbstractHTTPHandler
+    # sets the Content-Length header and the responses before
+    # HTTPErrorProcessor, so that error responses are decoded as well.
+    handler_order = 400
+
+    def __init__(self, acceptEncoding=True, compressRequests=None):
+        self.acceptEncoding = acceptEncoding
+        self.compressRequests = compressRequests
+
+    def http_request(self, req):
+        if self.acceptEncoding and not req.has_header("Accept-encoding"):
+            req.add_unredirected_header("Accept-Encoding", ACCEPT_ENCODING)
+        data = req.data
+        if (self.compressRequests is not None and
+            isinstance(data, (bytes, bytearray)) and
+            len(data) >= self.compressRequests and
+            not req.has_header("Content-encoding")):
+            req.data = gzip.compress(data)
+            req.add_unredirected_header("Content-Encoding", "gzip")
+            log.debug("compressed request body from %d to %d bytes",
+                      len(data), len(req.data))
+        return req
+
+    def http_response(self, req, response):
+        encoding = response.headers.get("Content-Encoding", "")
+        if encoding.strip().lower() in ("gzip", "x-gzip", "deflate"):
+            response = DecodingResponse(response, encoding)
+        return response
+
+    https_request = http_request
+    https_response = http_response
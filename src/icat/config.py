@@ -817,6 +817,10 @@ class Config(BaseConfig):
         self.add_variable('no_proxy', ("--no-proxy",), 
                           dict(help="list of exclusions for proxy use"),
                           envvar='no_proxy', optional=True)
+        self.add_variable('cacheDir', ("--cache-dir",), 
+                          dict(help="directory to cache server information"),
+                          envvar='ICAT_CACHE_DIR', optional=True,
+                          type=lambda f: Path(f).expanduser())
 
     def _add_cred_variables(self):
         """The variables that define the credentials needed for login.
@@ -892,6 +896,8 @@ class Config(BaseConfig):
             client_kwargs['proxy'] = proxy
         if config.no_proxy:
             os.environ['no_proxy'] = config.no_proxy
+        if config.cacheDir:
+            client_kwargs['cacheDir'] = config.cacheDir
         return client_kwargs, Client(config.url, **client_kwargs)
 
 
@@ -0,0 +1,507 @@
+"""Fast decoding of the responses to search calls.
+
+.. note::
+   This module is mostly intended for the internal use in python-icat.
+   Most users will not need to use it directly, but rather set the
+   `fastDecode` argument of :class:`icat.client.Client` or use
+   :meth:`icat.client.Client.searchStream`.
+
+Suds unmarshals SOAP responses using a generic SAX based machinery
+that resolves each XML element against the schema.  For large search
+results, this takes most of the CPU time spent in the client.  This
+module provides a decoder that parses the response to search calls
+with lxml and builds the entity objects directly, using the schema
+information for each type only once per response.
+
+The decoder only handles what an ICAT server actually sends in
+response to a search call.  If it encounters anything else, such as a
+SOAP fault, it leaves the response to the regular processing in Suds.
+
+The decoder may also parse the response incrementally while it is
+still being received from the server, yielding each item in the
+search result as soon as it is complete, see
+:meth:`icat.decoder.SearchDecoder.iterSearch`.
+
+.. versionadded:: 1.8.0
+"""
+
+import copy
+import logging
+import urllib.error
+import urllib.request
+import weakref
+
+from lxml import etree
+import suds.client
+import suds.transport
+from suds.sudsobject import Factory, Object
+import suds.xsd.query
+from suds.xsd.sxbasic import Complex
+import suds.xsd.sxbuiltin as sxbuiltin
+
+__all__ = ['SearchDecoder']
+
+log = logging.getLogger(__name__)
+
+SOAPENV_NS = "http://schemas.xmlsoap.org/soap/envelope/"
+XSI_NS = "http://www.w3.org/2001/XMLSchema-instance"
+
+_ENVELOPE = "{%s}Envelope" % SOAPENV_NS
+_BODY = "{%s}Body" % SOAPENV_NS
+_XSI_TYPE = "{%s}type" % XSI_NS
+_XSI_NIL = "{%s}nil" % XSI_NS
+
+# Suds renames attributes that are reserved words in Python.
+_reserved = {'class': 'cls', 'def': 'dfn'}
+
+
+class _Unsupported(Exception):
+    """The response contains something that the decoder does not handle.
+    """
+    pass
+
+
+def _getTranslator(sxtype):
+    """Return a function to convert the text of an element having the
+    simple type `sxtype` to the corresponding Python value.  The
+    conversion must yield the same result as Suds does.
+    """
+    if isinstance(sxtype, sxbuiltin.XAny):
+        raise _Unsupported("untyped element")
+    elif isinstance(sxtype, sxbuiltin.XString):
+        return str
+    elif isinstance(sxtype, (sxbuiltin.XInteger, sxbuiltin.XLong)):
+        return int
+    elif isinstance(sxtype, sxbuiltin.XFloat):
+        return float
+    else:
+        return sxtype.translate
+
+
+class _ComplexType():
+    """Information needed to decode elements of a complex type.
+    """
+
+    def __init__(self, sxtype):
+        self.sxtype = sxtype
+        self.cls = Factory.subclass(sxtype.name, Object)
+        self.entityClass = None
+        # Map the tag of child elements to a tuple (attribute name,
+        # multi occurrence flag, nillable flag, schema type).
+        self.fields = dict()
+        for child, ancestry in sxtype.resolve():
+            if child.name is None or child.isattr():
+                continue
+            key = _reserved.get(child.name, child.name)
+            self.fields[child.name] = (key, child.multi_occurrence(),
+                                       child.nillable, child.resolve())
+
+
+class SearchDecoder():
+    """Decode the responses to search calls.
+
+    :param client: the client.
+    :type client: :class:`icat.client.Client`
+    """
+
+    ChunkSize = 65536
+    """Size of the chunks read from the response in
+    :meth:`~icat.decoder.SearchDecoder.iterSearch`.
+    """
+
+    def __init__(self, client):
+        # Weak reference to the client, see TypeMap.__init__().
+        self._client = weakref.ref(client)
+        self._types = dict()
+        self._xsiTypes = dict()
+        self._translators = dict()
+        self._responseTag = None
+
+    def _getClient(self):
+        client = self._client()
+        if client is None:
+            raise RuntimeError("The client of this decoder is gone.")
+        return client
+
+    def _getResponseTag(self, client):
+        if self._responseTag is None:
+            method = client.service.search.method
+            part = method.soap.output.body.parts[0]
+            self._responseTag = "{%s}%s" % (part.element[1],
+                                            part.element[0])
+        return self._responseTag
+
+    def _getComplexType(self, sxtype):
+        try:
+            return self._types[sxtype.qname]
+        except KeyError:
+            pass
+        t = _ComplexType(sxtype)
+        self._types[sxtype.qname] = t
+        return t
+
+    def _getTranslator(self, sxtype):
+        # Note that the qname of builtin types is not meaningful in
+        # Suds, so use the type object itself as key.
+        try:
+            return self._translators[sxtype]
+        except KeyError:
+            pass
+        translate = _getTranslator(sxtype)
+        self._translators[sxtype] = translate
+        return translate
+
+    def _resolveXsiType(self, client, element, xsitype):
+        prefix, sep, name = xsitype.rpartition(':')
+        ns = element.nsmap.get(prefix or None)
+        if ns is None:
+            raise _Unsupported("invalid type %s" % xsitype)
+        key = (name, ns)
+        try:
+            return self._xsiTypes[key]
+        except KeyError:
+            pass
+        sxtype = suds.xsd.query.TypeQuery(key).execute(client.wsdl.schema)
+        if sxtype is None:
+            raise _Unsupported("unknown type %s" % xsitype)
+        sxtype = sxtype.resolve()
+        self._xsiTypes[key] = sxtype
+        return sxtype
+
+    def _decodeValue(self, client, element, sxtype, nillable):
+        """Decode an element, return the value.
+        """
+        attrs = element.attrib
+        if attrs:
+            for a in attrs:
+                if a != _XSI_TYPE and a != _XSI_NIL:
+                    raise _Unsupported("attribute %s" % a)
+            xsitype = attrs.get(_XSI_TYPE)
+            if xsitype is not None:
+                sxtype = self._resolveXsiType(client, element, xsitype)
+            if attrs.get(_XSI_NIL, "").lower() == "true" and not len(element):
+                return None
+        text = element.text
+        if text is not None:
+            text = text.strip() or None
+        if not isinstance(sxtype, Complex):
+            if len(element):
+                raise _Unsupported("child elements in simple type")
+            if text is None:
+                return None
+            return self._getTranslator(sxtype)(text)
+        if text is not None:
+            raise _Unsupported("mixed content")
+        if not len(element):
+            if nillable:
+                return None
+            raise _Unsupported("empty complex element")
+        ctype = self._getComplexType(sxtype)
+        fields = ctype.fields
+        values = dict()
+        for child in element:
+            try:
+                key, multi, cnillable, csxtype = fields[child.tag]
+            except KeyError:
+                raise _Unsupported("unexpected element %s" % child.tag)
+            cval = self._decodeValue(client, child, csxtype, cnillable)
+            # Do the same as suds.umx.core.Core.append_children() does.
+            if key in values:
+                v = values[key]
+                if isinstance(v, list):
+                    v.append(cval)
+                else:
+                    values[key] = [v, cval]
+            elif multi:
+                values[key] = [] if cval is None else [cval]
+            else:
+                values[key] = cval
+        obj = ctype.cls()
+        # This is equivalent to setting the attributes one by one, but
+        # avoids the overhead in Object.__setattr__().
+        obj.__dict__.update(values)
+        obj.__keylist__ = list(values.keys())
+        obj.__metadata__.sxtype = sxtype
+        return obj
+
+    def _decodeReturn(self, client, element):
+        """Decode one item in the search result.
+        """
+        if element.tag != "return":
+            raise _Unsupported("unexpected element %s" % element.tag)
+        xsitype = element.get(_XSI_TYPE)
+        if xsitype is None:
+            raise _Unsupported("missing type")
+        sxtype = self._resolveXsiType(client, element, xsitype)
+        value = self._decodeValue(client, element, sxtype, False)
+        if isinstance(value, Object):
+            ctype = self._types[sxtype.qname]
+            if ctype.entityClass is None:
+                try:
+                    cls = client.typemap[sxtype.name]
+                except KeyError:
+                    cls = False
+                if not cls or cls.BeanName is None:
+                    cls = False
+                ctype.entityClass = cls
+            if not ctype.entityClass:
+                return client.getEntity(value)
+            identityMap = getattr(client, 'identityMap', None)
+            if identityMap is not None:
+                cls = ctype.entityClass
+                return identityMap.getEntity(value,
+                                             lambda v: cls(client, v))
+            return ctype.entityClass(client, value)
+        return value
+
+    def decode(self, reply):
+        """Decode the response to a search call.
+
+        :param reply: the SOAP response.
+        :type reply: :class:`bytes`
+        :return: the search result.  This is the same as
+            :meth:`icat.client.Client.search` would return.
+        :rtype: :class:`list`
+        :raise ValueError: if the response contains anything that the
+            decoder does not handle.
+        """
+        client = self._getClient()
+        try:
+            try:
+                root = etree.fromstring(reply)
+            except etree.XMLSyntaxError as e:
+                raise _Unsupported(str(e))
+            body = root.find(_BODY)
+            if body is None or len(body) != 1:
+                raise _Unsupported("invalid SOAP body")
+            response = body[0]
+            if response.tag != self._getResponseTag(client):
+                raise _Unsupported("unexpected element %s" % response.tag)
+            return [ self._decodeReturn(client, e) for e in response ]
+        except _Unsupported as e:
+            raise ValueError("Cannot decode search response: %s" % e)
+
+    def search(self, sessionId, query):
+        """Perform a search call.
+
+        Send the search request to the ICAT server and decode the
+        response.  Fall back to the regular processing in Suds for
+        any response that the decoder does not handle.
+
+        :param sessionId: the session id.
+        :type sessionId: :class:`str`
+        :param query: the search query.
+        :type query: :class:`str`
+        :return: the search result.
+        :rtype: :class:`list`
+        :raise suds.WebFault: if the server responded with a fault.
+        """
+        client = self._getClient()
+        options = client.options
+        if (options.faults and not options.retxml and
+            not options.nosend and not options.plugins):
+            method = client.service.search.method
+            soapclient = _SearchSoapClient(client, method, self)
+            return client.requestMarshaller.invoke(soapclient,
+                                                   (sessionId, query))
+        else:
+            instances = client.service.search(sessionId, query)
+            return [client.getEntity(i) for i in instances]
+
+    def iterSearch(self, sessionId, query):
+        """Perform a search call, yielding the result while it arrives.
+
+        Send the search request to the ICAT server and parse the
+        response incrementally while it is being received.  Each item
+        in the search result is yielded as soon as it is complete and
+        then discarded from the parse tree, so that the memory used
+        does not depend on the size of the result.  Items that the
+        decoder does not handle are passed to Suds one at a time.
+
+        :param sessionId: the session id.
+        :type sessionId: :class:`str`
+        :param query: the search query.
+        :type query: :class:`str`
+        :return: a generator that successively yields the items in the
+            search result.
+        :rtype: generator
+        :raise suds.WebFault: if the server responded with a fault.
+        """
+        client = self._getClient()
+        options = client.options
+        if (options.faults and not options.retxml and
+            not options.nosend and not options.plugins):
+            method = client.service.search.method
+            soapclient = _StreamSoapClient(client, method, self)
+            yield from client.requestMarshaller.invoke(soapclient,
+                                                       (sessionId, query))
+        else:
+            instances = client.service.search(sessionId, query)
+            for i in instances:
+                yield client.getEntity(i)
+
+
+def _requestTarget(soapclient):
+    """Return the location and the HTTP headers for the request of a
+    Suds SOAP client.
+
+    Suds only provides these in private methods of
+    :class:`suds.client._SoapClient`.  Use these if available, but
+    build the same values from the options otherwise, in case a
+    different version of Suds lacks them.
+    """
+    try:
+        return (soapclient._SoapClient__location(),
+                soapclient._SoapClient__headers())
+    except AttributeError:
+        pass
+    options = soapclient.options
+    method = soapclient.method
+    location = options.location or method.location
+    action = method.soap.action
+    if isinstance(action, str):
+        action = action.encode("utf-8")
+    headers = { "Content-Type": "text/xml; charset=utf-8",
+                "SOAPAction": action }
+    headers.update(options.headers)
+    return (location, headers)
+
+
+class _SearchSoapClient(suds.client._SoapClient):
+    """A Suds SOAP client for the search call that uses the decoder
+    for the response.
+    """
+
+    def __init__(self, client, method, decoder):
+        super().__init__(client, method)
+        self.decoder = decoder
+
+    def process_reply(self, reply, status, description):
+        if status is None or status == 200:
+            try:
+                return self.decoder.decode(reply)
+            except ValueError as e:
+                log.debug("%s, falling back to Suds", e)
+        instances = super().process_reply(reply, status, description)
+        return [self.client.getEntity(i) for i in instances]
+
+
+class _StreamSoapClient(suds.client._SoapClient):
+    """A Suds SOAP client for the search call that reads the response
+    incrementally from the server.
+
+    :meth:`send` does not return the result, but a generator yielding
+    the items in the result.  It does not support Suds plugins.
+    """
+
+    def __init__(self, client, method, decoder):
+        super().__init__(client, method)
+        self.decoder = decoder
+
+    def send(self, soapenv, timeout=None):
+        location, headers = _requestTarget(self)
+        self.last_sent(soapenv)
+        if self.options.prettyxml:
+            soapenv = soapenv.str()
+        else:
+            soapenv = soapenv.plain()
+        request = suds.transport.Request(location, soapenv.encode("utf-8"),
+                                         timeout)
+        request.headers = headers
+        return self._stream(request)
+
+    def _open(self, request):
+        """Send the request using the transport of the Suds client,
+        but do not read the response.  Return the response object.
+        """
+        transport = self.options.transport
+        u2request = urllib.request.Request(request.url, request.message,
+                                           request.headers)
+        transport.addcookies(u2request)
+        transport.proxy = transport.options.proxy
+        fp = transport.u2open(u2request, timeout=request.timeout)
+        transport.getcookies(fp, u2request)
+        return fp
+
+    def _fallback(self, element):
+        """Let Suds process a single item in the search result.
+        """
+        response = element.getparent()
+        envelope = etree.Element(_ENVELOPE, nsmap=response.nsmap)
+        body = etree.SubElement(envelope, _BODY)
+        response = etree.SubElement(body, response.tag)
+        response.append(copy.deepcopy(element))
+        reply = etree.tostring(envelope)
+        instances = super().process_reply(reply, None, None)
+        return [self.client.getEntity(i) for i in instances]
+
+    def _stream(self, request):
+        try:
+            fp = self._open(request)
+        except urllib.error.HTTPError as e:
+            content = e.fp.read() if e.fp else b""
+            instances = super().process_reply(content, e.code, str(e))
+            for i in instances or ():
+                yield self.client.getEntity(i)
+            return
+        client = self.client
+        decoder = self.decoder
+        responseTag = decoder._getResponseTag(client)
+        parser = etree.XMLPullParser(events=("start", "end"))
+        # Keep the raw data until we know that this is a regular
+        # search response.  It is needed to leave anything else to
+        # Suds.
+        head = []
+        depth = 0
+        # read() would block until the requested amount of data is
+        # available, read1() returns what has arrived so far.
+        read = getattr(fp, "read1", fp.read)
+        try:
+            while True:
+                data = read(decoder.ChunkSize)
+                if head is not None:
+                    head.append(data)
+                if data:
+                    try:
+                        parser.feed(data)
+                    except etree.XMLSyntaxError:
+                        if head is None:
+                            raise
+                        head.append(fp.read())
+                        break
+                    events = parser.read_events()
+                elif head is None:
+                    parser.close()
+                    break
+                else:
+                    break
+                for event, element in events:
+                    if event == "start":
+                        depth += 1
+                        if depth == 3 and head is not None:
+                            if (element.tag == responseTag and
+                                element.getparent().tag == _BODY and
+                                element.getparent().getparent().tag
+                                == _ENVELOPE):
+                                head = None
+                        continue
+                    depth -= 1
+                    if depth != 3 or head is not None:
+                        continue
+                    try:
+                        yield decoder._decodeReturn(client, element)
+                    except _Unsupported as e:
+                        log.debug("%s, falling back to Suds", e)
+                        yield from self._fallback(element)
+                    # Discard what we have processed so far.
+                    element.clear()
+                    while element.getprevious() is not None:
+                        del element.getparent()[0]
+        finally:
+            fp.close()
+        if head is not None:
+            log.debug("Cannot decode search response, falling back to Suds")
+            reply = b"".join(head)
+            instances = super().process_reply(reply, None, None)
+            for i in instances:
+                yield client.getEntity(i)
@@ -8,10 +8,12 @@ the abstract methods.
 """
 
 from collections import ChainMap
+import itertools
 import os
 import sys
 
 from .entity import Entity
+from .exception import ICATError, SearchResultError
 from .query import Query
 
 
@@ -35,6 +37,19 @@ def _get_retain_entities(client):
             retain_set.add(cls.BeanName)
     return frozenset(retain_set)
 
+def _nested_keys(key):
+    """Return the parts of a unique key that are keys of related
+    objects, each enclosed in parenthesis, without the BeanName.
+    """
+    nested = set()
+    starts = []
+    for i, c in enumerate(key):
+        if c == '(':
+            starts.append(i)
+        elif c == ')' and starts:
+            nested.add(key[starts.pop():i+1])
+    return nested
+
 
 # ------------------------------------------------------------
 # DumpFileReader
@@ -92,6 +107,32 @@ class DumpFileReader():
         if self._closefile:
             self.infile.close()
 
+    def _resolve_refs(self, refs, defined, objindex):
+        """Search the objects referenced in a data chunk in advance.
+
+        Resolve the references using
+        :meth:`icat.client.Client.searchUniqueKeys` in a few batched
+        searches and add the objects to objindex.  References that
+        depend on objects defined in the chunk itself are skipped, as
+        these objects do not exist yet.  This is an optimization
+        only: if anything fails here, the references are resolved
+        individually later on, raising the appropriate error there.
+        """
+        defined = set(defined)
+        nested = { "(%s)" % k[k.index('_')+1:] for k in defined if '_' in k }
+        keys = []
+        for k in set(refs):
+            if k in objindex or k in defined:
+                continue
+            if nested and not nested.isdisjoint(_nested_keys(k)):
+                continue
+            keys.append(k)
+        if keys:
+            try:
+                self.client.searchUniqueKeys(sorted(keys), objindex)
+            except (ICATError, SearchResultError, ValueError):
+                pass
+
     def getdata(self):
         """Iterate over the chunks in the data file.
 
@@ -271,7 +312,7 @@ class DumpFileWriter():
         :type keyindex: :class:`dict`
         :param chunksize: tuning parameter, see
             :meth:`icat.client.Client.searchChunked` for details.
-        :type chunksize: :class:`int`
+        :type chunksize: :class:`int` or :class:`str`
         """
         if isinstance(objs, Query) or isinstance(objs, str):
             objs = self.client.searchChunked(objs, chunksize=chunksize)
@@ -309,7 +350,7 @@ class DumpFileWriter():
         :type keyindex: :class:`dict`
         :param chunksize: tuning parameter, see
             :meth:`icat.client.Client.searchChunked` for details.
-        :type chunksize: :class:`int`
+        :type chunksize: :class:`int` or :class:`str`
         """
         self.client.autoRefresh()
         if keyindex is None:
@@ -391,3 +432,64 @@ def open_dumpfile(client, f, formatname, mode):
     else:
         raise ValueError("Invalid file mode '%s'" % mode)
 
+
+def convert_dumpfile(client, infile, informat, outfile, outformat):
+    """Convert a data file to another file format.
+
+    Read all objects from the input file and write them to the output
+    file, keeping the division into data chunks.  The objects are
+    never created at the ICAT server, so this works with an
+    :class:`icat.offline.OfflineClient` as well.  References to
+    objects not defined in the input file are resolved using
+    :meth:`icat.client.Client.searchUniqueKey`.
+
+    >>> client = OfflineClient(cachedir, url)
+    >>> convert_dumpfile(client, "icatdump.xml", "XML",
+    ...                  "icatdump.yaml", "YAML")
+
+    :param client: the ICAT client.
+    :type client: :class:`icat.client.Client` or
+        :class:`icat.offline.OfflineClient`
+    :param infile: the data file to read.
+    :param informat: name of the file format of the input file.
+    :type informat: :class:`str`
+    :param outfile: the data file to write.
+    :param outformat: name of the file format of the output file.
+    :type outformat: :class:`str`
+
+    .. versionadded:: 1.8.0
+    """
+    # The objects read from the input file have no id, but the writer
+    # needs one to keep track of the keys.  Use negative ids in order
+    # not to collide with those of any objects from the server.
+    # Furthermore, some backends yield all attribute values as
+    # strings.  Convert them according to the attribute type.
+    ids = itertools.count(-1, -1)
+    def prepare(obj):
+        if obj.id is None:
+            obj.id = next(ids)
+        for a in obj.InstAttr:
+            v = getattr(obj, a)
+            if isinstance(v, str) and a != 'id':
+                t = obj.getAttrType(a)
+                if t == "Boolean":
+                    setattr(obj, a, v.lower() == "true")
+                elif t in {"Integer", "Long"}:
+                    setattr(obj, a, int(v))
+                elif t in {"Float", "Double"}:
+                    setattr(obj, a, float(v))
+        for r in obj.InstMRel:
+            for o in getattr(obj, r):
+                prepare(o)
+    objindex = dict()
+    with open_dumpfile(client, infile, informat, 'r') as reader, \
+         open_dumpfile(client, outfile, outformat, 'w') as writer:
+        for data in reader.getdata():
+            keyindex = ChainMap(dict(), writer.keyindex)
+            writer.startdata()
+            for key, obj in reader.getobjs_from_data(data, objindex):
+                prepare(obj)
+                writer.writeobjs([obj], keyindex)
+                obj.truncateRelations(keepInstRel=True)
+                if key:
+                    objindex[key] = obj
@@ -39,8 +39,6 @@ class XMLDumpFileReader(DumpFileReader):
 
     def __init__(self, client, infile):
         super().__init__(client, infile)
-        self.insttypemap = { c.BeanName:t 
-                             for t,c in self.client.typemap.items() }
         if isinstance(self.infile, etree._ElementTree):
             self.getdata = self.getdata_etree
         else:
@@ -82,7 +80,7 @@ class XMLDumpFileReader(DumpFileReader):
 
     def _elem2entity(self, element, objtype, objindex):
         """Create an entity object from XML element data."""
-        obj = self.client.new(self.insttypemap[objtype])
+        obj = self.client.new(objtype)
         for subelem in element:
             attr = subelem.tag
             if attr in obj.AttrAlias:
@@ -122,6 +120,18 @@ class XMLDumpFileReader(DumpFileReader):
         Yield a new entity object in each iteration.  The object is
         initialized from the data, but not yet created at the client.
         """
+        # Search the referenced objects in advance, in a few batched
+        # searches rather than one search for each reference.
+        refs = []
+        defined = []
+        for elem in data:
+            if elem.get('id'):
+                defined.append(elem.get('id'))
+            for subelem in elem.iter(tag=etree.Element):
+                for attr, value in subelem.items():
+                    if attr == 'ref' or attr.endswith('.ref'):
+                        refs.append(value)
+        self._resolve_refs(refs, defined, objindex)
         for elem in data:
             key = elem.get('id')
             tag = elem.tag
@@ -88,8 +88,6 @@ class YAMLDumpFileReader(DumpFileReader):
 
     def __init__(self, client, infile):
         super().__init__(client, infile)
-        self.insttypemap = { c.BeanName:t 
-                             for t,c in self.client.typemap.items() }
 
     def _dict2entity(self, d, objtype, objindex):
         """Create an entity object from a dict of attributes."""
@@ -107,7 +105,7 @@ class YAMLDumpFileReader(DumpFileReader):
                     raise SearchResultError("invalid reference %s" % d[k])
                 setattr(obj, attr, robj)
             elif attr in obj.InstMRel:
-                rtype = self.insttypemap[obj.getAttrType(attr)]
+                rtype = obj.getAttrType(attr)
                 for rd in d[k]:
                     robj = self._dict2entity(rd, rtype, objindex)
                     getattr(obj, attr).append(robj)
@@ -116,6 +114,21 @@ class YAMLDumpFileReader(DumpFileReader):
                                  % (k, objtype))
         return obj
 
+    def _collect_refs(self, d, objtype, refs):
+        """Collect the references to related objects in a dict of
+        attributes.
+        """
+        cls = self.client.typemap[objtype.lower()]
+        for k in d:
+            attr = cls.AttrAlias.get(k, k)
+            if attr in cls.InstRel:
+                if isinstance(d[k], str):
+                    refs.append(d[k])
+            elif attr in cls.InstMRel:
+                rtype = self.client.schemaIndex.getAttrInfo(cls, attr).type
+                for rd in d[k]:
+                    self._collect_refs(rd, rtype, refs)
+
     def getdata(self):
         """Iterate over the chunks in the data file.
         """
@@ -133,6 +146,16 @@ class YAMLDumpFileReader(DumpFileReader):
         for name in data.keys():
             if name not in entitytypes:
                 raise RuntimeError("Unknown entry %s in the data." % name)
+        # Search the referenced objects in advance, in a few batched
+        # searches rather than one search for each reference.
+        refs = []
+        defined = []
+        for name in entitytypes:
+            if name in data:
+                for key in data[name].keys():
+                    defined.append(key)
+                    self._collect_refs(data[name][key], name, refs)
+        self._resolve_refs(refs, defined, objindex)
         for name in entitytypes:
             if name in data:
                 for key in sorted(data[name].keys()):
@@ -16,7 +16,11 @@ ICAT server.  The classes are derived from the abstract base class
     create the entity classes dynamically.
 """
 
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
 import itertools
+import threading
+import weakref
 
 from .entity import Entity
 from .exception import InternalError
@@ -226,7 +230,173 @@ _extra_attrs = {
     ],
 }
 
-def getTypeMap(client):
+def _getInstanceName(beanName):
+    return beanName[0].lower() + beanName[1:]
+
+def _makeEntityClass(beanName, parent, info, apiversion):
+    """Create the entity class for a BeanName from its entity info.
+    """
+    attrs = { 'BeanName': str(beanName), }
+    try:
+        attrs['__doc__'] = str(info.classComment)
+    except AttributeError:
+        attrs['__doc__'] = ""
+    try:
+        constraints = info.constraints[0]['fieldNames']
+        if constraints:
+            attrs['Constraint'] = tuple(str(n) for n in constraints)
+    except AttributeError:
+        pass
+    instAttr = []
+    instRel = []
+    instMRel = []
+    for field in info.fields:
+        if field['name'] in parent.MetaAttr:
+            continue
+        elif field['relType'] == 'ATTRIBUTE':
+            instAttr.append(str(field['name']))
+        elif field['relType'] == 'ONE':
+            instRel.append(str(field['name']))
+        elif field['relType'] == 'MANY':
+            instMRel.append(str(field['name']))
+        else:
+            raise InternalError("Invalid relType '%s'" % field['relType'])
+    instAttr = frozenset(instAttr)
+    if instAttr != parent.InstAttr:
+        attrs['InstAttr'] = instAttr
+    instRel = frozenset(instRel)
+    if instRel != parent.InstRel:
+        attrs['InstRel'] = instRel
+    instMRel = frozenset(instMRel)
+    if instMRel != parent.InstMRel:
+        attrs['InstMRel'] = instMRel
+    mixin = None
+    if beanName in _extra_attrs:
+        for minver, _e in _extra_attrs[beanName]:
+            extra = dict(_e)
+            if minver and minver > apiversion:
+                continue
+            mixin = extra.pop('Mixin', None)
+            attrs.update(extra)
+    if mixin:
+        bases = (parent, mixin)
+    else:
+        bases = (parent,)
+    return type(str(beanName), bases, attrs)
+
+
+class TypeMap(Mapping):
+    """A mapping of type names to entity classes.
+
+    The keys are the type names from the ICAT web service description
+    and their lower case variants.  The values are the corresponding
+    Python classes.  The entity classes are created on demand: the
+    entity info is queried from the ICAT server and the class is
+    created at the first lookup of the corresponding type name.
+    Checking whether a type name is in the mapping or iterating over
+    the keys does not create any classes, while iterating over the
+    values or the items will create all of them.
+
+    :param client: a client object configured to connect to an ICAT
+        server.
+    :type client: :class:`icat.client.Client`
+
+    .. versionadded:: 1.8.0
+    """
+
+    LoadWorkers = 8
+    """Maximum number of concurrent requests to the ICAT server in
+    :meth:`~icat.entities.TypeMap.load` with a thread safe client.
+    """
+
+    def __init__(self, client):
+        # Only keep a weak reference to the client to avoid a
+        # reference cycle, the client holds a reference to its
+        # typemap.
+        self._client = weakref.ref(client)
+        self._apiversion = client.apiversion
+        self._lock = threading.RLock()
+        self._names = dict()
+        self._beanNames = dict()
+        self._classes = dict()
+        self._addName('entityBaseBean', None)
+        self._classes['entityBaseBean'] = Entity
+        beanNames = itertools.chain(('Parameter',), client.getEntityNames())
+        for beanName in beanNames:
+            self._addName(_getInstanceName(beanName), str(beanName))
+
+    def _addName(self, instanceName, beanName):
+        self._names[instanceName] = instanceName
+        self._names[instanceName.lower()] = instanceName
+        self._beanNames[instanceName] = beanName
+
+    def _getClient(self):
+        client = self._client()
+        if client is None:
+            raise RuntimeError("The client of this typemap is gone.")
+        return client
+
+    def _makeClass(self, instanceName, info=None):
+        beanName = self._beanNames[instanceName]
+        try:
+            parent = self[_parent[beanName]]
+        except KeyError:
+            parent = Entity
+        if info is None:
+            info = self._getClient().getEntityInfo(beanName)
+        return _makeEntityClass(beanName, parent, info, self._apiversion)
+
+    def __getitem__(self, key):
+        instanceName = self._names[key]
+        try:
+            return self._classes[instanceName]
+        except KeyError:
+            pass
+        with self._lock:
+            if instanceName not in self._classes:
+                self._classes[instanceName] = self._makeClass(instanceName)
+            return self._classes[instanceName]
+
+    def __contains__(self, key):
+        return key in self._names
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def load(self):
+        """Create all entity classes that have not yet been created.
+
+        The entity info for the missing classes is queried from the
+        ICAT server.  If the client has been created with the
+        `threadSafe` argument set, this is done concurrently, using up
+        to :attr:`~icat.entities.TypeMap.LoadWorkers` threads.  The
+        classes are then created in a well defined order.
+        """
+        with self._lock:
+            missing = [ n for n in self._beanNames.keys()
+                        if n not in self._classes ]
+            if not missing:
+                return
+            client = self._getClient()
+            beanNames = [ self._beanNames[n] for n in missing ]
+            workers = min(self.LoadWorkers, len(beanNames))
+            threaded = getattr(client, 'kwargs', {}).get('threadSafe')
+            if threaded and workers > 1:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    infos = list(executor.map(client.getEntityInfo,
+                                              beanNames))
+            else:
+                infos = [ client.getEntityInfo(b) for b in beanNames ]
+            for instanceName, info in zip(missing, infos):
+                if instanceName not in self._classes:
+                    cls = self._makeClass(instanceName, info)
+                    self._classes[instanceName] = cls
+
+
+def getTypeMap(client, lazy=False):
     """Generate a type map for the client.
 
     Query the ICAT server about the entity classes defined in the
@@ -237,71 +407,22 @@ def getTypeMap(client):
     :param client: a client object configured to connect to an ICAT
         server.
     :type client: :class:`icat.client.Client`
+    :param lazy: if :const:`True`, the entity classes will only be
+        created on demand, when they are looked up in the typemap for
+        the first time.  Otherwise, all classes are created right
+        away.
+    :type lazy: :class:`bool`
     :return: a mapping of type names from the ICAT web service
         description to the corresponding Python classes.  This mapping
         may be used as :attr:`icat.client.Client.typemap` for the
         client object.
-    :rtype: :class:`dict`
+    :rtype: :class:`icat.entities.TypeMap`
+
+    .. versionchanged:: 1.8.0
+        add the `lazy` argument.  Changed the return type from
+        :class:`dict` to :class:`icat.entities.TypeMap`.
     """
-    def addType(typemap, cls):
-        instanceName = cls.getInstanceName()
-        typemap[instanceName] = cls
-        typemap[instanceName.lower()] = cls
-
-    typemap = dict()
-    addType(typemap, Entity)
-    for beanName in itertools.chain(('Parameter',), client.getEntityNames()):
-        try:
-            parent = typemap[_parent[beanName]]
-        except KeyError:
-            parent = Entity
-        info = client.getEntityInfo(beanName)
-        attrs = { 'BeanName': str(beanName), }
-        try:
-            attrs['__doc__'] = str(info.classComment)
-        except AttributeError:
-            attrs['__doc__'] = ""
-        try:
-            constraints = info.constraints[0]['fieldNames']
-            if constraints:
-                attrs['Constraint'] = tuple(str(n) for n in constraints)
-        except AttributeError:
-            pass
-        instAttr = []
-        instRel = []
-        instMRel = []
-        for field in info.fields:
-            if field['name'] in parent.MetaAttr:
-                continue
-            elif field['relType'] == 'ATTRIBUTE':
-                instAttr.append(str(field['name']))
-            elif field['relType'] == 'ONE':
-                instRel.append(str(field['name']))
-            elif field['relType'] == 'MANY':
-                instMRel.append(str(field['name']))
-            else:
-                raise InternalError("Invalid relType '%s'" % field['relType'])
-        instAttr = frozenset(instAttr)
-        if instAttr != parent.InstAttr:
-            attrs['InstAttr'] = instAttr
-        instRel = frozenset(instRel)
-        if instRel != parent.InstRel:
-            attrs['InstRel'] = instRel
-        instMRel = frozenset(instMRel)
-        if instMRel != parent.InstMRel:
-            attrs['InstMRel'] = instMRel
-        mixin = None
-        if beanName in _extra_attrs:
-            for minver, _e in _extra_attrs[beanName]:
-                extra = dict(_e)
-                if minver and minver > client.apiversion:
-                    continue
-                mixin = extra.pop('Mixin', None)
-                attrs.update(extra)
-        if mixin:
-            bases = (parent, mixin)
-        else:
-            bases = (parent,)
-        cls = type(str(beanName), bases, attrs)
-        addType(typemap, cls)
+    typemap = TypeMap(client)
+    if not lazy:
+        typemap.load()
     return typemap
@@ -102,27 +102,7 @@ class Entity():
         """
         if cls.BeanName is None:
             raise ValueError("Cannot get info for an abstract entity class.")
-        info = client.getEntityInfo(cls.BeanName)
-        for f in info.fields:
-            if f.name == attr:
-                return f
-        else:
-            if attr in cls.MetaAttr:
-                # ICAT server 4.4 and older did not add the meta
-                # attributes in the entity info.  Create a fake
-                # entityField to emulate the new behavior of ICAT
-                # 4.5.0.
-                f = client.factory.create('entityField')
-                f.name = attr
-                f.notNullable = False
-                f.relType = "ATTRIBUTE"
-                if attr in {'createTime', 'modTime'}:
-                    f.type = "Date"
-                else:
-                    f.type = "String"
-                return f
-            else:
-                raise ValueError("Unknown attribute name '%s'." % attr)
+        return client.schemaIndex.getAttrInfo(cls, attr)
 
     @classmethod
     def getNaturalOrder(cls, client):
@@ -137,30 +117,7 @@ class Entity():
         defined.  In any case, one to many relationships and nullable
         many to one relationships are removed from the list.
         """
-        order = []
-        attrs = list(cls.SortAttrs or cls.Constraint)
-        if "id" in cls.Constraint and "id" not in attrs:
-            attrs.append("id")
-        for a in attrs:
-            attrInfo = cls.getAttrInfo(client, a)
-            if attrInfo.relType == "ATTRIBUTE":
-                order.append(a)
-            elif attrInfo.relType == "ONE":
-                if not attrInfo.notNullable:
-                    # skip, adding a nullable relation to ORDER BY
-                    # would implicitly add a NOT NULL condition.
-                    continue
-                else:
-                    rclass = client.getEntityClass(attrInfo.type)
-                    rorder = rclass.getNaturalOrder(client)
-                    order.extend(["%s.%s" % (a, ra) for ra in rorder])
-            elif attrInfo.relType == "MANY":
-                # skip, one to many relationships cannot be used in an
-                # ORDER BY clause.
-                continue
-            else:
-                raise InternalError("Invalid relType: '%s'" % attrInfo.relType)
-        return order
+        return client.schemaIndex.getNaturalOrder(cls)
 
 
     def __init__(self, client, instance, **kwargs):
@@ -174,7 +131,7 @@ class Entity():
         if attr in self.InstAttr or attr in self.MetaAttr:
             return getattr(self.instance, attr, None)
         elif attr in self.InstRel:
-            return self.client.new(getattr(self.instance, attr, None))
+            return self.client.getEntity(getattr(self.instance, attr, None))
         elif attr in self.InstMRel:
             if not hasattr(self.instance, attr):
                 # The list of objects in this one to many relation is
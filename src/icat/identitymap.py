@@ -0,0 +1,120 @@
+"""An identity map for the objects retrieved from the ICAT server.
+
+.. note::
+   This module is mostly intended for the internal use in python-icat.
+   Most users will not need to use it directly, but rather set the
+   `identityMap` argument to :class:`icat.client.Client`.
+
+Search results with INCLUDE clauses typically contain the same related
+object many times, e.g. the same Investigation, Facility, or
+ParameterType for each Dataset or DatasetParameter.  The ICAT server
+sends a separate copy each time and each copy is converted to a
+separate Suds object.  An :class:`~icat.identitymap.IdentityMap`
+replaces these copies by one canonical object per entity type and id,
+so that only one copy is kept in memory and the same
+:class:`~icat.entity.Entity` object is returned for the same object
+in the ICAT server.
+
+The identity map only keeps weak references to the objects.  An
+object is forgotten as soon as it is not used anywhere else any more.
+
+.. versionadded:: 1.8.0
+"""
+
+import threading
+import weakref
+
+import suds.sudsobject
+
+__all__ = ['IdentityMap']
+
+
+class IdentityMap():
+    """Map entity types and ids to canonical objects.
+
+    If an object arrives that is already in the map, the attributes
+    and the related objects of the new copy are copied into the
+    canonical object, replacing the old values.  Attributes and
+    related objects not present in the new copy, e.g. because the
+    relation has not been included in the query, are retained.  Note
+    that this overwrites any local modification of the canonical
+    object that has not yet been saved in the ICAT server.
+
+    The map is thread safe.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._instances = weakref.WeakValueDictionary()
+        self._entities = weakref.WeakValueDictionary()
+
+    def __len__(self):
+        return len(self._instances)
+
+    def _canonical(self, instance, memo):
+        if id(instance) in memo:
+            return memo[id(instance)]
+        objid = getattr(instance, 'id', None)
+        key = (instance.__class__.__name__, objid)
+        canonical = self._instances.get(key) if objid is not None else None
+        if canonical is instance:
+            # Already canonical, as are the related objects.
+            memo[id(instance)] = instance
+            return instance
+        if canonical is None:
+            canonical = instance
+            if objid is not None:
+                self._instances[key] = instance
+        memo[id(instance)] = canonical
+        for k, v in instance:
+            if isinstance(v, suds.sudsobject.Object):
+                v = self._canonical(v, memo)
+            elif isinstance(v, list):
+                v = [ self._canonical(i, memo)
+                      if isinstance(i, suds.sudsobject.Object) else i
+                      for i in v ]
+            setattr(canonical, k, v)
+        return canonical
+
+    def canonical(self, instance):
+        """Return the canonical object for a Suds instance object.
+
+        Register the object, together with all related objects, if
+        it is not yet in the map.
+
+        :param instance: an object as received from the ICAT server.
+        :type instance: :class:`suds.sudsobject.Object`
+        :return: the canonical object having the same type and id.
+        :rtype: :class:`suds.sudsobject.Object`
+        """
+        with self._lock:
+            return self._canonical(instance, {})
+
+    def getEntity(self, instance, factory):
+        """Return the canonical entity object for a Suds instance object.
+
+        :param instance: an object as received from the ICAT server.
+        :type instance: :class:`suds.sudsobject.Object`
+        :param factory: a callable to create an entity object from
+            the canonical instance object if none exists yet.
+        :return: the entity object.
+        :rtype: :class:`icat.entity.Entity`
+        """
+        with self._lock:
+            instance = self._canonical(instance, {})
+            objid = getattr(instance, 'id', None)
+            if objid is None:
+                return factory(instance)
+            key = (instance.__class__.__name__, objid)
+            entity = self._entities.get(key)
+            if entity is None or entity.instance is not instance:
+                entity = factory(instance)
+                self._entities[key] = entity
+            return entity
+
+    def clear(self):
+        """Forget all objects.
+        """
+        with self._lock:
+            self._instances.clear()
+            self._entities.clear()
@@ -20,9 +20,11 @@ from urllib.request import HTTPDefaultErrorHandler, ProxyHandler, Request
 from urllib.request import build_opener
 import zlib
 
+from .compression import CompressionHandler
 from .entity import Entity
 from .exception import *
 from .helper import Version
+from .keepalive import KeepAliveHandler
 
 # For Python versions older then 3.6.0b1, the standard library does
 # not support sending the body using chunked transfer encoding.  Need
@@ -189,25 +191,37 @@ class IDSClient():
 
     The attribute sessionId must be set to a valid ICAT session id
     from the ICAT client.
+
+    If `connectionPool` is set, the HTTP connections to the IDS
+    server are kept open and reused for later calls, see
+    :mod:`icat.keepalive`.  If `compression` is :const:`True`, the
+    IDS server is asked to send compressed responses, see
+    :mod:`icat.compression`.
+
+    .. versionchanged:: 1.8.0
+        add the `connectionPool` and `compression` arguments.
     """
 
-    def __init__(self, url, sessionId=None, sslContext=None, proxy=None):
+    def __init__(self, url, sessionId=None, sslContext=None, proxy=None,
+                 connectionPool=None, compression=False):
         """Create an IDSClient.
         """
         self.url = url
         if not self.url.endswith("/"): self.url += "/"
         self.sessionId = sessionId
-        if sslContext:
-            httpsHandler = HTTPSHandler(context=sslContext)
+        if connectionPool is not None:
+            # The KeepAliveHandler replaces both, HTTPHandler and
+            # HTTPSHandler.
+            handlers = [KeepAliveHandler(connectionPool, sslContext)]
+        elif sslContext:
+            handlers = [HTTPHandler, HTTPSHandler(context=sslContext)]
         else:
-            httpsHandler = HTTPSHandler()
+            handlers = [HTTPHandler, HTTPSHandler()]
         if proxy:
-            proxyhandler = ProxyHandler(proxy)
-            self.opener = build_opener(proxyhandler, HTTPHandler, 
-                                       httpsHandler, IDSHTTPErrorHandler)
-        else:
-            self.opener = build_opener(HTTPHandler, httpsHandler, 
-                                       IDSHTTPErrorHandler)
+            handlers.insert(0, ProxyHandler(proxy))
+        handlers.append(CompressionHandler(compression))
+        handlers.append(IDSHTTPErrorHandler)
+        self.opener = build_opener(*handlers)
         self.apiversion = Version(self.version()["version"])
 
     def ping(self):
@@ -337,7 +351,7 @@ class IDSClient():
         parameters = {"sessionId": self.sessionId}
         selection.fillParams(parameters)
         req = IDSRequest(self.url + "archive", parameters, method="POST")
-        self.opener.open(req)
+        self.opener.open(req).read()
 
     def restore(self, selection):
         """Restore data.
@@ -345,7 +359,7 @@ class IDSClient():
         parameters = {"sessionId": self.sessionId}
         selection.fillParams(parameters)
         req = IDSRequest(self.url + "restore", parameters, method="POST")
-        self.opener.open(req)
+        self.opener.open(req).read()
 
     def write(self, selection):
         """Write data.
@@ -354,7 +368,7 @@ class IDSClient():
         selection.fillParams(parameters)
         req = IDSRequest(self.url + "write", parameters, method="POST")
         try:
-            self.opener.open(req)
+            self.opener.open(req).read()
         except (HTTPError, IDSError) as e:
             raise self._versionMethodError("write", '1.9.0', e)
 
@@ -364,7 +378,7 @@ class IDSClient():
         parameters = self._selectionParams(selection)
         req = IDSRequest(self.url + "reset", parameters, method="POST")
         try:
-            self.opener.open(req)
+            self.opener.open(req).read()
         except (HTTPError, IDSError) as e:
             raise self._versionMethodError("reset", '1.6.0', e)
 
@@ -481,7 +495,7 @@ class IDSClient():
         parameters = {"sessionId": self.sessionId}
         selection.fillParams(parameters)
         req = IDSRequest(self.url + "delete", parameters, method="DELETE")
-        self.opener.open(req)
+        self.opener.open(req).read()
 
     def _selectionParams(self, selection, requireSessionId=True):
         """Return query parameters according to a data selection.
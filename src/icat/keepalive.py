@@ -0,0 +1,239 @@
+"""Persistent HTTP connections for urllib.
+
+.. note::
+   This module is mostly intended for the internal use in python-icat.
+   Most users will not need to use it directly, but rather pass a
+   :class:`~icat.keepalive.ConnectionPool` as the `connectionPool`
+   argument to :class:`icat.client.Client`.
+
+The urllib handlers from the standard library open a new connection
+for each request and close it afterwards.  This module provides a
+handler that keeps the connections open (HTTP/1.1 keep-alive) and
+returns them to a pool after the response has been read completely,
+so that later requests to the same server may reuse them.  This saves
+the TCP and TLS handshake for each request.
+
+.. versionadded:: 1.8.0
+"""
+
+import http.client
+import logging
+import socket
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+# For Python versions older then 3.6.0b1, the standard library does
+# not support sending the body using chunked transfer encoding.  Use
+# the modified versions from icat.chunkedhttp in this case.
+if sys.version_info < (3, 6, 0, 'beta'):
+    from .chunkedhttp import HTTPConnection, HTTPSConnection
+    from .chunkedhttp import HTTPHandlerMixin
+    _do_request = HTTPHandlerMixin.do_request_
+    _chunked_kwarg = False
+else:
+    from http.client import HTTPConnection, HTTPSConnection
+    _do_request = urllib.request.AbstractHTTPHandler.do_request_
+    _chunked_kwarg = True
+
+__all__ = ['ConnectionPool', 'KeepAliveHandler']
+
+log = logging.getLogger(__name__)
+
+
+class ConnectionPool():
+    """A pool of idle persistent HTTP connections.
+
+    The pool keeps idle connections, indexed by the server they are
+    connected to.  It is thread safe and may be shared between many
+    clients.
+
+    :param maxsize: maximum number of idle connections to keep for
+        each server.  Connections in use do not count.
+    :type maxsize: :class:`int`
+    :param idleTimeout: time in seconds after which an idle
+        connection will not be reused any more.  This should be
+        smaller than the keep-alive timeout of the server.
+    :type idleTimeout: :class:`float`
+    """
+
+    def __init__(self, maxsize=4, idleTimeout=30):
+        self.maxsize = maxsize
+        self.idleTimeout = idleTimeout
+        self._lock = threading.Lock()
+        self._idle = dict()
+
+    def get(self, key):
+        """Take an idle connection out of the pool.
+
+        :param key: the key identifying the server.
+        :return: a connection or :const:`None` if no idle connection
+            to this server is available.
+        """
+        now = time.monotonic()
+        conn = None
+        stale = []
+        with self._lock:
+            conns = self._idle.get(key, [])
+            while conns:
+                c, t = conns.pop()
+                if now - t < self.idleTimeout:
+                    conn = c
+                    break
+                stale.append(c)
+        for c in stale:
+            c.close()
+        return conn
+
+    def put(self, key, conn):
+        """Return an idle connection to the pool.
+
+        The connection will be closed if the pool is full.
+
+        :param key: the key identifying the server.
+        :param conn: the connection.
+        :type conn: :class:`http.client.HTTPConnection`
+        """
+        with self._lock:
+            conns = self._idle.setdefault(key, [])
+            if len(conns) < self.maxsize:
+                conns.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def clear(self):
+        """Close all idle connections.
+        """
+        with self._lock:
+            idle = self._idle
+            self._idle = dict()
+        for conns in idle.values():
+            for c, t in conns:
+                c.close()
+
+
+class _PooledResponse(http.client.HTTPResponse):
+    """A HTTP response that releases its connection once it has been
+    read completely.
+    """
+
+    _release = None
+    _reuse = True
+
+    def close(self):
+        if self.fp is not None and (self.chunked or self.length != 0):
+            # The response has not been read to the end.  There is
+            # unread data pending on the connection, so it can't be
+            # reused.
+            self._reuse = False
+        super().close()
+
+    def _close_conn(self):
+        super()._close_conn()
+        release, self._release = self._release, None
+        if release:
+            release(self._reuse and not self.will_close)
+
+
+class KeepAliveHandler(urllib.request.HTTPHandler,
+                       urllib.request.HTTPSHandler):
+    """A urllib handler for HTTP and HTTPS using persistent connections.
+
+    It replaces both, the standard HTTPHandler and HTTPSHandler.  As
+    it is a subclass of both, :func:`urllib.request.build_opener`
+    will not add the default handlers if it is passed an instance of
+    this class.
+
+    :param pool: the pool to take connections from and to return
+        them to.
+    :type pool: :class:`icat.keepalive.ConnectionPool`
+    :param context: the SSL context to use for HTTPS connections.
+    :type context: :class:`ssl.SSLContext`
+    """
+
+    def __init__(self, pool, context=None):
+        super().__init__(context=context)
+        self.pool = pool
+        self.ssl_context = context
+
+    def http_open(self, req):
+        return self._open(HTTPConnection, req)
+
+    def https_open(self, req):
+        return self._open(HTTPSConnection, req, context=self.ssl_context)
+
+    http_request = _do_request
+    https_request = _do_request
+
+    def _open(self, connclass, req, **kwargs):
+        host = req.host
+        if not host:
+            raise urllib.error.URLError('no host given')
+        # Connections made with different SSL contexts, e.g. with
+        # and without certificate verification, must not be mixed.
+        key = (connclass, host, req._tunnel_host, kwargs.get('context'))
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update({ k: v for k, v in req.headers.items()
+                         if k not in headers })
+        headers = { k.title(): v for k, v in headers.items() }
+        headers["Connection"] = "keep-alive"
+        tunnel_headers = {}
+        if req._tunnel_host:
+            proxy_auth_hdr = "Proxy-Authorization"
+            if proxy_auth_hdr in headers:
+                tunnel_headers[proxy_auth_hdr] = headers.pop(proxy_auth_hdr)
+        reqkwargs = {}
+        if _chunked_kwarg:
+            reqkwargs['encode_chunked'] = req.has_header('Transfer-encoding')
+        # A request may only be sent again if the body has not been
+        # consumed in the first attempt.
+        repeatable = req.data is None or isinstance(req.data, bytes)
+
+        while True:
+            conn = self.pool.get(key)
+            reused = conn is not None
+            if reused:
+                conn.timeout = req.timeout
+                if conn.sock is not None:
+                    if req.timeout is socket._GLOBAL_DEFAULT_TIMEOUT:
+                        conn.sock.settimeout(socket.getdefaulttimeout())
+                    else:
+                        conn.sock.settimeout(req.timeout)
+            else:
+                conn = connclass(host, timeout=req.timeout, **kwargs)
+                conn.response_class = _PooledResponse
+                if req._tunnel_host:
+                    conn.set_tunnel(req._tunnel_host, headers=tunnel_headers)
+            try:
+                conn.request(req.get_method(), req.selector, req.data,
+                             headers, **reqkwargs)
+                r = conn.getresponse()
+            except (ConnectionError, http.client.BadStatusLine) as err:
+                conn.close()
+                if reused and repeatable:
+                    # Most likely, the server has closed the idle
+                    # connection in the meanwhile.  Try again.
+                    log.debug("Reused connection to %s failed: %s, retry",
+                              host, err)
+                    continue
+                raise urllib.error.URLError(err)
+            except OSError as err:
+                conn.close()
+                raise urllib.error.URLError(err)
+            except BaseException:
+                conn.close()
+                raise
+            break
+
+        def release(reuse):
+            if reuse and conn.sock is not None:
+                self.pool.put(key, conn)
+            else:
+                conn.close()
+        r._release = release
+        r.url = req.get_full_url()
+        r.msg = r.reason
+        return r
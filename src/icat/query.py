@@ -121,8 +121,8 @@ class Query():
         if isinstance(entity, str):
             self.entity = self.client.getEntityClass(entity)
         elif issubclass(entity, Entity):
-            if (entity in self.client.typemap.values() and
-                entity.BeanName is not None):
+            if (entity.BeanName is not None and
+                self.client.typemap.get(entity.getInstanceName()) is entity):
                 self.entity = entity
             else:
                 raise EntityTypeError("Invalid entity type '%s'."
@@ -146,27 +146,7 @@ class Query():
         """Follow the attribute path along related objects and iterate over
         the components.
         """
-        rclass = self.entity
-        pattr = ""
-        for attr in attrname.split('.'):
-            if pattr:
-                pattr += ".%s" % attr
-            else:
-                pattr = attr
-            if rclass is None:
-                # Last component was not a relation, no further components
-                # in the name allowed.
-                raise ValueError("Invalid attrname '%s' for %s."
-                                 % (attrname, self.entity.BeanName))
-            attrInfo = rclass.getAttrInfo(self.client, attr)
-            if attrInfo.relType == "ATTRIBUTE":
-                rclass = None
-            elif (attrInfo.relType == "ONE" or
-                  attrInfo.relType == "MANY"):
-                rclass = self.client.getEntityClass(attrInfo.type)
-            else:
-                raise InternalError("Invalid relType: '%s'" % attrInfo.relType)
-            yield (pattr, attrInfo, rclass)
+        return iter(self.client.schemaIndex.getAttrPath(self.entity, attrname))
 
     def _makesubst(self, objs):
         subst = {}
@@ -0,0 +1,222 @@
+"""A cache for the results of search calls.
+
+.. note::
+   This module is mostly intended for the internal use in python-icat.
+   Most users will not need to use it directly, but rather pass a
+   :class:`~icat.resultcache.ResultCache` as the `resultCache`
+   argument to :class:`icat.client.Client`.
+
+Applications often issue the same read queries over and over again,
+e.g. to look up facilities, instruments, or parameter types.  A
+:class:`~icat.resultcache.ResultCache` keeps the results of
+:meth:`~icat.client.Client.search` and :meth:`~icat.client.Client.get`
+calls for a limited time, so that repeated calls may be answered
+without a round trip to the ICAT server.
+
+Each cached result is tagged with the entity types it depends on:
+the types named in the query, the types reached by the relations
+used in the query, and the types of all objects in the result.  When
+a client using the cache creates, updates, or deletes objects, all
+results tagged with the concerned entity types are discarded.
+Changes to the authorization rules discard all results.  Changes
+made by other clients are not noticed, these only become visible
+after the time to live of the cached results has expired.
+
+.. versionadded:: 1.8.0
+"""
+
+from collections import OrderedDict
+import copy
+import logging
+import re
+import threading
+import time
+
+import suds.sudsobject
+
+__all__ = ['ResultCache']
+
+log = logging.getLogger(__name__)
+
+_word_re = re.compile(r"[A-Za-z]\w*")
+
+AuthzTypes = frozenset(['grouping', 'publicstep', 'rule', 'usergroup'])
+"""The entity types that affect the permissions.  Writing any of these
+invalidates all cached results.
+"""
+
+
+def _queryTypes(query, typemap, schemaIndex=None):
+    """Return the names of the entity types mentioned in a query.
+
+    This is a conservative guess: any word in the query that is the
+    name of an entity type is taken.  If schemaIndex is given, the
+    relations of these types are followed as well: any word that is
+    the name of a relation of a type already taken adds the type of
+    the related object.  This catches the types that are only
+    reached by a relation path in a query, such as InvestigationUser
+    in ``JOIN i.investigationUsers``.
+    """
+    words = set(_word_re.findall(query))
+    types = { w for w in map(str.lower, words) if w in typemap }
+    if schemaIndex is not None:
+        todo = list(types)
+        while todo:
+            cls = typemap[todo.pop()]
+            for attr in (cls.InstRel | cls.InstMRel) & words:
+                t = schemaIndex.getAttrInfo(cls, attr).type.lower()
+                if t not in types:
+                    types.add(t)
+                    todo.append(t)
+    return types
+
+def _copy(value, memo):
+    """Copy the Suds instances and lists in value.
+
+    Other values are immutable and may be shared.  The Suds objects
+    can't be copied with :func:`copy.deepcopy`, because this fails on
+    the time zones that Suds uses in date values.
+    """
+    if isinstance(value, suds.sudsobject.Object):
+        try:
+            return memo[id(value)]
+        except KeyError:
+            pass
+        obj = copy.copy(value)
+        obj.__keylist__ = list(value.__keylist__)
+        memo[id(value)] = obj
+        for k, v in value:
+            setattr(obj, k, _copy(v, memo))
+        return obj
+    elif isinstance(value, list):
+        return [ _copy(v, memo) for v in value ]
+    else:
+        return value
+
+def _resultTypes(obj, types):
+    """Add the type names of all Suds instances in obj to types.
+    """
+    if isinstance(obj, suds.sudsobject.Object):
+        types.add(obj.__class__.__name__.lower())
+        for _, v in obj:
+            _resultTypes(v, types)
+    elif isinstance(obj, list):
+        for v in obj:
+            _resultTypes(v, types)
+
+
+class ResultCache():
+    """A cache for the results of search and get calls.
+
+    The cache is thread safe and may be shared between clients.  The
+    results are kept in the cache until they expire or until they are
+    invalidated.  If the cache is full, the least recently used
+    result is discarded.
+
+    :param maxsize: maximum number of results to keep.
+    :type maxsize: :class:`int`
+    :param ttl: time to live in seconds of the cached results.
+    :type ttl: :class:`float`
+    """
+
+    def __init__(self, maxsize=1000, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        """Number of lookups answered from the cache."""
+        self.misses = 0
+        """Number of lookups not found in the cache."""
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._typeIndex = dict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        _, types, _ = self._entries.pop(key)
+        for t in types:
+            keys = self._typeIndex[t]
+            keys.discard(key)
+            if not keys:
+                del self._typeIndex[t]
+
+    def get(self, key):
+        """Look up a result in the cache.
+
+        :param key: the key identifying the call.
+        :return: a copy of the cached result or :const:`None` if no
+            valid result is found.
+        """
+        with self._lock:
+            try:
+                expires, _, value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            if expires < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        # The caller may modify the objects in the result, so never
+        # hand out the cached objects themselves.
+        return _copy(value, {})
+
+    def put(self, key, value, types=()):
+        """Add a result to the cache.
+
+        :param key: the key identifying the call.
+        :param value: the result of the call.  This must be a Suds
+            instance object, a plain value, or a list of these.  A
+            copy is kept, so that the caller may modify it.
+        :param types: names of entity types the result depends on.
+            The types of the objects in the result are added
+            automatically.
+        :type types: iterable of :class:`str`
+        """
+        types = { t.lower() for t in types }
+        _resultTypes(value, types)
+        value = _copy(value, {})
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            expires = time.monotonic() + self.ttl
+            self._entries[key] = (expires, frozenset(types), value)
+            for t in types:
+                self._typeIndex.setdefault(t, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, types=None):
+        """Discard the results that depend on some entity types.
+
+        :param types: names of the entity types.  If this is
+            :const:`None` or contains any of the types in
+            :data:`~icat.resultcache.AuthzTypes`, discard all results.
+        :type types: iterable of :class:`str`
+        """
+        if types is not None:
+            types = { t.lower() for t in types }
+        with self._lock:
+            if types is None or not types.isdisjoint(AuthzTypes):
+                self._entries.clear()
+                self._typeIndex.clear()
+                return
+            keys = set()
+            for t in types:
+                keys.update(self._typeIndex.get(t, ()))
+            for key in keys:
+                self._remove(key)
+        log.debug("Invalidated %d cached results for %s",
+                  len(keys), ", ".join(sorted(types)))
+
+    def clear(self):
+        """Discard all results and reset the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._typeIndex.clear()
+            self.hits = 0
+            self.misses = 0
@@ -56,9 +56,10 @@ with open_dumpfile(client, conf.file, conf.format, 'w') as dumpfile:
     for i in client.searchChunked(investsearch):
         # We fetch Dataset including DatasetParameter.  This may lead
         # to a large total number of objects even for a small number
-        # of Datasets fetched at once.  Set a very small chunksize to
+        # of Datasets fetched at once.  Let the chunksize adapt to
         # avoid hitting the limit.
-        dumpfile.writedata(getInvestigationQueries(client, i), chunksize=5)
+        dumpfile.writedata(getInvestigationQueries(client, i),
+                           chunksize="auto")
     dumpfile.writedata(getDataCollectionQueries(client))
     if 'dataPublication' in client.typemap:
         pubsearch = Query(client, "DataPublication", attributes="id",
@@ -0,0 +1,60 @@
+#! /usr/bin/python
+"""Benchmark for decoding the responses to search calls.
+
+Search for datafiles including their related objects and report the
+number of objects per second decoded by Suds and by the fast decoder
+from :mod:`icat.decoder` respectively.  See :mod:`benchhelper` for
+the ICAT server to connect to.  The fake ICAT server is filled with
+synthetic datafiles.  The response is fetched only once from the
+server, so the timing does not include the network transfer.
+"""
+
+import timeit
+from icat.decoder import SearchDecoder
+from icat.query import Query
+import benchhelper
+
+config = benchhelper.Config(ids=False)
+config.add_variable('rows', ("-r", "--rows"),
+                    dict(help="maximum number of datafiles to search for"),
+                    default=10000, type=int)
+config.add_variable('number', ("-n", "--number"),
+                    dict(help="number of repetitions"),
+                    default=3, type=int)
+client, conf = config.getconfig()
+benchhelper.login(client, conf)
+
+if benchhelper.fake:
+    table = benchhelper.faketable
+    facility = table.add("Facility", name="Bench")
+    investigation = table.add("Investigation", facility=facility,
+                              name="bench", visitId="1.1",
+                              title="Benchmark data")
+    dataset = table.add("Dataset", investigation=investigation,
+                        name="raw", complete=False)
+    for i in range(conf.rows):
+        table.add("Datafile", dataset=dataset, name="file%05d.dat" % i,
+                  fileSize=1024, checksum="3610c4b2",
+                  location="bench/raw/file%05d.dat" % i)
+
+query = Query(client, "Datafile", includes="1", limit=(0, conf.rows))
+client.set_options(retxml=True)
+try:
+    reply = client.service.search(client.sessionId, str(query))
+finally:
+    client.set_options(retxml=False)
+decoder = SearchDecoder(client)
+nobj = len(decoder.decode(reply))
+print("%s: %d objects, %d bytes" % (query, nobj, len(reply)))
+
+def decode_suds():
+    instances = client.service.search(client.sessionId, str(query),
+                                      __inject={'reply': reply})
+    return [client.getEntity(i) for i in instances]
+
+def decode_fast():
+    return decoder.decode(reply)
+
+for label, func in [("suds", decode_suds), ("fast decoder", decode_fast)]:
+    t = min(timeit.repeat(func, number=1, repeat=conf.number))
+    print("%-16s %10.0f objects/s" % (label, nobj / t))
@@ -0,0 +1,44 @@
+#! /usr/bin/python
+"""Benchmark for rendering the requests of API calls.
+
+Report the number of requests per second rendered by Suds and by the
+marshaller from :mod:`icat.marshaller` respectively for a search and
+a create call.  See :mod:`benchhelper` for the ICAT server to
+connect to.  No calls are actually sent to the server.
+"""
+
+import timeit
+import benchhelper
+
+config = benchhelper.Config(ids=False)
+config.add_variable('number', ("-n", "--number"),
+                    dict(help="number of requests to render"),
+                    default=10000, type=int)
+client, conf = config.getconfig()
+benchhelper.login(client, conf)
+
+facility = client.new("Facility", id=1)
+investigation = client.new("Investigation", id=2)
+dataset = client.new("Dataset", name="bench", complete=False,
+                     investigation=investigation)
+datafile = client.new("Datafile", name="bench.dat", dataset=dataset,
+                      fileSize=1024, checksum="3610c4b2")
+calls = [
+    ("search", (client.sessionId, "SELECT f FROM Facility f")),
+    ("create", (client.sessionId, datafile.instance)),
+]
+
+def render_suds(method, args):
+    binding = method.binding.input
+    return binding.get_message(method, args, {}).plain()
+
+def render_fast(method, args):
+    return client.requestMarshaller.marshal(method, args)
+
+for name, args in calls:
+    method = getattr(client.service, name).method
+    assert render_fast(method, args) == render_suds(method, args)
+    for label, func in [("suds", render_suds), ("marshaller", render_fast)]:
+        t = timeit.timeit(lambda: func(method, args), number=conf.number)
+        print("%-8s %-12s %10.0f requests/s"
+              % (name, label, conf.number / t))
@@ -0,0 +1,84 @@
+#! /usr/bin/python
+"""Microbenchmark for the construction of queries.
+
+Build a set of typical queries many times and report the time per
+query, once with the lookups done as before the introduction of
+:class:`icat.schemaindex.SchemaIndex` (a linear scan over the entity
+info for each attribute and nothing memoized), once with a fresh
+schema index for each set of queries, and once with the client's
+memoizing schema index.  See :mod:`benchhelper` for the ICAT server
+to connect to.  No login is required.  All schema information is
+fetched up front, so the timing does not include any requests to the
+server.
+"""
+
+import timeit
+from icat.query import Query
+from icat.schemaindex import SchemaIndex
+import benchhelper
+
+config = benchhelper.Config(needlogin=False, ids=False)
+config.add_variable('number', ("-n", "--number"),
+                    dict(help="number of repetitions"),
+                    default=200, type=int)
+client, conf = config.getconfig()
+client.typemap.load()
+for cls in set(client.typemap.values()):
+    if cls.BeanName:
+        client.getEntityInfo(cls.BeanName)
+
+class _NoMemo(dict):
+    """A dict that forgets everything that is stored in it.
+    """
+    def __setitem__(self, key, value):
+        pass
+
+class BaselineIndex(SchemaIndex):
+    """Emulate the lookups without the schema index.
+
+    Attribute information is found by a linear scan over the fields
+    in the entity info and nothing is memoized.
+    """
+    def __init__(self, client):
+        super().__init__(client)
+        self._classes = _NoMemo()
+        self._attrPaths = _NoMemo()
+        self._naturalOrders = _NoMemo()
+    def getAttrInfo(self, cls, attr):
+        info = self._getClient().getEntityInfo(cls.BeanName)
+        for f in info.fields:
+            if f.name == attr:
+                return f
+        return super().getAttrInfo(cls, attr)
+
+# Only use the entity types known to the fake ICAT server.
+def build_queries():
+    Query(client, "Datafile", order=True,
+          conditions={"dataset.investigation.name": "= 'x'",
+                      "dataset.name": "= 'raw'"},
+          includes=["dataset.investigation.facility"])
+    Query(client, "Investigation", order=["facility", "name", "visitId"],
+          conditions={"datasets.datafiles.name": "= 'a.dat'"},
+          includes="1")
+    Query(client, "Dataset", order=True,
+          conditions={"investigation.facility.name": "= 'x'",
+                      "complete": "= True"},
+          includes=["investigation.facility"])
+    Query(client, "Facility", order=True, includes=["investigations"])
+
+def build_queries_cold():
+    client.schemaIndex = SchemaIndex(client)
+    build_queries()
+
+nq = 4
+memoized = client.schemaIndex
+for label, index, func in [
+        ("linear scan", BaselineIndex(client), build_queries),
+        ("cold schema index", None, build_queries_cold),
+        ("memoized schema index", memoized, build_queries),
+]:
+    if index is not None:
+        client.schemaIndex = index
+    func()
+    t = min(timeit.repeat(func, number=conf.number, repeat=3))
+    print("%-24s %8.1f us/query" % (label, 1e6 * t / (nq * conf.number)))
@@ -0,0 +1,63 @@
+"""Common setup for the benchmark scripts.
+
+The benchmarks connect to the ICAT server configured in the usual
+way, see :mod:`icat.config`.  With the command line option
+``--fake``, they use the fake ICAT server from the test suite
+instead, see :class:`FakeICATServer` in ``tests/conftest.py``.  It
+only knows a few entity types and answers search calls with the
+objects in :data:`faketable`.
+"""
+
+import atexit
+from pathlib import Path
+import shutil
+import sys
+import tempfile
+import threading
+import icat.config
+from icat.cache import SchemaCache
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from conftest import FakeICATServer, FakeTable
+
+fake = "--fake" in sys.argv[1:]
+"""Whether the fake ICAT server is used."""
+
+faketable = FakeTable()
+"""The objects known to the fake ICAT server."""
+
+def Config(**kwargs):
+    """Create the configuration of the benchmark.
+
+    The keyword arguments are passed to :class:`icat.config.Config`.
+    If the fake ICAT server is used, it is started and preset in the
+    configuration, no login is required in this case.
+    """
+    if fake:
+        server = FakeICATServer()
+        faketable.install(server)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        cacheDir = tempfile.mkdtemp(prefix="python-icat-bench-")
+        atexit.register(shutil.rmtree, cacheDir)
+        SchemaCache(cacheDir, server.url).save(server)
+        kwargs.update(needlogin=False,
+                      preset=dict(url=server.url, cacheDir=cacheDir))
+    config = icat.config.Config(**kwargs)
+    config.add_variable('fake', ("--fake",),
+                        dict(help="use the fake ICAT server of the tests"),
+                        type=icat.config.flag, default=False)
+    return config
+
+def login(client, conf):
+    """Log in to the ICAT server.
+
+    The fake ICAT server does not need a login, the client only gets
+    a fake session id.
+    """
+    if fake:
+        client.autoLogout = False
+        client.sessionId = "fake-session-id"
+    else:
+        client.login(conf.auth, conf.credentials)
@@ -2,6 +2,8 @@
 """
 
 import datetime
+import gzip
+import http.server
 import locale
 import logging
 import os
@@ -9,14 +11,21 @@ from pathlib import Path
 from random import getrandbits
 import re
 import shutil
+import socketserver
 import subprocess
 import sys
 import tempfile
+import threading
 import zlib
+from xml.sax.saxutils import escape
+from lxml import etree
 import pytest
+import suds.sudsobject
 import icat
 import icat.config
 import icat.dumpfile
+from icat.cache import SchemaCache
+from icat.exception import VersionMethodError
 from icat.query import Query
 try:
     import icat.dumpfile_xml
@@ -52,6 +61,12 @@ _skip_slow = True
 testdir = Path(__file__).resolve().parent
 testdatadir = testdir / "data"
 
+# The tests of icat.aio use syntax that is new in Python 3.6 and
+# the module is not available in older versions.
+collect_ignore = []
+if sys.version_info < (3, 6):
+    collect_ignore.append("test_01_aio.py")
+
 def pytest_addoption(parser):
     parser.addoption("--no-skip-slow", action="store_true", default=False,
                      help="do not skip slow tests.")
@@ -109,6 +124,512 @@ class DummyDatafile():
             self.mtime = None
 
 
+def mkobj(classname, **kwargs):
+    """Create a Suds object of class `classname` having the attributes
+    in `kwargs`.
+    """
+    return suds.sudsobject.Factory.object(classname, kwargs)
+
+def mkfield(name, relType, type, notNullable=False):
+    """Create the entityField of an entityInfo.
+    """
+    return mkobj("entityField", name=name, relType=relType, type=type,
+                 notNullable=notNullable)
+
+def mkinfo(constraint, fields, **kwargs):
+    """Create an entityInfo having the unique `constraint`, the
+    `fields`, and the meta attributes common to all entity types.
+    """
+    meta = [
+        mkfield("createId", "ATTRIBUTE", "String"),
+        mkfield("createTime", "ATTRIBUTE", "Date"),
+        mkfield("id", "ATTRIBUTE", "Long"),
+        mkfield("modId", "ATTRIBUTE", "String"),
+        mkfield("modTime", "ATTRIBUTE", "Date"),
+    ]
+    constraints = [ mkobj("constraint", fieldNames=constraint) ]
+    return mkobj("entityInfo", constraints=constraints, fields=meta+fields,
+                 **kwargs)
+
+
+class FakeSchemaClient():
+    """Emulate those parts of icat.client.Client that retrieve the
+    schema from the ICAT server.
+
+    `entityInfo` maps the entity names to their entityInfo, all of
+    them but ``Parameter`` are returned by getEntityNames().  The
+    number of calls is counted in `calls`, the names passed to
+    getEntityInfo() are recorded in `infoCalls`.  If `authInfo` is
+    :const:`None`, getAuthenticatorInfo() fails as with old ICAT
+    servers.
+    """
+    def __init__(self, entityInfo, apiversion="6.2.0", authInfo=[]):
+        self.apiversion = Version(apiversion)
+        self.entityInfo = entityInfo
+        self.authInfo = authInfo
+        self.calls = 0
+        self.infoCalls = []
+    def getEntityNames(self):
+        self.calls += 1
+        return sorted(n for n in self.entityInfo.keys() if n != 'Parameter')
+    def getEntityInfo(self, beanName):
+        self.calls += 1
+        self.infoCalls.append(beanName)
+        return self.entityInfo[beanName]
+    def getAuthenticatorInfo(self):
+        self.calls += 1
+        if self.authInfo is None:
+            raise VersionMethodError("getAuthenticatorInfo")
+        return self.authInfo
+
+
+class FakeICATHandler(http.server.BaseHTTPRequestHandler):
+    """Emulate an ICAT server.
+
+    Serve the reduced service description from the test data and
+    answer SOAP requests with the responses set in the server.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "text/xml; charset=utf-8")
+        # Compress the response if the client accepts it.
+        compress = "gzip" in self.headers.get("Accept-Encoding", "")
+        if compress:
+            self.send_header("Content-Encoding", "gzip")
+        if isinstance(body, bytes):
+            if compress:
+                body = gzip.compress(body)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            # An iterable of chunks, send them one by one as they
+            # become available.
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            if compress:
+                body = self._compress_chunks(body)
+            for chunk in body:
+                if chunk:
+                    size = ("%x\r\n" % len(chunk)).encode("ascii")
+                    self.wfile.write(size + chunk + b"\r\n")
+                    self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+
+    def _compress_chunks(self, chunks):
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            yield compressor.compress(chunk)
+            yield compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+    def do_GET(self):
+        self._send(200, self.server.wsdldata)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        self.server.requests.append((self.headers, body))
+        root = etree.fromstring(body)
+        op = etree.QName(root.find("{%s}Body" % soapenv_ns)[0]).localname
+        status, reply = self.server.responses[op]
+        if callable(reply):
+            reply = reply(root)
+            if isinstance(reply, tuple):
+                status, reply = reply
+            reply = soap_response(reply)
+        self._send(status, reply)
+
+
+class FakeICATServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """A fake ICAT server to test the client side without a real server.
+
+    It only knows the API calls and the entity types defined in
+    ``icat.wsdl`` in the test data.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    # A subset of the entity info matching the types in icat.wsdl.
+    EntityInfo = {
+        'Parameter': ([], []),
+        'Facility': (["name"], [
+            ("daysUntilRelease", "ATTRIBUTE", "Integer"),
+            ("description", "ATTRIBUTE", "String"),
+            ("fullName", "ATTRIBUTE", "String"),
+            ("investigations", "MANY", "Investigation"),
+            ("name", "ATTRIBUTE", "String"),
+            ("url", "ATTRIBUTE", "String"),
+        ]),
+        'Investigation': (["facility", "name", "visitId"], [
+            ("datasets", "MANY", "Dataset"),
+            ("doi", "ATTRIBUTE", "String"),
+            ("endDate", "ATTRIBUTE", "Date"),
+            ("facility", "ONE", "Facility"),
+            ("name", "ATTRIBUTE", "String"),
+            ("startDate", "ATTRIBUTE", "Date"),
+            ("title", "ATTRIBUTE", "String"),
+            ("visitId", "ATTRIBUTE", "String"),
+        ]),
+        'Dataset': (["investigation", "name"], [
+            ("complete", "ATTRIBUTE", "Boolean"),
+            ("datafiles", "MANY", "Datafile"),
+            ("description", "ATTRIBUTE", "String"),
+            ("investigation", "ONE", "Investigation"),
+            ("name", "ATTRIBUTE", "String"),
+        ]),
+        'Datafile': (["dataset", "name"], [
+            ("checksum", "ATTRIBUTE", "String"),
+            ("datafileCreateTime", "ATTRIBUTE", "Date"),
+            ("dataset", "ONE", "Dataset"),
+            ("fileSize", "ATTRIBUTE", "Long"),
+            ("location", "ATTRIBUTE", "String"),
+            ("name", "ATTRIBUTE", "String"),
+        ]),
+    }
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeICATHandler)
+        self.url = ("http://127.0.0.1:%d/ICATService/ICAT?wsdl"
+                    % self.server_address[1])
+        with (testdatadir / "icat.wsdl").open("rt") as f:
+            wsdl = f.read()
+        location = "http://127.0.0.1:%d/ICATService/ICAT" % self.server_address[1]
+        wsdl = wsdl.replace("http://localhost:8080/ICATService/ICAT", location)
+        self.wsdldata = wsdl.encode("utf-8")
+        self.apiversion = Version("6.0.0")
+        self.reset()
+
+    def reset(self):
+        """Forget all requests and reset the responses to the default.
+        """
+        self.requests = []
+        self.responses = {
+            'getApiVersion': (200, soap_response(
+                '<ns2:getApiVersionResponse xmlns:ns2="%s">'
+                '<return>%s</return></ns2:getApiVersionResponse>'
+                % (icat_ns, self.apiversion))),
+        }
+
+    def set_response(self, op, content, status=200):
+        """Set the response to the API call `op`.
+        """
+        self.responses[op] = (status, soap_response(content))
+
+    def set_chunked_response(self, op, chunks, status=200):
+        """Set the response to the API call `op` to be sent in chunks.
+
+        `chunks` is an iterable of :class:`bytes` that is consumed
+        while sending the response.  Together, they must form the
+        full SOAP envelope.
+        """
+        self.responses[op] = (status, chunks)
+
+    def set_response_handler(self, op, handler, status=200):
+        """Set a handler to create the response to the API call `op`.
+
+        `handler` is called with the parsed request for each call
+        and must return the content of the response, or a tuple of
+        the status and the content.  It is called in the threads of
+        the server.
+        """
+        self.responses[op] = (status, handler)
+
+    # The following methods emulate the parts of icat.client.Client
+    # needed to save the schema snapshot with SchemaCache.
+
+    def getEntityNames(self):
+        return sorted(n for n in self.EntityInfo.keys() if n != 'Parameter')
+
+    def getEntityInfo(self, beanName):
+        constraint, fields = self.EntityInfo[beanName]
+        fields = [ mkfield(n, r, t, notNullable=(n in constraint))
+                   for n, r, t in fields ]
+        return mkinfo(constraint, fields)
+
+    def getAuthenticatorInfo(self):
+        return []
+
+    def client(self, cacheDir, **kwargs):
+        """Create a client connected to this server.
+
+        The client is set up with a schema snapshot in `cacheDir` and
+        a fake session id.
+        """
+        cache = SchemaCache(cacheDir, self.url)
+        if not cache.load(self.apiversion):
+            cache.save(self)
+        client = icat.Client(self.url, cacheDir=cacheDir, **kwargs)
+        client.autoLogout = False
+        client.sessionId = "fake-session-id"
+        return client
+
+soapenv_ns = "http://schemas.xmlsoap.org/soap/envelope/"
+icat_ns = "http://icatproject.org"
+
+def soap_response(content):
+    """Wrap the content into a SOAP envelope.
+    """
+    return ('<?xml version="1.0" ?>'
+            '<S:Envelope xmlns:S="%s"><S:Body>%s</S:Body></S:Envelope>'
+            % (soapenv_ns, content)).encode("utf-8")
+
+icat_fault = """<S:Fault>
+<faultcode>S:Server</faultcode>
+<faultstring>%(msg)s</faultstring>
+<detail>
+<ns2:IcatException xmlns:ns2="%(ns)s">
+<message>%(msg)s</message>
+<offset>%(offset)d</offset>
+<type>%(type)s</type>
+</ns2:IcatException>
+</detail>
+</S:Fault>"""
+
+def fault_response(type, msg, offset=-1):
+    """Create the content of the response to a failing API call.
+    """
+    return (500, icat_fault % dict(msg=escape(msg), ns=icat_ns,
+                                   offset=offset, type=type))
+
+
+class FakeTable():
+    """A fake table of objects to answer search, createMany, and update
+    calls in the fake ICAT server.
+
+    Only the entity types known to FakeICATServer are supported.
+    Search calls only understand a simple subset of JPQL: optional
+    JOINs, WHERE clauses being a single or an OR of parenthesized
+    AND-combined comparisons of attributes with literal values, ORDER
+    BY, INCLUDE, and LIMIT, as well as ``MIN(o.id)`` and
+    ``MAX(o.id)``.  All many-to-one relations of the objects found
+    are included in the result, regardless of the INCLUDE clause.
+
+    If `nocase` is set, strings are compared case insensitive, as
+    some databases do.  If `maxEntities` is set, searches that may
+    return more objects are rejected.  If `failure` is set to a tuple
+    of an ICAT exception type and a message, all calls fail with that
+    error.  All calls are recorded in `calls` as tuples of the name
+    of the call and the query, the values of the beans, or the id
+    respectively.
+    """
+
+    def __init__(self):
+        self.fields = {
+            n: { f: (r, t) for f, r, t in fields }
+            for n, (_, fields) in FakeICATServer.EntityInfo.items()
+        }
+        self.objects = {}
+        self.types = {}
+        self.nextid = 1000
+        self.nocase = False
+        self.maxEntities = None
+        self.failure = None
+        self.calls = []
+        self.lock = threading.Lock()
+
+    @property
+    def queries(self):
+        return [ a for op, a in self.calls if op == "search" ]
+
+    def add(self, beanName, id=None, **values):
+        """Add an object to the table and return its id.
+        """
+        if id is None:
+            id = self.nextid
+            self.nextid += 1
+        self.objects[id] = values
+        self.types[id] = beanName
+        return id
+
+    def install(self, server):
+        """Set the handlers in the fake ICAT server.
+        """
+        server.set_response_handler("search", self.search)
+        server.set_response_handler("createMany", self.createMany)
+        server.set_response_handler("update", self.update)
+
+    def _value(self, id, path):
+        for attr in path:
+            id = id if attr == "id" else self.objects[id].get(attr)
+        return id
+
+    def _norm(self, value):
+        if self.nocase and isinstance(value, str):
+            return value.lower()
+        return value
+
+    def _compare(self, value, op, other):
+        value, other = self._norm(value), self._norm(other)
+        if value is None:
+            return False
+        elif op == "=":
+            return value == other
+        elif op == ">=":
+            return value >= other
+        elif op == "<=":
+            return value <= other
+        elif op == ">":
+            return value > other
+        else:
+            return value < other
+
+    def _render(self, id):
+        beanName = self.types[id]
+        values = dict(self.objects[id], id=id)
+        content = []
+        for attr, value in sorted(values.items()):
+            if value is None:
+                continue
+            relType, type = self.fields[beanName].get(attr, (None, None))
+            if relType == "ONE":
+                if self.types.get(value) == type:
+                    value = self._render(value)
+                else:
+                    value = "<id>%d</id>" % value
+            elif isinstance(value, bool):
+                value = "true" if value else "false"
+            elif isinstance(value, str):
+                value = escape(value)
+            content.append("<%s>%s</%s>" % (attr, value, attr))
+        return "".join(content)
+
+    def _parse(self, bean):
+        xsitype = bean.get("{http://www.w3.org/2001/XMLSchema-instance}type")
+        typename = xsitype.rpartition(":")[2].lower()
+        beanName = next(n for n in self.fields if n.lower() == typename)
+        id = None
+        values = {}
+        for e in bean:
+            attr = etree.QName(e).localname
+            if attr == "id":
+                id = int(e.text)
+                continue
+            relType, type = self.fields[beanName][attr]
+            if relType == "ONE":
+                values[attr] = int(e.find("id").text)
+            elif relType == "ATTRIBUTE":
+                if type in ("Integer", "Long"):
+                    values[attr] = int(e.text)
+                elif type == "Boolean":
+                    values[attr] = (e.text == "true")
+                else:
+                    values[attr] = e.text or ""
+        return beanName, id, values
+
+    def _search(self, query):
+        m = re.match(r"SELECT (?:(MIN|MAX)\(o\.id\)|o) FROM (\w+) o"
+                     r"((?: JOIN o\.\w+ AS \w+)*)(?: WHERE (.*?))?"
+                     r"(?: ORDER BY (.*?))?(?: INCLUDE (?:.*?))?"
+                     r"(?: LIMIT (\d+), (\d+))?$", query)
+        if not m:
+            return fault_response("BAD_PARAMETER", "Invalid query")
+        func, beanName, joins, where, order, skip, count = m.groups()
+        aliases = { "o": [] }
+        for rel, alias in re.findall(r"JOIN o\.(\w+) AS (\w+)", joins):
+            aliases[alias] = [rel]
+        def path(p):
+            alias, *attrs = p.split(".")
+            return aliases[alias] + attrs
+        groups = []
+        if where:
+            for g in re.findall(r"\(([^()]*)\)", where) or [where]:
+                conds = re.findall(r"([\w.]+) (=|>=|<=|>|<) "
+                                   r"(?:'((?:[^']|'')*)'|(\d+))", g)
+                groups.append([ (path(p), op, int(n) if n
+                                 else s.replace("''", "'"))
+                                for p, op, s, n in conds ])
+        ids = [ i for i in sorted(self.objects)
+                if self.types[i] == beanName and
+                (not groups or
+                 any(all(self._compare(self._value(i, p), op, v)
+                         for p, op, v in g) for g in groups)) ]
+        if func:
+            if not ids:
+                return []
+            value = min(ids) if func == "MIN" else max(ids)
+            return ['<return xmlns:xs="http://www.w3.org/2001/XMLSchema" '
+                    'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+                    'xsi:type="xs:long">%d</return>' % value]
+        if order:
+            for item in reversed(order.split(", ")):
+                p, _, direction = item.partition(" ")
+                ids.sort(key=lambda i: self._norm(self._value(i, path(p))),
+                         reverse=(direction == "DESC"))
+        if count is not None:
+            skip, count = int(skip), int(count)
+            ids = ids[skip:skip+count]
+        else:
+            count = len(ids)
+        if self.maxEntities is not None and count > self.maxEntities:
+            msg = "attempt to return more than %d entities" % self.maxEntities
+            return fault_response("VALIDATION", msg)
+        typename = beanName[0].lower() + beanName[1:]
+        return ['<return xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+                'xsi:type="ns2:%s">%s</return>' % (typename, self._render(i))
+                for i in ids]
+
+    def search(self, root):
+        query = next(root.iter("query")).text
+        with self.lock:
+            self.calls.append(("search", query))
+            if self.failure:
+                return fault_response(*self.failure)
+            returns = self._search(query)
+        if isinstance(returns, tuple):
+            return returns
+        return ('<ns2:searchResponse xmlns:ns2="%s">%s</ns2:searchResponse>'
+                % (icat_ns, "".join(returns)))
+
+    def createMany(self, root):
+        beans = [ self._parse(b) for b in root.iter("beans") ]
+        with self.lock:
+            self.calls.append(("createMany", [ v for _, _, v in beans ]))
+            if self.failure:
+                return fault_response(*self.failure)
+            keys = set()
+            for i in self.objects:
+                beanName = self.types[i]
+                constraint = FakeICATServer.EntityInfo[beanName][0]
+                keys.add((beanName, tuple(self._norm(self.objects[i].get(a))
+                                          for a in constraint)))
+            for i, (beanName, _, values) in enumerate(beans):
+                constraint = FakeICATServer.EntityInfo[beanName][0]
+                if not constraint:
+                    continue
+                key = (beanName, tuple(self._norm(values.get(a))
+                                       for a in constraint))
+                if key in keys:
+                    msg = "%s exists" % beanName
+                    return fault_response("OBJECT_ALREADY_EXISTS", msg, i)
+                keys.add(key)
+            ids = [ self.add(beanName, **values)
+                    for beanName, _, values in beans ]
+        returns = [ '<return>%d</return>' % i for i in ids ]
+        return ('<ns2:createManyResponse xmlns:ns2="%s">%s'
+                '</ns2:createManyResponse>' % (icat_ns, "".join(returns)))
+
+    def update(self, root):
+        beanName, id, values = self._parse(next(root.iter("bean")))
+        with self.lock:
+            self.calls.append(("update", id))
+            if self.failure:
+                return fault_response(*self.failure)
+            if self.types.get(id) != beanName:
+                msg = "%s[id:%s] not found" % (beanName, id)
+                return fault_response("NO_SUCH_OBJECT_FOUND", msg)
+            self.objects[id] = values
+        return '<ns2:updateResponse xmlns:ns2="%s"/>' % icat_ns
+
+
 def getConfig(confSection="root", **confArgs):
     """Get the configuration, skip on ConfigError.
     """
@@ -265,6 +786,32 @@ def tmpdirsec(request):
     shutil.rmtree(tmpdir)
 
 
+@pytest.fixture(scope="session")
+def fakeicat():
+    server = FakeICATServer()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture(scope="function")
+def fakeclient(fakeicat, tmpdirsec):
+    """A client connected to the fake ICAT server.
+    """
+    fakeicat.reset()
+    return fakeicat.client(tmpdirsec / "fakeicat-cache")
+
+@pytest.fixture(scope="function")
+def faketable(fakeicat, fakeclient):
+    """A fake table of objects in the fake ICAT server.
+    """
+    table = FakeTable()
+    table.install(fakeicat)
+    return table
+
+
 @pytest.fixture(scope="session")
 def standardCmdArgs():
     _, conf = getConfig()
@@ -0,0 +1,84 @@
+"""Test adaptive chunk sizing in Client.searchChunked() with a fake
+ICAT server.
+"""
+
+import re
+import pytest
+import icat
+from icat.client import _ChunkedSearch
+
+
+class Obj():
+    def __init__(self, id):
+        self.id = id
+
+@pytest.fixture(scope="function")
+def datasets(faketable):
+    for i in range(1, 301):
+        faketable.add("Dataset", id=i, investigation=10, name="ds%03d" % i)
+    return faketable
+
+def chunk_sizes(queries):
+    return [int(re.search(r"LIMIT \d+, (\d+)", q).group(1)) for q in queries]
+
+
+def test_adaptive_initial():
+    """The initial chunk size respects maxEntities.
+    """
+    chunked = _ChunkedSearch("Dataset", chunksize="auto")
+    assert chunked.chunksize == _ChunkedSearch.initialChunksize
+    chunked = _ChunkedSearch("Dataset", chunksize="auto", maxEntities=40)
+    assert chunked.nextQuery() == "0, 40 Dataset"
+    chunked = _ChunkedSearch("Dataset", chunksize="auto", maxEntities=1)
+    assert chunked.nextQuery() == "0, 1 Dataset"
+    chunked = _ChunkedSearch("Dataset", chunksize=1, maxEntities=1)
+    assert chunked.nextQuery() == "0, 2 Dataset"
+
+def test_adaptive_grow_shrink():
+    """The chunk size follows the time taken by the search calls.
+    """
+    chunked = _ChunkedSearch("Dataset", chunksize="auto", maxEntities=300)
+    chunked.addResult([Obj(i) for i in range(100)], 0.1)
+    assert chunked.chunksize == 200
+    chunked.addResult([Obj(i) for i in range(200)], 0.1)
+    assert chunked.chunksize == 300
+    chunked.addResult([Obj(i) for i in range(300)], 0.8)
+    assert chunked.chunksize == 300
+    chunked.addResult([Obj(i) for i in range(300)], 5.0)
+    assert chunked.chunksize == 150
+    assert chunked.nextQuery() == "900, 150 Dataset"
+
+def test_adaptive_fixed():
+    """A fixed chunk size is not adjusted.
+    """
+    chunked = _ChunkedSearch("Dataset", chunksize=10)
+    chunked.addResult([Obj(i) for i in range(10)], 0.01)
+    assert chunked.chunksize == 10
+    assert not chunked.reject(icat.ICATValidationError(
+        "attempt to return more than 5 entities"))
+
+def test_adaptive_reject(fakeclient, datasets):
+    """Rejected chunks are split and the chunk size does not grow
+    again afterwards.
+    """
+    datasets.maxEntities = 30
+    query = "SELECT o FROM Dataset o"
+    result = list(fakeclient.searchChunked(query, chunksize="auto"))
+    assert [o.id for o in result] == list(range(1, 301))
+    sizes = chunk_sizes(datasets.queries)
+    assert sizes[:3] == [100, 50, 25]
+    assert set(sizes[3:]) == {25}
+
+def test_adaptive_other_error(fakeclient, datasets):
+    """Other errors are raised as usual.
+    """
+    datasets.maxEntities = 0
+    query = "SELECT o FROM Dataset o"
+    with pytest.raises(icat.ICATValidationError):
+        list(fakeclient.searchChunked(query, chunksize="auto"))
+    assert chunk_sizes(datasets.queries) == [100, 50, 25, 12, 6, 3, 1]
+    datasets.calls.clear()
+    datasets.maxEntities = 30
+    with pytest.raises(icat.ICATValidationError):
+        list(fakeclient.searchChunked(query, chunksize=50))
+    assert chunk_sizes(datasets.queries) == [50]
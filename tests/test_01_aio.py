@@ -0,0 +1,178 @@
+"""Test module icat.aio with a fake ICAT server.
+"""
+
+import asyncio
+import pytest
+import suds.client
+import icat
+from icat.aio import AsyncClient
+from icat.resultcache import ResultCache
+from conftest import icat_ns
+from test_01_decoder import datafiles, fault, tree
+from test_01_marshaller import get_objects
+
+
+def run(coro):
+    """Run a coroutine in a new event loop.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+async def with_client(client, func, **kwargs):
+    """Call func with an AsyncClient, closing it afterwards.
+    """
+    async with AsyncClient(client, **kwargs) as aclient:
+        return await func(aclient)
+
+
+@pytest.mark.parametrize("compression", [False, True])
+def test_aio_search(fakeicat, fakeclient, tmpdirsec, compression):
+    """The async client yields the same search result as the
+    regular one.
+    """
+    fakeicat.set_response("search", datafiles)
+    result = fakeclient.search("SELECT o FROM Object o")
+    client = fakeicat.client(tmpdirsec / "fakeicat-cache",
+                             compression=compression)
+    async def search(aclient):
+        return await aclient.search("SELECT o FROM Object o")
+    aresult = run(with_client(client, search))
+    assert tree(aresult) == tree(result)
+    assert aresult[0].client is client
+    headers, body = fakeicat.requests[-1]
+    assert ("gzip" in headers.get("Accept-Encoding", "")) is compression
+
+def test_aio_concurrent(fakeicat, fakeclient):
+    """Run many searches concurrently over a limited number of
+    connections.
+    """
+    fakeicat.set_response("search", datafiles)
+    result = fakeclient.search("SELECT o FROM Object o")
+    async def search(aclient):
+        queries = ["SELECT o FROM Object o WHERE o.id > %d" % i
+                   for i in range(20)]
+        results = await asyncio.gather(*[aclient.search(q) for q in queries])
+        idle = [c for conns in aclient._idle.values() for c in conns]
+        assert 1 <= len(idle) <= 4
+        return results
+    results = run(with_client(fakeclient, search, maxConnections=4))
+    assert len(results) == 20
+    for r in results:
+        assert tree(r) == tree(result)
+    sent = sorted(body for headers, body in fakeicat.requests[-20:])
+    assert len(set(sent)) == 20
+
+def test_aio_suds_private(fakeicat, fakeclient, monkeypatch):
+    """The async client does not depend on private methods of Suds.
+    """
+    fakeicat.set_response("search", datafiles)
+    result = fakeclient.search("SELECT o FROM Object o")
+    for name in ("_SoapClient__location", "_SoapClient__headers"):
+        monkeypatch.delattr(suds.client._SoapClient, name)
+    async def search(aclient):
+        return await aclient.search("SELECT o FROM Object o")
+    assert tree(run(with_client(fakeclient, search))) == tree(result)
+
+def test_aio_fault(fakeicat, fakeclient):
+    """Faults are translated into ICATError.
+    """
+    fakeicat.set_response("search", fault, status=500)
+    async def search(aclient):
+        with pytest.raises(icat.ICATSessionError):
+            await aclient.search("SELECT o FROM Object o")
+        # The connection is still usable after the fault.
+        fakeicat.set_response("search", datafiles)
+        return await aclient.search("SELECT o FROM Object o")
+    assert [o.id for o in run(with_client(fakeclient, search))] == [17, 18, 1]
+
+def test_aio_create_get(fakeicat, fakeclient):
+    """Create and get objects with the async client.
+    """
+    fakeicat.set_response("create",
+                          '<ns2:createResponse xmlns:ns2="%s">'
+                          '<return>42</return></ns2:createResponse>'
+                          % icat_ns)
+    fakeicat.set_response("createMany",
+                          '<ns2:createManyResponse xmlns:ns2="%s">'
+                          '<return>43</return><return>44</return>'
+                          '</ns2:createManyResponse>' % icat_ns)
+    fakeicat.set_response("get",
+                          datafiles.replace("searchResponse", "getResponse")
+                          .split("</return>")[0] +
+                          "</return></ns2:getResponse>")
+    objects = get_objects(fakeclient)
+    bean = objects['datafile']
+    beans = [objects['investigation'], objects['facility']]
+    async def calls(aclient):
+        return (await aclient.create(bean),
+                await aclient.createMany(beans),
+                await aclient.get("Datafile", 17))
+    assert fakeclient.create(bean) == 42
+    assert fakeclient.createMany(beans) == [43, 44]
+    expected = fakeclient.get("Datafile", 17)
+    sync_sent = [body for headers, body in fakeicat.requests[-3:]]
+    created, createdMany, obj = run(with_client(fakeclient, calls))
+    assert created == 42
+    assert createdMany == [43, 44]
+    assert tree(obj) == tree(expected)
+    assert obj.BeanName == "Datafile"
+    sent = [body for headers, body in fakeicat.requests[-3:]]
+    assert sent == sync_sent
+
+def test_aio_search_chunked(fakeicat, fakeclient):
+    """searchChunked() is an asynchronous generator.
+    """
+    fakeicat.set_response("search", datafiles)
+    async def search(aclient):
+        return [o.id async for o in
+                aclient.searchChunked("SELECT o FROM Object o",
+                                      count=6, chunksize=3)]
+    assert run(with_client(fakeclient, search)) == [17, 18, 1, 17, 18, 1]
+    queries = [body for headers, body in fakeicat.requests[-2:]]
+    assert b"LIMIT 0, 3" in queries[0]
+    assert b"LIMIT 3, 3" in queries[1]
+
+def test_aio_proxy(fakeclient):
+    """A client configured to use a proxy is refused.
+    """
+    fakeclient.options.proxy = {"http": "proxy.example.org:3128"}
+    with pytest.raises(ValueError):
+        AsyncClient(fakeclient)
+
+def test_aio_logout_identity(fakeicat, fakeclient, tmpdirsec, monkeypatch):
+    """Logout clears the identity map, as in the regular client.
+    """
+    fakeicat.set_response("search", datafiles)
+    client = fakeicat.client(tmpdirsec / "fakeicat-cache", identityMap=True)
+    async def call(name, *args):
+        return None
+    async def logout(aclient):
+        objs = await aclient.search("SELECT o FROM Object o")
+        assert len(client.identityMap) > 0
+        monkeypatch.setattr(aclient, "_call", call)
+        await aclient.logout()
+        assert len(client.identityMap) == 0
+        return objs
+    run(with_client(client, logout))
+    assert client.sessionId is None
+
+def test_aio_invalidate_cache(fakeicat, fakeclient, tmpdirsec):
+    """Writes through the async client invalidate the result cache of
+    the client.
+    """
+    fakeicat.set_response("search", datafiles)
+    fakeicat.set_response("create",
+                          '<ns2:createResponse xmlns:ns2="%s">'
+                          '<return>42</return></ns2:createResponse>'
+                          % icat_ns)
+    client = fakeicat.client(tmpdirsec / "fakeicat-cache",
+                             resultCache=ResultCache(maxsize=10, ttl=60))
+    client.search("SELECT o FROM Datafile o INCLUDE o.dataset")
+    assert len(client.resultCache) == 1
+    async def create(aclient):
+        return await aclient.create(client.new("Datafile", name="x"))
+    assert run(with_client(client, create)) == 42
+    assert len(client.resultCache) == 0
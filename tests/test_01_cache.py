@@ -0,0 +1,140 @@
+"""Test module icat.cache
+"""
+
+from icat.cache import SchemaCache, WSDLCache, sudsobj2data, data2sudsobj
+from icat.helper import Version
+from conftest import mkobj, mkfield, FakeSchemaClient
+
+
+# Note: this is a small fake subset of the ICAT schema, just enough to
+# have some non-trivial content in the cache.
+entityInfo = {
+    'Parameter': mkobj("entityInfo", classComment="A parameter", fields=[
+        mkfield("id", "ATTRIBUTE", "Long"),
+        mkfield("stringValue", "ATTRIBUTE", "String"),
+    ]),
+    'Facility': mkobj("entityInfo", classComment="A facility", constraints=[
+        mkobj("constraint", fieldNames=["name"]),
+    ], fields=[
+        mkfield("id", "ATTRIBUTE", "Long"),
+        mkfield("name", "ATTRIBUTE", "String", notNullable=True),
+        mkfield("investigations", "MANY", "Investigation"),
+    ]),
+    'Investigation': mkobj("entityInfo", constraints=[
+        mkobj("constraint", fieldNames=["facility", "name"]),
+    ], fields=[
+        mkfield("id", "ATTRIBUTE", "Long"),
+        mkfield("name", "ATTRIBUTE", "String", notNullable=True),
+        mkfield("facility", "ONE", "Facility", notNullable=True),
+    ]),
+}
+
+authInfo = [
+    mkobj("authenticatorInfo", mnemonic="simple", keys=[
+        mkobj("credentialKey", name="username", hide=False),
+        mkobj("credentialKey", name="password", hide=True),
+    ]),
+]
+
+
+def test_sudsobj_roundtrip():
+    """Convert a Suds object to data and back again.
+    """
+    info = entityInfo['Investigation']
+    data = sudsobj2data(info)
+    assert data['__class__'] == "entityInfo"
+    obj = data2sudsobj(data)
+    assert obj.__class__.__name__ == "entityInfo"
+    assert obj.constraints[0]['fieldNames'] == ["facility", "name"]
+    assert [f.name for f in obj.fields] == [f.name for f in info.fields]
+    assert obj.fields[2].relType == "ONE"
+    assert obj.fields[2]['notNullable'] is True
+
+def test_schema_cache_save_load(tmpdirsec):
+    """Save the schema info in the cache and load it again.
+    """
+    url = "https://icat.example.com/ICATService/ICAT?wsdl"
+    cachedir = tmpdirsec / "cache-save-load"
+    cache = SchemaCache(cachedir, url)
+    assert cache.load(Version("6.2.0")) is False
+    client = FakeSchemaClient(entityInfo, authInfo=authInfo)
+    cache.save(client)
+    assert client.calls > 0
+    assert cache.path.is_file()
+
+    cache = SchemaCache(cachedir, url)
+    assert cache.load(Version("6.2.0")) is True
+    assert cache.entityNames == ['Facility', 'Investigation']
+    assert set(cache.entityInfo.keys()) == set(entityInfo.keys())
+    info = cache.entityInfo['Facility']
+    assert info.classComment == "A facility"
+    assert [f.name for f in info.fields] == ["id", "name", "investigations"]
+    assert cache.authenticatorInfo[0].mnemonic == "simple"
+    assert cache.authenticatorInfo[0].keys[1].hide is True
+
+def test_schema_cache_stale(tmpdirsec):
+    """The cache must not be used if the server version changed.
+    """
+    url = "https://icat.example.com/ICATService/ICAT?wsdl"
+    cachedir = tmpdirsec / "cache-stale"
+    SchemaCache(cachedir, url).save(FakeSchemaClient(entityInfo, apiversion="5.0.1"))
+    cache = SchemaCache(cachedir, url)
+    assert cache.load(Version("6.2.0")) is False
+    assert cache.entityNames is None
+    assert cache.load(Version("5.0.1")) is True
+
+def test_schema_cache_url(tmpdirsec):
+    """The cache is keyed by the URL of the service.
+    """
+    url1 = "https://icat1.example.com/ICATService/ICAT?wsdl"
+    url2 = "https://icat2.example.com/ICATService/ICAT?wsdl"
+    cachedir = tmpdirsec / "cache-url"
+    SchemaCache(cachedir, url1).save(FakeSchemaClient(entityInfo, authInfo=authInfo))
+    assert SchemaCache(cachedir, url1).load(Version("6.2.0")) is True
+    assert SchemaCache(cachedir, url2).load(Version("6.2.0")) is False
+
+def test_schema_cache_no_authinfo(tmpdirsec):
+    """Old servers do not support getAuthenticatorInfo().
+    """
+    url = "https://icat.example.com/ICATService/ICAT?wsdl"
+    cachedir = tmpdirsec / "cache-no-authinfo"
+    SchemaCache(cachedir, url).save(FakeSchemaClient(entityInfo, authInfo=None))
+    cache = SchemaCache(cachedir, url)
+    assert cache.load(Version("6.2.0")) is True
+    assert cache.authenticatorInfo is None
+
+def test_schema_cache_invalid(tmpdirsec):
+    """An invalid cache file must be ignored.
+    """
+    url = "https://icat.example.com/ICATService/ICAT?wsdl"
+    cachedir = tmpdirsec / "cache-invalid"
+    cache = SchemaCache(cachedir, url)
+    cachedir.mkdir()
+    with cache.path.open("wt") as f:
+        f.write("{ this is not valid JSON")
+    assert cache.load(Version("6.2.0")) is False
+
+def test_wsdl_cache(tmpdirsec):
+    """Store an object in the WSDL cache and retrieve it again.
+
+    The cache entry is only valid after the server version has been
+    recorded and as long as the version does not change.
+    """
+    cachedir = tmpdirsec / "cache-wsdl"
+    wsdl = {'name': "fake WSDL", 'methods': ["login", "search"]}
+    cache = WSDLCache(cachedir)
+    assert cache.get("abc-wsdl") is None
+    assert cache.put("abc-wsdl", wsdl) is wsdl
+    assert cache.last_hit is False
+    assert cache.check_version(Version("6.2.0")) is True
+
+    cache = WSDLCache(cachedir)
+    assert cache.get("abc-wsdl") == wsdl
+    assert cache.last_hit is True
+    assert cache.check_version(Version("6.2.0")) is True
+    assert cache.get("xyz-wsdl") is None
+
+    cache = WSDLCache(cachedir)
+    assert cache.get("abc-wsdl") == wsdl
+    assert cache.check_version(Version("6.3.0")) is False
+    assert cache.get("abc-wsdl") is None
@@ -0,0 +1,176 @@
+"""Test module icat.compression.
+"""
+
+import gzip
+import http.client
+import http.server
+import io
+import socketserver
+import threading
+import zlib
+import pytest
+import icat
+from icat.compression import DecodingResponse
+from icat.ids import DataSelection, IDSClient
+from conftest import icat_ns, soap_response
+from test_01_decoder import datafiles, fault, tree
+
+
+class FakeResponse(io.BytesIO):
+    """A minimal stand in for a HTTP response.
+    """
+    def __init__(self, data, encoding):
+        super().__init__(data)
+        self.headers = http.client.HTTPMessage()
+        self.headers["Content-Type"] = "text/plain"
+        self.headers["Content-Encoding"] = encoding
+        self.headers["Content-Length"] = str(len(data))
+
+
+content = "".join("line %d: %s\n" % (i, "x" * (i % 80))
+                  for i in range(20000)).encode("ascii")
+
+def deflate_raw(data):
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+@pytest.mark.parametrize(("encoding", "compress"), [
+    ("gzip", gzip.compress),
+    ("deflate", zlib.compress),
+    ("deflate", deflate_raw),
+])
+def test_decoding_response(encoding, compress):
+    """Decode responses in all supported formats.
+    """
+    with DecodingResponse(FakeResponse(compress(content), encoding),
+                          encoding) as f:
+        assert f.headers["Content-Type"] == "text/plain"
+        assert "Content-Encoding" not in f.headers
+        assert "Content-Length" not in f.headers
+        assert f.read(5) == content[:5]
+        assert f.readline() == content[5:content.index(b"\n") + 1]
+        assert f.read() == content[content.index(b"\n") + 1:]
+        assert f.read() == b""
+    with DecodingResponse(FakeResponse(compress(content), encoding),
+                          encoding) as f:
+        assert b"".join(f) == content
+
+
+@pytest.fixture(scope="function")
+def gzipclient(fakeclient, fakeicat, tmpdirsec):
+    """A client asking for compressed responses.  Depend on
+    fakeclient so that the server is reset in any case.
+    """
+    return fakeicat.client(tmpdirsec / "fakeicat-cache", compression=True)
+
+def test_compression_search(fakeicat, fakeclient, gzipclient):
+    """Compressed responses yield the same search result.
+    """
+    fakeicat.set_response("search", datafiles)
+    result = fakeclient.search("SELECT o FROM Object o")
+    headers, body = fakeicat.requests[-1]
+    assert "gzip" not in headers.get("Accept-Encoding", "")
+    gzipresult = gzipclient.search("SELECT o FROM Object o")
+    headers, body = fakeicat.requests[-1]
+    assert "gzip" in headers["Accept-Encoding"]
+    assert tree(gzipresult) == tree(result)
+    assert tree(list(gzipclient.searchStream("SELECT o FROM Object o"))) \
+        == tree(result)
+
+def test_compression_stream(fakeicat, gzipclient):
+    """searchStream() decodes a compressed response incrementally.
+    """
+    reply = soap_response(datafiles)
+    pos = reply.index(b"</return>") + 9
+    received = threading.Event()
+    waited = []
+    def chunks():
+        yield reply[:pos]
+        waited.append(received.wait(timeout=10))
+        yield reply[pos:]
+    fakeicat.set_chunked_response("search", chunks())
+    result = gzipclient.searchStream("SELECT o FROM Object o")
+    assert next(result).id == 17
+    received.set()
+    assert [o.id for o in result] == [18, 1]
+    assert waited == [True]
+
+def test_compression_fault(fakeicat, gzipclient):
+    """Compressed error responses are decoded as well.
+    """
+    fakeicat.set_response("search", fault, status=500)
+    with pytest.raises(icat.ICATSessionError):
+        gzipclient.search("SELECT o FROM Object o")
+
+@pytest.mark.parametrize(("threshold", "compressed"), [
+    (None, False),
+    (0, True),
+    (1000000, False),
+])
+def test_compression_request(fakeicat, fakeclient, tmpdirsec,
+                             threshold, compressed):
+    """Send compressed requests if the body is large enough.
+    """
+    fakeicat.set_response("createMany",
+                          '<ns2:createManyResponse xmlns:ns2="%s">'
+                          '<return>43</return><return>44</return>'
+                          '</ns2:createManyResponse>' % icat_ns)
+    client = fakeicat.client(tmpdirsec / "fakeicat-cache",
+                             compressRequests=threshold)
+    objs = [client.new("Facility", name="Fac%d" % i) for i in (1, 2)]
+    assert client.createMany(objs) == [43, 44]
+    headers, body = fakeicat.requests[-1]
+    if compressed:
+        assert headers["Content-Encoding"] == "gzip"
+    else:
+        assert "Content-Encoding" not in headers
+    assert b"<name>Fac2</name>" in body
+
+
+class IDSHandler(http.server.BaseHTTPRequestHandler):
+    """Emulate the few IDS calls needed in the test.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith("/ids/version"):
+            body = b'{"version":"2.0.0"}'
+        else:
+            body = content
+        self.send_response(200)
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            self.send_header("Content-Encoding", "gzip")
+            body = gzip.compress(body)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+@pytest.fixture(scope="module")
+def idsurl():
+    srv = Server(("127.0.0.1", 0), IDSHandler)
+    thread = threading.Thread(target=srv.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield "http://127.0.0.1:%d/ids" % srv.server_address[1]
+    srv.shutdown()
+    srv.server_close()
+
+@pytest.mark.parametrize("compression", [False, True])
+def test_compression_ids(idsurl, compression):
+    """Download data from IDS with and without compression.
+    """
+    ids = IDSClient(idsurl, sessionId="-", compression=compression)
+    assert ids.apiversion == "2.0.0"
+    with ids.getData(DataSelection({'datafileIds': [1]})) as f:
+        assert ("Content-Length" in f.headers) is not compression
+        assert f.read() == content
@@ -1265,6 +1265,29 @@ def test_config_client_kwargs(monkeypatch, fakeClient, tmpconfigfile):
     assert client2 == client
 
 
+def test_config_cachedir(monkeypatch, fakeClient, tmpconfigfile):
+    """Set the cacheDir config variable.
+
+    It should be passed as keyword argument to the client.
+    """
+
+    monkeypatch.setenv("HOME", str(tmpconfigfile.home))
+    monkeypatch.setenv("ICAT_CACHE_DIR", "~/.cache/icat")
+
+    cmdline = "cmd -c %s -s example_root" % tmpconfigfile.path
+    monkeypatch.setattr(sys, "argv", cmdline.split())
+    config = icat.config.Config()
+    client, conf = config.getconfig()
+
+    cachedir = tmpconfigfile.home / ".cache" / "icat"
+    ex = ExpectedConf(configFile=[tmpconfigfile.path],
+                      configSection="example_root",
+                      url=ex_icat,
+                      cacheDir=cachedir)
+    assert ex <= conf
+    assert config.client_kwargs['cacheDir'] == cachedir
+    assert client.kwargs['cacheDir'] == cachedir
+
 @pytest.mark.parametrize('subcmd', ["create", "ls", "info"])
 def test_config_subcmd(monkeypatch, fakeClient, tmpconfigfile, subcmd):
     """Test sub-commands.
@@ -0,0 +1,54 @@
+"""Test Client.createStream() with a fake ICAT server.
+"""
+
+import logging
+import pytest
+
+
+def batches(table):
+    return [ len(beans) for op, beans in table.calls if op == "createMany" ]
+
+def gendatasets(client, count):
+    inv = client.new("Investigation", id=10)
+    for i in range(count):
+        yield client.new("Dataset", investigation=inv, name="ds%05d" % i)
+
+
+def test_create_stream_fixed(fakeclient, faketable):
+    """Fixed batch size: the ids are set in the objects.
+    """
+    objs = list(gendatasets(fakeclient, 25))
+    assert fakeclient.createStream(iter(objs), batchSize=10) == 25
+    assert batches(faketable) == [10, 10, 5]
+    assert [ o.id for o in objs ] == list(range(1000, 1025))
+
+def test_create_stream_auto(fakeclient, faketable, caplog, monkeypatch):
+    """Automatic batch size: the batches are limited by maxBytes.
+
+    The maxEntities limit of the server only applies to search
+    results, it does not limit the batches.
+    """
+    monkeypatch.setattr(fakeclient, "_getMaxEntities", lambda: 5)
+    objs = list(gendatasets(fakeclient, 50))
+    size = fakeclient._itemSize(objs[0].instance)
+    with caplog.at_level(logging.INFO, logger="icat.client"):
+        count = fakeclient.createStream(objs, maxBytes=20*size)
+    assert count == 50
+    assert batches(faketable) == [20, 20, 10]
+    assert [ o.id for o in objs ] == list(range(1000, 1050))
+    assert "objects/s" in caplog.text
+
+def test_create_stream_large(fakeclient, faketable):
+    """Objects larger than maxBytes are sent on their own.
+    """
+    objs = list(gendatasets(fakeclient, 3))
+    assert fakeclient.createStream(objs, maxBytes=1) == 3
+    assert batches(faketable) == [1, 1, 1]
+
+def test_create_stream_empty(fakeclient, faketable):
+    """Nothing is sent for an empty iterable.
+    """
+    assert fakeclient.createStream([]) == 0
+    assert batches(faketable) == []
+    with pytest.raises(ValueError):
+        fakeclient.createStream([], batchSize=0)
@@ -0,0 +1,222 @@
+"""Test module icat.decoder with a fake ICAT server.
+"""
+
+import datetime
+import threading
+import pytest
+import suds.client
+from suds.sudsobject import Object
+import icat
+from icat.entity import Entity
+from conftest import icat_ns, soap_response
+
+
+def tree(value):
+    """Convert search results to a nested structure that can be
+    compared with ==.
+    """
+    if isinstance(value, Entity):
+        return tree(value.instance)
+    elif isinstance(value, Object):
+        md = value.__metadata__
+        return (value.__class__.__name__, md.sxtype.name,
+                [ (k, tree(v)) for k, v in value ])
+    elif isinstance(value, (list, tuple)):
+        return (type(value).__name__, [ tree(v) for v in value ])
+    elif isinstance(value, str):
+        # Suds uses a subclass of str, the decoder uses plain str.
+        return ('str', str(value))
+    else:
+        return (type(value).__name__, value)
+
+datafiles = """<ns2:searchResponse xmlns:ns2="%s">
+<return xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+        xsi:type="ns2:datafile">
+ <createId>simple/root</createId>
+ <createTime>2012-07-30T01:10:08.000+02:00</createTime>
+ <id>17</id>
+ <modId>simple/root</modId>
+ <modTime>2012-07-30T01:10:08.000Z</modTime>
+ <dataset>
+  <createId>simple/root</createId>
+  <id>5</id>
+  <complete>false</complete>
+  <datafiles xsi:nil="true"/>
+  <name>e201215</name>
+ </dataset>
+ <fileSize>1024</fileSize>
+ <location></location>
+ <name>a.dat</name>
+</return>
+<return xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+        xsi:type="ns2:datafile">
+ <id>18</id>
+ <dataset><id>5</id><complete>true</complete></dataset>
+ <name>b &amp; c.dat</name>
+</return>
+<return xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+        xsi:type="ns2:facility">
+ <id>1</id>
+ <daysUntilRelease>1826</daysUntilRelease>
+ <investigations><id>3</id><name>12100409-ST</name></investigations>
+ <investigations><id>4</id></investigations>
+ <name>ESNF</name>
+</return>
+</ns2:searchResponse>""" % icat_ns
+
+values = """<ns2:searchResponse xmlns:ns2="%s">
+<return xmlns:xs="http://www.w3.org/2001/XMLSchema"
+        xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+        xsi:type="xs:long">42</return>
+<return xmlns:xs="http://www.w3.org/2001/XMLSchema"
+        xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+        xsi:type="xs:string">ESNF</return>
+<return xmlns:xs="http://www.w3.org/2001/XMLSchema"
+        xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+        xsi:type="xs:dateTime">2012-07-30T01:10:08.000+02:00</return>
+<return xmlns:xs="http://www.w3.org/2001/XMLSchema"
+        xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+        xsi:type="ns2:fieldSet">
+ <fields xsi:type="xs:string">e201215</fields>
+ <fields xsi:type="xs:boolean">true</fields>
+ <fields xsi:type="xs:double">3.5</fields>
+ <fields xsi:nil="true"/>
+</return>
+</ns2:searchResponse>""" % icat_ns
+
+empty = """<ns2:searchResponse xmlns:ns2="%s"/>""" % icat_ns
+
+# The decoder does not handle a return element without a type.
+untyped = """<ns2:searchResponse xmlns:ns2="%s">
+<return>42</return>
+</ns2:searchResponse>""" % icat_ns
+
+fault = """<S:Fault>
+<faultcode>S:Server</faultcode>
+<faultstring>Session id fake-session-id is not valid</faultstring>
+<detail>
+<ns2:IcatException xmlns:ns2="%s">
+<message>Session id fake-session-id is not valid</message>
+<offset>-1</offset>
+<type>SESSION</type>
+</ns2:IcatException>
+</detail>
+</S:Fault>""" % icat_ns
+
+
+@pytest.fixture(scope="function")
+def fastclient(fakeclient, fakeicat, tmpdirsec):
+    """A client using the fast decoder.  Depend on fakeclient so that
+    the server is reset in any case.
+    """
+    return fakeicat.client(tmpdirsec / "fakeicat-cache", fastDecode=True)
+
+
+@pytest.mark.parametrize("response", [datafiles, values, empty, untyped])
+def test_decode_search(fakeicat, fakeclient, fastclient, response):
+    """The fast decoder yields the same result as the Suds decoder.
+    """
+    fakeicat.set_response("search", response)
+    result = fakeclient.search("SELECT o FROM Object o")
+    fastresult = fastclient.search("SELECT o FROM Object o")
+    assert tree(fastresult) == tree(result)
+
+def test_decode_entities(fakeicat, fastclient):
+    """Check the entity objects in a search result.
+    """
+    fakeicat.set_response("search", datafiles)
+    df1, df2, facility = fastclient.search("SELECT o FROM Object o")
+    assert isinstance(df1, fastclient.typemap['datafile'])
+    assert df1.id == 17
+    assert df1.location is None
+    assert df1.createTime == datetime.datetime(2012, 7, 29, 23, 10, 8,
+                                               tzinfo=datetime.timezone.utc)
+    assert df1.modTime == datetime.datetime(2012, 7, 30, 1, 10, 8,
+                                            tzinfo=datetime.timezone.utc)
+    assert df1.dataset.complete is False
+    assert df1.dataset.datafiles == []
+    assert df2.name == "b & c.dat"
+    assert df2.dataset.complete is True
+    assert facility.daysUntilRelease == 1826
+    assert [i.id for i in facility.investigations] == [3, 4]
+    # The objects from the fast decoder can be passed back to the
+    # server.  Check that Suds is able to marshal them.
+    fastclient.options.nosend = True
+    try:
+        ctx = fastclient.service.create(fastclient.sessionId, df1.instance)
+    finally:
+        fastclient.options.nosend = False
+    assert b"<name>e201215</name>" in ctx.envelope
+
+def test_decode_direct(fastclient):
+    """Call the decoder directly.
+    """
+    decoder = fastclient.searchDecoder
+    with pytest.raises(ValueError):
+        decoder.decode(soap_response(untyped))
+    with pytest.raises(ValueError):
+        decoder.decode(soap_response(fault))
+    with pytest.raises(ValueError):
+        decoder.decode(b"<not-xml")
+    assert decoder.decode(soap_response(values))[0] == 42
+
+def test_decode_fault(fakeicat, fastclient):
+    """Faults fall back to Suds and are translated as usual.
+    """
+    fakeicat.set_response("search", fault, status=500)
+    with pytest.raises(icat.ICATSessionError):
+        fastclient.search("SELECT o FROM Object o")
+
+@pytest.mark.parametrize("response", [datafiles, values, empty, untyped])
+def test_stream_search(fakeicat, fakeclient, response):
+    """searchStream() yields the same result as search().
+    """
+    fakeicat.set_response("search", response)
+    result = fakeclient.search("SELECT o FROM Object o")
+    streamresult = list(fakeclient.searchStream("SELECT o FROM Object o"))
+    assert tree(streamresult) == tree(result)
+
+def test_stream_suds_private(fakeicat, fakeclient, monkeypatch):
+    """searchStream() does not depend on private methods of Suds.
+    """
+    fakeicat.set_response("search", datafiles)
+    query = "SELECT o FROM Object o"
+    result = list(fakeclient.searchStream(query))
+    headers, body = fakeicat.requests[-1]
+    for name in ("_SoapClient__location", "_SoapClient__headers"):
+        monkeypatch.delattr(suds.client._SoapClient, name)
+    assert tree(list(fakeclient.searchStream(query))) == tree(result)
+    fbheaders, fbbody = fakeicat.requests[-1]
+    assert fbbody == body
+    for h in ("Content-Type", "SOAPAction"):
+        assert fbheaders[h] == headers[h]
+
+def test_stream_incremental(fakeicat, fakeclient):
+    """searchStream() yields the first items before the server has
+    sent the rest of the response.
+    """
+    reply = soap_response(datafiles)
+    pos = reply.index(b"</return>", reply.index(b"</return>") + 1)
+    first, rest = reply[:pos], reply[pos:]
+    received = threading.Event()
+    waited = []
+    def chunks():
+        yield first
+        waited.append(received.wait(timeout=10))
+        yield rest
+    fakeicat.set_chunked_response("search", chunks())
+    result = fakeclient.searchStream("SELECT o FROM Object o")
+    df1 = next(result)
+    assert df1.id == 17
+    received.set()
+    df2, facility = result
+    assert df2.id == 18
+    assert facility.name == "ESNF"
+    assert waited == [True]
+
+def test_stream_fault(fakeicat, fakeclient):
+    """Faults are translated as usual in searchStream().
+    """
+    fakeicat.set_response("search", fault, status=500)
+    with pytest.raises(icat.ICATSessionError):
+        list(fakeclient.searchStream("SELECT o FROM Object o"))
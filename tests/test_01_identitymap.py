@@ -0,0 +1,84 @@
+"""Test module icat.identitymap with a fake ICAT server.
+"""
+
+import gc
+import pytest
+from conftest import icat_ns
+
+
+def dataset(id, name, invid):
+    return ('<return xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+            'xsi:type="ns2:dataset"><id>%d</id>'
+            '<investigation><facility><id>1</id><name>ESNF</name></facility>'
+            '<id>%d</id><name>inv%d</name></investigation>'
+            '<name>%s</name></return>' % (id, invid, invid, name))
+
+def response(*returns):
+    return ('<ns2:searchResponse xmlns:ns2="%s">%s</ns2:searchResponse>'
+            % (icat_ns, "".join(returns)))
+
+query = "SELECT o FROM Dataset o INCLUDE o.investigation.facility"
+
+@pytest.fixture(scope="function", params=[False, True],
+                ids=["suds", "fastDecode"])
+def mapclient(request, fakeclient, fakeicat, tmpdirsec):
+    """A client using an identity map, with and without the fast
+    decoder.  Depend on fakeclient so that the server is reset in any
+    case.
+    """
+    return fakeicat.client(tmpdirsec / "fakeicat-cache", identityMap=True,
+                           fastDecode=request.param)
+
+
+def test_identity_related(fakeicat, mapclient):
+    """Related objects having the same id are shared.
+    """
+    fakeicat.set_response("search", response(dataset(11, "a", 5),
+                                              dataset(12, "b", 5),
+                                              dataset(13, "c", 6)))
+    ds = mapclient.search(query)
+    assert ds[0].investigation is ds[1].investigation
+    assert ds[0].investigation.instance is ds[1].instance.investigation
+    assert ds[0].investigation is not ds[2].investigation
+    assert ds[0].investigation.facility is ds[2].investigation.facility
+
+def test_identity_search(fakeicat, mapclient):
+    """The same entity object is returned in later searches, updated
+    with the new values.
+    """
+    fakeicat.set_response("search", response(dataset(11, "a", 5)))
+    first = mapclient.search(query)[0]
+    fakeicat.set_response("search", response(dataset(11, "x", 5)))
+    second = mapclient.search(query)[0]
+    assert second is first
+    assert first.name == "x"
+
+def test_identity_weak(fakeicat, mapclient):
+    """Objects not used any more are forgotten.
+    """
+    fakeicat.set_response("search", response(dataset(11, "a", 5),
+                                              dataset(12, "b", 5)))
+    ds = mapclient.search(query)
+    assert len(mapclient.identityMap) == 4
+    del ds
+    gc.collect()
+    assert len(mapclient.identityMap) == 0
+
+def test_identity_stream(fakeicat, mapclient):
+    """searchStream() also returns the canonical objects.
+    """
+    fakeicat.set_response("search", response(dataset(11, "a", 5)))
+    first = mapclient.search(query)[0]
+    second = list(mapclient.searchStream(query))[0]
+    assert second is first
+    assert len(mapclient.identityMap) == 3
+
+def test_identity_disabled(fakeicat, fakeclient):
+    """Without identity map, each copy is a separate object.
+    """
+    fakeicat.set_response("search", response(dataset(11, "a", 5),
+                                              dataset(12, "b", 5)))
+    ds = fakeclient.search(query)
+    assert fakeclient.identityMap is None
+    assert ds[0].investigation is not ds[1].investigation
+    assert ds[0].investigation == ds[1].investigation
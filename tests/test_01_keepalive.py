@@ -0,0 +1,228 @@
+"""Test module icat.keepalive with a local HTTP server.
+"""
+
+import http.client
+import http.server
+import io
+import json
+import socketserver
+import ssl
+import threading
+import urllib.parse
+import urllib.request
+import zlib
+import pytest
+import icat.keepalive
+from icat.ids import DataSelection, IDSClient
+from icat.keepalive import ConnectionPool, KeepAliveHandler
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """Answer all requests with the request body or a fixed text,
+    recording the client port for each request.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, body):
+        self.server.ports.append(self.client_address[1])
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding") == "chunked":
+            body = b""
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                chunk = self.rfile.read(size + 2)[:size]
+                if not size:
+                    break
+                body += chunk
+            return body
+        else:
+            return self.rfile.read(int(self.headers["Content-Length"]))
+
+    def do_GET(self):
+        path = urllib.parse.urlsplit(self.path).path
+        if path == "/ids/version":
+            self._reply(b'{"version":"2.0.0"}')
+            return
+        elif path == "/ids/getStatus":
+            self._reply(b"ONLINE")
+            return
+        elif path == "/ids/getData":
+            self._reply(b"y" * 100000)
+            return
+        if self.path == "/close":
+            # Close the connection after this request, but without
+            # sending "Connection: close" to the client.
+            self.close_connection = True
+        self._reply(b"x" * 4096)
+
+    def do_POST(self):
+        if self.path.startswith("/ids/"):
+            # archive
+            self._read_body()
+            self._reply(b"")
+        else:
+            self._reply(self._read_body())
+
+    def do_PUT(self):
+        # The IDS put call
+        body = self._read_body()
+        result = {"id": 42, "checksum": zlib.crc32(body) & 0xffffffff}
+        self._reply(json.dumps(result).encode('ascii'))
+
+
+class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+@pytest.fixture(scope="module")
+def server():
+    srv = Server(("127.0.0.1", 0), Handler)
+    srv.ports = []
+    thread = threading.Thread(target=srv.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+@pytest.fixture(scope="function")
+def base(server):
+    server.ports.clear()
+    return "http://127.0.0.1:%d" % server.server_address[1]
+
+def get_opener(pool):
+    return urllib.request.build_opener(KeepAliveHandler(pool))
+
+
+def test_keepalive_reuse(server, base):
+    """Subsequent requests reuse the same connection.
+    """
+    pool = ConnectionPool()
+    opener = get_opener(pool)
+    for i in range(5):
+        with opener.open(base + "/") as f:
+            assert f.read() == b"x" * 4096
+            assert f.getcode() == 200
+            assert f.geturl() == base + "/"
+    assert len(server.ports) == 5
+    assert len(set(server.ports)) == 1
+    # Another opener sharing the same pool also uses that connection.
+    with get_opener(pool).open(base + "/") as f:
+        f.read()
+    assert len(set(server.ports)) == 1
+    pool.clear()
+
+def test_keepalive_context(server, base, monkeypatch):
+    """Connections are only reused by handlers having the same SSL
+    context.
+    """
+    class FakeHTTPSConnection(http.client.HTTPConnection):
+        # Talk plain HTTP to the test server, but take the context.
+        def __init__(self, host, context=None, **kwargs):
+            super().__init__(host, **kwargs)
+            self.context = context
+    monkeypatch.setattr(icat.keepalive, "HTTPSConnection",
+                        FakeHTTPSConnection)
+    url = base.replace("http:", "https:") + "/"
+    pool = ConnectionPool()
+    verify = ssl.create_default_context()
+    noverify = ssl.create_default_context()
+    noverify.check_hostname = False
+    noverify.verify_mode = ssl.CERT_NONE
+    for context in (verify, verify, noverify, noverify, verify):
+        opener = urllib.request.build_opener(KeepAliveHandler(pool, context))
+        with opener.open(url) as f:
+            f.read()
+    assert len(server.ports) == 5
+    assert len(set(server.ports)) == 2
+    assert server.ports[0] == server.ports[1] == server.ports[4]
+    assert server.ports[2] == server.ports[3] != server.ports[0]
+    pool.clear()
+
+def test_keepalive_idle_timeout(server, base):
+    """Idle connections are not reused after the idle timeout.
+    """
+    pool = ConnectionPool(idleTimeout=0)
+    opener = get_opener(pool)
+    for i in range(3):
+        with opener.open(base + "/") as f:
+            f.read()
+    assert len(set(server.ports)) == 3
+
+def test_keepalive_server_close(server, base):
+    """The server closes an idle connection without telling us in
+    advance.  The request on the stale connection is retried on a new
+    one.
+    """
+    pool = ConnectionPool()
+    opener = get_opener(pool)
+    with opener.open(base + "/close") as f:
+        f.read()
+    with opener.open(base + "/") as f:
+        assert f.read() == b"x" * 4096
+    with opener.open(base + "/") as f:
+        assert f.read() == b"x" * 4096
+    assert len(server.ports) == 3
+    assert len(set(server.ports)) == 2
+    assert server.ports[1] == server.ports[2]
+    pool.clear()
+
+def test_keepalive_partial_read(server, base):
+    """A connection with a response that has not been read completely
+    must not be reused.
+    """
+    pool = ConnectionPool()
+    opener = get_opener(pool)
+    with opener.open(base + "/") as f:
+        assert f.read(10) == b"x" * 10
+    with opener.open(base + "/") as f:
+        assert f.read() == b"x" * 4096
+    assert len(set(server.ports)) == 2
+    pool.clear()
+
+def test_keepalive_post(server, base):
+    """POST requests, including a body sent using chunked transfer
+    encoding.
+    """
+    pool = ConnectionPool()
+    opener = get_opener(pool)
+    req = urllib.request.Request(base + "/", data=b"spam")
+    with opener.open(req) as f:
+        assert f.read() == b"spam"
+    chunks = [b"ham", b"and", b"eggs"]
+    req = urllib.request.Request(base + "/", data=iter(chunks))
+    req.add_header("Transfer-Encoding", "chunked")
+    with opener.open(req) as f:
+        assert f.read() == b"hamandeggs"
+    assert len(set(server.ports)) == 1
+    pool.clear()
+
+def test_keepalive_ids(server, base):
+    """Use persistent connections with the IDSClient.
+    """
+    pool = ConnectionPool()
+    ids = IDSClient(base + "/ids", sessionId="-", connectionPool=pool)
+    assert ids.apiversion == "2.0.0"
+    selection = DataSelection({'datasetIds': [1, 2]})
+    for i in range(3):
+        assert ids.getStatus(selection) == "ONLINE"
+    ids.archive(selection)
+    data = b"data" * 10000
+    assert ids.put(io.BytesIO(data), "file.dat", 1, 1) == 42
+    with ids.getData(selection) as f:
+        assert f.read() == b"y" * 100000
+    assert ids.getStatus(selection) == "ONLINE"
+    assert len(server.ports) == 8
+    assert len(set(server.ports)) == 1
+    pool.clear()
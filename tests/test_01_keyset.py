@@ -0,0 +1,110 @@
+"""Test keyset pagination in Client.searchChunked() with a fake ICAT
+server.
+"""
+
+import pytest
+from icat.client import _ChunkedSearch
+from icat.query import Query
+
+
+class Obj():
+    def __init__(self, id):
+        self.id = id
+
+def chunk_queries(query, results, **kwargs):
+    """Return the queries that searchChunked() would send if the
+    search calls yielded the given ids.
+    """
+    chunked = _ChunkedSearch(query, keyset=True, **kwargs)
+    queries = []
+    for ids in results:
+        queries.append(chunked.nextQuery())
+        chunked.addResult([Obj(i) for i in ids])
+    assert chunked.nextQuery() is None
+    return queries
+
+
+@pytest.mark.parametrize(("query", "expected"), [
+    ("SELECT o FROM Facility o",
+     ["SELECT o FROM Facility o ORDER BY o.id LIMIT 0, 2",
+      "SELECT o FROM Facility o WHERE o.id > 7 ORDER BY o.id LIMIT 0, 2"]),
+    ("SELECT DISTINCT ds FROM Dataset ds JOIN ds.investigation AS i "
+     "WHERE i.name = 'a WHERE b' OR ds.name LIKE 'x%' "
+     "ORDER BY ds.name INCLUDE ds.datafiles",
+     ["SELECT DISTINCT ds FROM Dataset ds JOIN ds.investigation AS i "
+      "WHERE (i.name = 'a WHERE b' OR ds.name LIKE 'x%') "
+      "ORDER BY ds.id INCLUDE ds.datafiles LIMIT 0, 2",
+      "SELECT DISTINCT ds FROM Dataset ds JOIN ds.investigation AS i "
+      "WHERE (i.name = 'a WHERE b' OR ds.name LIKE 'x%') AND ds.id > 7 "
+      "ORDER BY ds.id INCLUDE ds.datafiles LIMIT 0, 2"]),
+    ("SELECT i FROM Investigation i WHERE EXISTS "
+     "(SELECT ds FROM Dataset ds WHERE ds.investigation = i "
+     "ORDER BY ds.id) ORDER BY i.name",
+     ["SELECT i FROM Investigation i WHERE (EXISTS "
+      "(SELECT ds FROM Dataset ds WHERE ds.investigation = i "
+      "ORDER BY ds.id)) ORDER BY i.id LIMIT 0, 2",
+      "SELECT i FROM Investigation i WHERE (EXISTS "
+      "(SELECT ds FROM Dataset ds WHERE ds.investigation = i "
+      "ORDER BY ds.id)) AND i.id > 7 ORDER BY i.id LIMIT 0, 2"]),
+])
+def test_keyset_string(query, expected):
+    """Keyset pagination for query strings.
+    """
+    assert chunk_queries(query, [[5, 7], [9]], chunksize=2) == expected
+
+def test_keyset_query(fakeclient):
+    """Keyset pagination for Query objects.
+    """
+    query = Query(fakeclient, "Datafile", order=["name"],
+                  conditions={"name": "LIKE 'a%'"}, includes=["dataset"])
+    queries = chunk_queries(query, [[5, 7], [9]], chunksize=2, skip=4)
+    assert queries == [
+        "SELECT o FROM Datafile o WHERE o.name LIKE 'a%' "
+        "ORDER BY o.id INCLUDE o.dataset LIMIT 4, 2",
+        "SELECT o FROM Datafile o WHERE o.id > 7 AND o.name LIKE 'a%' "
+        "ORDER BY o.id INCLUDE o.dataset LIMIT 0, 2",
+    ]
+    # The original query is not modified.
+    assert str(query) == ("SELECT o FROM Datafile o WHERE o.name LIKE 'a%' "
+                          "ORDER BY o.name INCLUDE o.dataset")
+
+def test_keyset_count():
+    """The count limits the size of the last chunk.
+    """
+    queries = chunk_queries("SELECT o FROM Facility o", [[1, 2], [3]],
+                            chunksize=2, count=3)
+    assert queries[1].endswith("WHERE o.id > 2 ORDER BY o.id LIMIT 0, 1")
+
+@pytest.mark.parametrize("query", [
+    "Facility",
+    "SELECT o.name FROM Facility o",
+    "SELECT o FROM Facility o LIMIT 0, 10",
+])
+def test_keyset_invalid_string(query):
+    """Queries not suitable for keyset pagination are rejected.
+    """
+    with pytest.raises(ValueError):
+        _ChunkedSearch(query, keyset=True)
+
+def test_keyset_invalid_query(fakeclient):
+    """Queries not suitable for keyset pagination are rejected.
+    """
+    for kwargs in [{'attributes': "name"}, {'aggregate': "COUNT"},
+                   {'limit': (0, 10)}]:
+        query = Query(fakeclient, "Facility", **kwargs)
+        with pytest.raises(ValueError):
+            _ChunkedSearch(query, keyset=True)
+
+def test_keyset_search(fakeclient, faketable):
+    """searchChunked() with keyset pagination.
+    """
+    for i in (3, 5, 8, 13, 21, 34, 55):
+        faketable.add("Dataset", id=i, investigation=10, name="ds%d" % i)
+    query = "SELECT o FROM Dataset o"
+    result = fakeclient.searchChunked(query, count=6, chunksize=3,
+                                      keyset=True)
+    assert [o.id for o in result] == [3, 5, 8, 13, 21, 34]
+    assert faketable.queries == [
+        "SELECT o FROM Dataset o ORDER BY o.id LIMIT 0, 3",
+        "SELECT o FROM Dataset o WHERE o.id > 8 ORDER BY o.id LIMIT 0, 3",
+    ]
@@ -0,0 +1,156 @@
+"""Test module icat.marshaller with a fake ICAT server.
+"""
+
+import datetime
+import pytest
+from suds.sax.text import Text
+from conftest import icat_ns
+
+
+def suds_envelope(client, name, *args):
+    """Let Suds render the envelope for a call.
+    """
+    client.options.nosend = True
+    try:
+        return getattr(client.service, name)(*args).envelope
+    finally:
+        client.options.nosend = False
+
+def fast_envelope(client, name, *args):
+    """Let the marshaller render the envelope for a call.
+    """
+    method = getattr(client.service, name).method
+    envelope = client.requestMarshaller.marshal(method, args)
+    return envelope.encode("utf-8")
+
+def get_objects(client):
+    ds = client.new("Dataset", id=5, name="e201215 & <x>", complete=False)
+    ds.instance.createTime = datetime.datetime(2012, 7, 30, 1, 10, 8,
+                                               tzinfo=datetime.timezone.utc)
+    df = client.new("Datafile", name="a.dat", dataset=ds, fileSize=1024,
+                    location="")
+    inv = client.new("Investigation", name="12100409-ST",
+                     datasets=[ds, client.new("Dataset", name="e201216")])
+    fac = client.new("Facility", name="ESNF", daysUntilRelease=1826)
+    return {
+        'dataset': ds.instance,
+        'datafile': df.instance,
+        'investigation': inv.instance,
+        'facility': fac.instance,
+        'empty': client.new("Dataset").instance,
+    }
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT f FROM Facility f",
+    "SELECT d FROM Dataset d WHERE d.name = 'a & b' AND d.id < 17",
+    Text("SELECT d FROM Dataset d WHERE d.name = 'a &amp; b'"),
+    Text("SELECT d FROM Dataset d WHERE d.name = 'a &amp; b'", escaped=True),
+    "",
+])
+def test_marshal_search(fakeclient, query):
+    """The marshaller renders the same envelope as Suds does.
+    """
+    args = (fakeclient.sessionId, query)
+    assert (fast_envelope(fakeclient, "search", *args) ==
+            suds_envelope(fakeclient, "search", *args))
+
+@pytest.mark.parametrize("args", [
+    ("Facility", 1),
+    ("Dataset INCLUDE Datafile", 42),
+    ("Facility", None),
+])
+def test_marshal_get(fakeclient, args):
+    """The marshaller renders the same envelope as Suds does.
+    """
+    args = (fakeclient.sessionId,) + args
+    assert (fast_envelope(fakeclient, "get", *args) ==
+            suds_envelope(fakeclient, "get", *args))
+
+@pytest.mark.parametrize("obj", [
+    "dataset", "datafile", "investigation", "facility", "empty", "null"
+])
+def test_marshal_create(fakeclient, obj):
+    """The marshaller renders the same envelope as Suds does.
+    """
+    objects = get_objects(fakeclient)
+    if obj == "null":
+        # Set the values of a required and a nillable attribute to
+        # None.
+        objects['dataset'].complete = None
+        objects['facility'].investigations = [None]
+        beans = [objects['dataset'], objects['facility']]
+    else:
+        beans = [objects[obj]]
+    for bean in beans:
+        args = (fakeclient.sessionId, bean)
+        assert (fast_envelope(fakeclient, "create", *args) ==
+                suds_envelope(fakeclient, "create", *args))
+
+@pytest.mark.parametrize("objs", [
+    ["datafile", "investigation", "facility"],
+    ["empty"],
+    [],
+])
+def test_marshal_createMany(fakeclient, objs):
+    """The marshaller renders the same envelope as Suds does.
+    """
+    objects = get_objects(fakeclient)
+    args = (fakeclient.sessionId, [objects[o] for o in objs])
+    assert (fast_envelope(fakeclient, "createMany", *args) ==
+            suds_envelope(fakeclient, "createMany", *args))
+
+def test_marshal_item_size(fakeclient):
+    """The size of an item is what it adds to the envelope.
+    """
+    objects = get_objects(fakeclient)
+    fac, inv = objects['facility'], objects['investigation']
+    one = fast_envelope(fakeclient, "createMany", fakeclient.sessionId, [fac])
+    two = fast_envelope(fakeclient, "createMany", fakeclient.sessionId,
+                        [fac, inv])
+    size = fakeclient.requestMarshaller.itemSize("createMany", 1, inv)
+    assert size == len(two) - len(one)
+    with pytest.raises(ValueError):
+        fakeclient.requestMarshaller.itemSize("createMany", 2, inv)
+
+def test_marshal_unsupported(fakeclient):
+    """The marshaller refuses what it does not handle.
+    """
+    marshal = fakeclient.requestMarshaller.marshal
+    method = fakeclient.service.create.method
+    with pytest.raises(ValueError):
+        marshal(method, (fakeclient.sessionId, {'name': "ESNF"}))
+    with pytest.raises(ValueError):
+        marshal(method, (fakeclient.sessionId,))
+    with pytest.raises(ValueError):
+        marshal(method, (None, None))
+
+def test_marshal_client(fakeicat, fakeclient):
+    """The client sends the pre-rendered envelopes to the server.
+    """
+    fakeicat.set_response("create",
+                          '<ns2:createResponse xmlns:ns2="%s">'
+                          '<return>42</return></ns2:createResponse>'
+                          % icat_ns)
+    fakeicat.set_response("createMany",
+                          '<ns2:createManyResponse xmlns:ns2="%s">'
+                          '<return>43</return><return>44</return>'
+                          '</ns2:createManyResponse>' % icat_ns)
+    objects = get_objects(fakeclient)
+    bean = objects['datafile']
+    beans = [objects['investigation'], objects['facility']]
+    assert fakeclient.create(bean) == 42
+    assert fakeclient.createMany(beans) == [43, 44]
+    # The prettyxml option disables the marshaller, this call is
+    # rendered by Suds.
+    fakeclient.options.prettyxml = True
+    try:
+        assert fakeclient.create(bean) == 42
+    finally:
+        fakeclient.options.prettyxml = False
+    sent = [body for headers, body in fakeicat.requests[-3:]]
+    assert sent[0] == suds_envelope(fakeclient, "create",
+                                    fakeclient.sessionId, bean)
+    assert sent[1] == suds_envelope(fakeclient, "createMany",
+                                    fakeclient.sessionId, beans)
+    assert sent[2] != sent[0]
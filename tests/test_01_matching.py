@@ -0,0 +1,80 @@
+"""Test Client.searchMatchingMany() with a fake ICAT server.
+"""
+
+import pytest
+
+
+@pytest.fixture(scope="function")
+def datasets(faketable):
+    faketable.add("Dataset", id=100, investigation=10, name="ds1")
+    faketable.add("Dataset", id=101, investigation=10, name="ds2")
+    faketable.add("Dataset", id=102, investigation=11, name="ds1")
+    faketable.add("Dataset", id=103, investigation=10, name="o'brien")
+    return faketable
+
+def newdataset(client, invid, name):
+    inv = client.new("Investigation", id=invid)
+    return client.new("Dataset", investigation=inv, name=name)
+
+
+def test_matching_many(fakeclient, datasets):
+    """Search the matching objects in one query, keeping the order.
+    """
+    objs = [ newdataset(fakeclient, 11, "ds1"),
+             newdataset(fakeclient, 10, "ds3"),
+             newdataset(fakeclient, 10, "o'brien"),
+             newdataset(fakeclient, 10, "ds1"),
+             newdataset(fakeclient, 11, "ds1") ]
+    res = fakeclient.searchMatchingMany(objs)
+    assert [ o.id if o else None for o in res ] == [102, None, 103, 100, 102]
+    assert len(datasets.queries) == 1
+    assert " OR " in datasets.queries[0]
+    assert "INCLUDE o.investigation" in datasets.queries[0]
+
+def test_matching_many_chunksize(fakeclient, datasets):
+    """Large batches are split according to chunksize.
+    """
+    objs = [ newdataset(fakeclient, i, n)
+             for i, n in [(10, "ds1"), (10, "ds2"), (11, "ds1")] ]
+    res = fakeclient.searchMatchingMany(objs, chunksize=2)
+    assert [ o.id for o in res ] == [100, 101, 102]
+    assert len(datasets.queries) == 2
+
+def test_matching_many_nocase(fakeclient, datasets):
+    """Results that can't be assigned are searched individually.
+    """
+    datasets.nocase = True
+    objs = [ newdataset(fakeclient, 10, "DS1"),
+             newdataset(fakeclient, 10, "ds2"),
+             newdataset(fakeclient, 10, "ds3") ]
+    res = fakeclient.searchMatchingMany(objs)
+    assert [ o.id if o else None for o in res ] == [100, 101, None]
+    # One batched query and one individual query for the object that
+    # the unassigned result may belong to.
+    assert len(datasets.queries) == 2
+    assert "JOIN" in datasets.queries[1]
+    assert "'DS1'" in datasets.queries[1]
+    assert fakeclient.searchMatching(objs[0]).id == 100
+
+def test_matching_many_stray(fakeclient, datasets):
+    """An unassigned result only causes individual searches for the
+    objects it may belong to, not for all objects not found.
+    """
+    datasets.nocase = True
+    objs = [ newdataset(fakeclient, 10, "ds%d" % i) for i in range(3, 23) ]
+    objs.append(newdataset(fakeclient, 11, "DS1"))
+    objs.append(newdataset(fakeclient, 10, "O'Brien"))
+    res = fakeclient.searchMatchingMany(objs)
+    assert [ o.id for o in res if o ] == [102, 103]
+    assert len(datasets.queries) == 3
+    assert all("JOIN" in q for q in datasets.queries[1:])
+
+def test_matching_many_invalid(fakeclient, datasets):
+    """Objects lacking constraint attributes raise ValueError
+    before any search is done.
+    """
+    objs = [ newdataset(fakeclient, 10, "ds1"),
+             newdataset(fakeclient, 10, None) ]
+    with pytest.raises(ValueError):
+        fakeclient.searchMatchingMany(objs)
+    assert not datasets.queries
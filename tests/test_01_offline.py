@@ -0,0 +1,144 @@
+"""Test module icat.offline.
+"""
+
+import pytest
+import yaml
+import icat.dumpfile_xml
+from icat.cache import SchemaCache
+from icat.dumpfile import open_dumpfile, convert_dumpfile
+from icat.offline import OfflineClient
+from icat.query import Query
+from conftest import mkfield, mkinfo, FakeSchemaClient
+
+
+# Note: this is a small fake subset of the ICAT schema.
+entityInfo = {
+    'Parameter': mkinfo([], []),
+    'Facility': mkinfo(["name"], [
+        mkfield("name", "ATTRIBUTE", "String", notNullable=True),
+        mkfield("fullName", "ATTRIBUTE", "String"),
+        mkfield("investigations", "MANY", "Investigation"),
+    ]),
+    'InvestigationType': mkinfo(["facility", "name"], [
+        mkfield("name", "ATTRIBUTE", "String", notNullable=True),
+        mkfield("facility", "ONE", "Facility", notNullable=True),
+    ]),
+    'Investigation': mkinfo(["facility", "name", "visitId"], [
+        mkfield("name", "ATTRIBUTE", "String", notNullable=True),
+        mkfield("visitId", "ATTRIBUTE", "String", notNullable=True),
+        mkfield("title", "ATTRIBUTE", "String", notNullable=True),
+        mkfield("facility", "ONE", "Facility", notNullable=True),
+        mkfield("type", "ONE", "InvestigationType", notNullable=True),
+        mkfield("datasets", "MANY", "Dataset"),
+        mkfield("keywords", "MANY", "Keyword"),
+    ]),
+    'Keyword': mkinfo(["investigation", "name"], [
+        mkfield("name", "ATTRIBUTE", "String", notNullable=True),
+        mkfield("investigation", "ONE", "Investigation", notNullable=True),
+    ]),
+    'Dataset': mkinfo(["investigation", "name"], [
+        mkfield("name", "ATTRIBUTE", "String", notNullable=True),
+        mkfield("complete", "ATTRIBUTE", "Boolean"),
+        mkfield("investigation", "ONE", "Investigation", notNullable=True),
+    ]),
+}
+
+url = "https://icat.example.com/ICATService/ICAT?wsdl"
+
+@pytest.fixture(scope="module")
+def client(tmpdirsec):
+    cachedir = tmpdirsec / "offline-cache"
+    SchemaCache(cachedir, url).save(FakeSchemaClient(entityInfo))
+    return OfflineClient(cachedir, "https://icat.example.com")
+
+
+def test_offline_no_snapshot(tmpdirsec):
+    """The offline client needs a snapshot.
+    """
+    with pytest.raises(ValueError):
+        OfflineClient(tmpdirsec / "offline-empty", url)
+
+def test_offline_new(client):
+    """Create entity objects with the offline client.
+    """
+    assert client.apiversion == "6.2.0"
+    facility = client.new("Facility", name="ESNF")
+    assert facility.BeanName == "Facility"
+    assert facility.name == "ESNF"
+    assert facility.id is None
+    assert facility.investigations == []
+    inv = client.new("investigation", facility=facility, name="12100409",
+                     visitId="1.1-P", title="Offline")
+    assert inv.facility.name == "ESNF"
+    assert inv.getAttrType("type") == "InvestigationType"
+    with pytest.raises(TypeError):
+        client.new("Datafile")
+
+def test_offline_query(client):
+    """Build queries with the offline client.
+    """
+    query = Query(client, "Dataset", order=True,
+                  conditions={"investigation.facility.name": "= 'ESNF'"},
+                  includes=["investigation.type"])
+    s = str(query)
+    assert s.startswith("SELECT o FROM Dataset o ")
+    assert "JOIN i.facility AS s1 WHERE s1.name = 'ESNF'" in s
+    assert "ORDER BY" in s
+    assert "INCLUDE" in s
+    with pytest.raises(ValueError):
+        Query(client, "Dataset", conditions={"title": "= 'x'"})
+    with pytest.raises(ValueError):
+        Query(client, "Dataset", attributes=["name", "complete"])
+
+def test_offline_unique_key(client):
+    """Generate unique keys and reconstruct objects from them.
+    """
+    facility = client.new("Facility", id=1, name="ESNF")
+    inv = client.new("Investigation", id=2, facility=facility,
+                     name="12100409", visitId="1.1-P")
+    ds = client.new("Dataset", id=3, investigation=inv, name="e201215")
+    key = ds.getUniqueKey()
+    assert key.startswith("Dataset_investigation-(")
+    obj = client.searchUniqueKey(key)
+    assert obj.BeanName == "Dataset"
+    assert obj.name == "e201215"
+    assert obj.investigation.visitId == "1.1-P"
+    assert obj.investigation.facility.name == "ESNF"
+    assert obj.getUniqueKey() == key
+    objindex = {}
+    assert client.searchUniqueKey(key, objindex) is \
+        client.searchUniqueKey(key, objindex)
+
+def test_offline_convert(client, tmpdirsec):
+    """Convert a data file from YAML to XML and back again.
+    """
+    facility = client.new("Facility", id=1, name="ESNF",
+                          fullName="Example Facility")
+    invtype = client.new("InvestigationType", id=2, facility=facility,
+                         name="Experiment")
+    inv = client.new("Investigation", id=3, facility=facility, type=invtype,
+                     name="12100409", visitId="1.1-P", title="Offline")
+    inv.keywords.append(client.new("Keyword", name="Foo"))
+    inv.keywords.append(client.new("Keyword", name="Bar"))
+    # The type of this investigation is not in the data file.
+    othertype = client.new("InvestigationType", id=4, facility=facility,
+                           name="Other")
+    inv2 = client.new("Investigation", id=5, facility=facility,
+                      type=othertype, name="12100410", visitId="1.1-P",
+                      title="Other")
+    ds = client.new("Dataset", id=6, investigation=inv, name="e201215",
+                    complete=False)
+    yamlfile = tmpdirsec / "offline-orig.yaml"
+    with open_dumpfile(client, yamlfile, "YAML", 'w') as dumpfile:
+        dumpfile.writedata([[facility, invtype]])
+        dumpfile.writedata([[inv, inv2], [ds]])
+    xmlfile = tmpdirsec / "offline-conv.xml"
+    convert_dumpfile(client, yamlfile, "YAML", xmlfile, "XML")
+    yamlfile2 = tmpdirsec / "offline-conv.yaml"
+    convert_dumpfile(client, xmlfile, "XML", yamlfile2, "YAML")
+    with yamlfile.open("rt") as f:
+        orig = list(yaml.safe_load_all(f))
+    with yamlfile2.open("rt") as f:
+        conv = list(yaml.safe_load_all(f))
+    assert len(orig) == 2
+    assert conv == orig
@@ -0,0 +1,107 @@
+"""Test Client.searchPartitioned() with a fake ICAT server.
+"""
+
+import random
+import threading
+import pytest
+from icat.query import Query
+
+
+def names(table):
+    return [ o['name'] for o in table.objects.values() ]
+
+
+@pytest.fixture(scope="function")
+def facilities(faketable):
+    rnd = random.Random(42)
+    for i in rnd.sample(range(1, 500), 97):
+        faketable.add("Facility", id=i, name="F%05d" % ((i * 7919) % 10007))
+    return faketable
+
+@pytest.fixture(scope="function", params=[False, True],
+                ids=["sequential", "threadSafe"])
+def client(request, fakeicat, fakeclient, tmpdirsec):
+    """A client, either thread safe or not.
+    """
+    if request.param:
+        return fakeicat.client(tmpdirsec / "fakeicat-cache", threadSafe=True)
+    else:
+        return fakeclient
+
+def prefetch_threads():
+    return [t for t in threading.enumerate() if t.name == "prefetch"]
+
+
+def test_partitioned_unordered(client, facilities):
+    """Scan all objects in partitions.
+    """
+    query = Query(client, "Facility", order=["name"])
+    result = list(client.searchPartitioned(query, partitions=4,
+                                           chunksize=5))
+    assert sorted(o.id for o in result) == sorted(facilities.objects)
+    assert facilities.queries[0].startswith("SELECT MIN(o.id) FROM Facility o")
+    assert facilities.queries[1].startswith("SELECT MAX(o.id) FROM Facility o")
+    scans = facilities.queries[2:]
+    assert all("ORDER BY o.id" in q for q in scans)
+    assert len([q for q in scans if "o.id > " not in q]) == 4
+    assert not prefetch_threads()
+
+def test_partitioned_ordered(client, facilities):
+    """Merge the partitions, keeping the order of the query.
+    """
+    query = Query(client, "Facility", order=[("name", "DESC")])
+    result = list(client.searchPartitioned(query, partitions=3,
+                                           ordered=True, chunksize=7))
+    assert [o.name for o in result] == sorted(names(facilities),
+                                              reverse=True)
+    assert all("ORDER BY o.name DESC" in q for q in facilities.queries[2:])
+    assert not prefetch_threads()
+
+def test_partitioned_empty(fakeclient, faketable):
+    """Nothing to do if no object matches.
+    """
+    query = Query(fakeclient, "Facility", order=["name"])
+    assert list(fakeclient.searchPartitioned(query)) == []
+
+def test_partitioned_close(client, facilities):
+    """Closing the generator early stops the background threads.
+    """
+    query = Query(client, "Facility", order=["name"])
+    result = client.searchPartitioned(query, partitions=4, chunksize=5)
+    next(result)
+    result.close()
+    assert not prefetch_threads()
+
+@pytest.mark.parametrize("ordered", [False, True])
+def test_partitioned_threads(fakeicat, fakeclient, tmpdirsec, facilities,
+                             ordered):
+    """Background threads are only used with a thread safe client.
+    """
+    query = Query(fakeclient, "Facility", order=["name"])
+    result = fakeclient.searchPartitioned(query, ordered=ordered,
+                                          chunksize=5)
+    next(result)
+    assert not prefetch_threads()
+    result.close()
+    client = fakeicat.client(tmpdirsec / "fakeicat-cache", threadSafe=True)
+    query = Query(client, "Facility", order=["name"])
+    result = client.searchPartitioned(query, ordered=ordered, chunksize=5)
+    next(result)
+    assert prefetch_threads()
+    result.close()
+    assert not prefetch_threads()
+
+def test_partitioned_invalid(fakeclient):
+    """Invalid arguments are rejected.
+    """
+    with pytest.raises(TypeError):
+        list(fakeclient.searchPartitioned("SELECT o FROM Facility o"))
+    query = Query(fakeclient, "Facility", limit=(0, 10))
+    with pytest.raises(ValueError):
+        list(fakeclient.searchPartitioned(query))
+    query = Query(fakeclient, "Facility", attributes="name")
+    with pytest.raises(ValueError):
+        list(fakeclient.searchPartitioned(query, ordered=True))
+    query = Query(fakeclient, "Facility", order=["LENGTH(name)"])
+    with pytest.raises(ValueError):
+        list(fakeclient.searchPartitioned(query, ordered=True))
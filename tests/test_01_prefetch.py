@@ -0,0 +1,93 @@
+"""Test the prefetch option of Client.searchChunked() with a fake ICAT
+server.
+"""
+
+import threading
+import time
+import pytest
+import icat
+from test_01_decoder import datafiles, fault, tree
+
+
+def search_requests(fakeicat):
+    return [body for headers, body in fakeicat.requests
+            if b"<query>" in body]
+
+def wait_requests(fakeicat, n, timeout=5):
+    """Wait until the server got at least n search requests.
+    """
+    deadline = time.monotonic() + timeout
+    while (len(search_requests(fakeicat)) < n and
+           time.monotonic() < deadline):
+        time.sleep(0.01)
+    return len(search_requests(fakeicat))
+
+def prefetch_threads():
+    return [t for t in threading.enumerate() if t.name == "prefetch"]
+
+@pytest.fixture(scope="function")
+def client(fakeicat, fakeclient, tmpdirsec):
+    """A thread safe client.
+    """
+    return fakeicat.client(tmpdirsec / "fakeicat-cache", threadSafe=True)
+
+
+@pytest.mark.parametrize("prefetch", [1, 2, 5])
+def test_prefetch_result(fakeicat, client, prefetch):
+    """Prefetching does not change the result.
+    """
+    fakeicat.set_response("search", datafiles)
+    query = "SELECT o FROM Object o"
+    expected = list(client.searchChunked(query, count=9, chunksize=3))
+    fakeicat.reset()
+    fakeicat.set_response("search", datafiles)
+    result = list(client.searchChunked(query, count=9, chunksize=3,
+                                           prefetch=prefetch))
+    assert tree(result) == tree(expected)
+    assert len(result) == 9
+    sent = search_requests(fakeicat)
+    assert [("LIMIT %d, 3" % s).encode("ascii") in q
+            for s, q in zip((0, 3, 6), sent)] == [True, True, True]
+    assert not prefetch_threads()
+
+def test_prefetch_bounded(fakeicat, client):
+    """Only fetch up to prefetch chunks ahead.
+    """
+    fakeicat.set_response("search", datafiles)
+    query = "SELECT o FROM Object o"
+    result = client.searchChunked(query, count=30, chunksize=3,
+                                      prefetch=2)
+    try:
+        assert next(result).id == 17
+        # The first chunk is being consumed, two more may be fetched.
+        assert wait_requests(fakeicat, 3) == 3
+        time.sleep(0.3)
+        assert len(search_requests(fakeicat)) == 3
+        # Starting to consume the second chunk allows to fetch one more.
+        assert [next(result).id for i in range(3)] == [18, 1, 17]
+        assert wait_requests(fakeicat, 4) == 4
+        time.sleep(0.3)
+        assert len(search_requests(fakeicat)) == 4
+    finally:
+        result.close()
+    assert not prefetch_threads()
+    time.sleep(0.3)
+    assert len(search_requests(fakeicat)) == 4
+
+def test_prefetch_error(fakeicat, client):
+    """Errors in the background are raised in the consumer.
+    """
+    fakeicat.set_response("search", fault, status=500)
+    query = "SELECT o FROM Object o"
+    with pytest.raises(icat.ICATSessionError):
+        list(client.searchChunked(query, chunksize=3, prefetch=2))
+    assert not prefetch_threads()
+
+def test_prefetch_not_threadsafe(fakeicat, fakeclient):
+    """Prefetching requires a thread safe client.
+    """
+    fakeicat.set_response("search", datafiles)
+    query = "SELECT o FROM Object o"
+    with pytest.raises(ValueError):
+        list(fakeclient.searchChunked(query, chunksize=3, prefetch=2))
+    assert not search_requests(fakeicat)
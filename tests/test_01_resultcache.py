@@ -0,0 +1,105 @@
+"""Test module icat.resultcache with a fake ICAT server.
+"""
+
+import time
+import pytest
+from icat.resultcache import ResultCache
+from conftest import icat_ns
+from test_01_decoder import datafiles, values
+
+
+@pytest.fixture(scope="function")
+def cacheclient(fakeclient, fakeicat, tmpdirsec):
+    """A client using a result cache.  Depend on fakeclient so that
+    the server is reset in any case.
+    """
+    fakeicat.set_response("search", datafiles)
+    fakeicat.set_response("create",
+                          '<ns2:createResponse xmlns:ns2="%s">'
+                          '<return>42</return></ns2:createResponse>'
+                          % icat_ns)
+    return fakeicat.client(tmpdirsec / "fakeicat-cache",
+                           resultCache=ResultCache(maxsize=10, ttl=60))
+
+def search_calls(fakeicat):
+    return len([body for headers, body in fakeicat.requests
+                if b"<query>" in body])
+
+
+def test_cache_lru():
+    """The least recently used result is discarded if the cache is full.
+    """
+    cache = ResultCache(maxsize=2)
+    cache.put("a", [1])
+    cache.put("b", [2])
+    assert cache.get("a") == [1]
+    cache.put("c", [3])
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("c") == [3]
+    assert (cache.hits, cache.misses) == (2, 1)
+
+def test_cache_ttl():
+    """Results expire after the time to live.
+    """
+    cache = ResultCache(ttl=0.05)
+    cache.put("a", [1])
+    assert cache.get("a") == [1]
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+def test_cache_invalidate():
+    """Invalidation discards the results depending on the types.
+    """
+    cache = ResultCache()
+    cache.put("a", [1], ["Facility"])
+    cache.put("b", [2], ["Facility", "Investigation"])
+    cache.put("c", [3], ["Dataset"])
+    cache.invalidate(["Investigation"])
+    assert cache.get("a") == [1]
+    assert cache.get("b") is None
+    cache.invalidate(["Rule"])
+    assert len(cache) == 0
+
+def test_client_search(fakeicat, cacheclient):
+    """Repeated searches are answered from the cache, with copies of
+    the objects.
+    """
+    query = "SELECT o FROM Datafile o INCLUDE o.dataset"
+    first = cacheclient.search(query)
+    first[0].name = "changed"
+    second = cacheclient.search(query)
+    assert [o.id for o in second] == [o.id for o in first]
+    assert second[0].name != "changed"
+    assert search_calls(fakeicat) == 1
+    cache = cacheclient.resultCache
+    assert (cache.hits, cache.misses) == (1, 1)
+    cacheclient.sessionId = "other-session-id"
+    cacheclient.search(query)
+    assert search_calls(fakeicat) == 2
+
+def test_client_invalidate(fakeicat, cacheclient):
+    """Creating an object invalidates the results depending on its
+    type, including the types of related objects in the results.
+    """
+    cacheclient.search("SELECT o FROM Datafile o INCLUDE o.dataset")
+    fakeicat.set_response("search", values)
+    cacheclient.search("SELECT o.name FROM Facility o")
+    assert len(cacheclient.resultCache) == 2
+    cacheclient.create(cacheclient.new("Dataset", name="x"))
+    assert len(cacheclient.resultCache) == 1
+    cacheclient.search("SELECT o.name FROM Facility o")
+    assert cacheclient.resultCache.hits == 1
+
+def test_client_invalidate_relation(fakeicat, cacheclient):
+    """Types only reached by a relation path in the query are taken
+    into account as well.
+    """
+    fakeicat.set_response("search", values)
+    query = ("SELECT i.name FROM Investigation i JOIN i.datasets ds "
+             "JOIN ds.datafiles df WHERE df.name = 'a.dat'")
+    cacheclient.search(query)
+    assert len(cacheclient.resultCache) == 1
+    cacheclient.create(cacheclient.new("Datafile", name="x"))
+    assert len(cacheclient.resultCache) == 0
@@ -0,0 +1,123 @@
+"""Test module icat.schemaindex without connecting to an ICAT server.
+"""
+
+import pytest
+from icat.entities import getTypeMap
+from icat.exception import EntityTypeError
+from icat.query import Query
+from icat.schemaindex import SchemaIndex
+from conftest import mkobj, mkfield, FakeSchemaClient
+
+
+# Note: this is a small fake subset of the ICAT schema.
+entityInfo = {
+    'Parameter': mkobj("entityInfo", fields=[
+        mkfield("id", "ATTRIBUTE", "Long"),
+    ]),
+    'Facility': mkobj("entityInfo", constraints=[
+        mkobj("constraint", fieldNames=["name"]),
+    ], fields=[
+        mkfield("id", "ATTRIBUTE", "Long"),
+        mkfield("name", "ATTRIBUTE", "String", notNullable=True),
+        mkfield("investigations", "MANY", "Investigation"),
+    ]),
+    'Investigation': mkobj("entityInfo", constraints=[
+        mkobj("constraint", fieldNames=["facility", "name", "visitId"]),
+    ], fields=[
+        mkfield("id", "ATTRIBUTE", "Long"),
+        mkfield("name", "ATTRIBUTE", "String", notNullable=True),
+        mkfield("visitId", "ATTRIBUTE", "String", notNullable=True),
+        mkfield("facility", "ONE", "Facility", notNullable=True),
+        mkfield("datasets", "MANY", "Dataset"),
+    ]),
+    'Dataset': mkobj("entityInfo", constraints=[
+        mkobj("constraint", fieldNames=["investigation", "name"]),
+    ], fields=[
+        mkfield("id", "ATTRIBUTE", "Long"),
+        mkfield("name", "ATTRIBUTE", "String", notNullable=True),
+        mkfield("investigation", "ONE", "Investigation", notNullable=True),
+    ]),
+}
+
+class FakeClient(FakeSchemaClient):
+    """Emulate those parts of icat.client.Client needed to build queries.
+    """
+    def __init__(self):
+        super().__init__(entityInfo)
+        self.schemaIndex = SchemaIndex(self)
+        self.typemap = getTypeMap(self)
+    def getEntityClass(self, name):
+        return self.schemaIndex.getEntityClass(name)
+
+
+@pytest.fixture(scope="module")
+def client():
+    return FakeClient()
+
+
+def test_entity_class(client):
+    """Look up entity classes by BeanName.
+    """
+    index = client.schemaIndex
+    assert index.getEntityClass("Dataset") is client.typemap['dataset']
+    assert index.getEntityClass("Dataset") is client.typemap['dataset']
+    for name in ("dataset", "DATASET", "Parameter", "Datafile", ""):
+        with pytest.raises(EntityTypeError):
+            index.getEntityClass(name)
+
+def test_attr_info(client):
+    """Look up information on attributes.
+    """
+    Investigation = client.typemap['investigation']
+    info = Investigation.getAttrInfo(client, "facility")
+    assert info.relType == "ONE"
+    assert info.type == "Facility"
+    assert Investigation.getAttrInfo(client, "facility") is info
+    info = Investigation.getAttrInfo(client, "name")
+    assert info.relType == "ATTRIBUTE"
+    with pytest.raises(ValueError):
+        Investigation.getAttrInfo(client, "title")
+
+def test_attr_path(client):
+    """Resolve dotted attribute paths.
+    """
+    index = client.schemaIndex
+    Dataset = client.typemap['dataset']
+    path = index.getAttrPath(Dataset, "investigation.facility.name")
+    assert [(p, i.relType, c) for p, i, c in path] == [
+        ("investigation", "ONE", client.typemap['investigation']),
+        ("investigation.facility", "ONE", client.typemap['facility']),
+        ("investigation.facility.name", "ATTRIBUTE", None),
+    ]
+    assert index.getAttrPath(Dataset, "investigation.facility.name") is path
+    with pytest.raises(ValueError):
+        index.getAttrPath(Dataset, "name.investigation")
+    with pytest.raises(ValueError):
+        index.getAttrPath(Dataset, "investigation.title")
+
+def test_natural_order(client):
+    """The natural order is memoized, but callers get their own copy.
+    """
+    Dataset = client.typemap['dataset']
+    order = Dataset.getNaturalOrder(client)
+    assert order == [
+        "investigation.facility.name", "investigation.name",
+        "investigation.visitId", "name"
+    ]
+    order.append("id")
+    assert Dataset.getNaturalOrder(client) == order[:-1]
+
+def test_query_memoized(client):
+    """Building the same query a second time does not need any schema
+    information from the server.
+    """
+    def mkquery():
+        return Query(client, "Dataset", order=True,
+                     conditions={"investigation.facility.name": "= 'F'"},
+                     includes=["investigation.facility"])
+    str1 = str(mkquery())
+    calls = len(client.infoCalls)
+    str2 = str(mkquery())
+    assert len(client.infoCalls) == calls
+    assert str2 == str1
+    assert "ORDER BY" in str1
@@ -0,0 +1,87 @@
+"""Test concurrent use of a client from several threads with a fake
+ICAT server.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import pytest
+from icat.sslcontext import ThreadLocalTransport
+from test_01_decoder import datafiles, tree
+
+
+@pytest.fixture(scope="function")
+def threadclient(fakeclient, fakeicat, tmpdirsec):
+    """A thread safe client.  Depend on fakeclient so that the server
+    is reset in any case.
+    """
+    return fakeicat.client(tmpdirsec / "fakeicat-cache", threadSafe=True)
+
+@pytest.mark.parametrize("fastDecode", [False, True])
+def test_threadsafe_search(fakeicat, fakeclient, tmpdirsec, fastDecode):
+    """Search concurrently from the workers of a thread pool.
+    """
+    fakeicat.set_response("search", datafiles)
+    expected = tree(fakeclient.search("SELECT o FROM Object o"))
+    client = fakeicat.client(tmpdirsec / "fakeicat-cache",
+                             threadSafe=True, fastDecode=fastDecode)
+    queries = ["SELECT o FROM Object o WHERE o.id > %d" % i
+               for i in range(40)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(client.search, queries))
+    assert len(results) == 40
+    for r in results:
+        assert tree(r) == expected
+    sent = [body for headers, body in fakeicat.requests[-40:]]
+    assert len(set(sent)) == 40
+
+def test_threadsafe_stream(fakeicat, fakeclient, threadclient):
+    """searchStream() works with a thread safe client, also from
+    several threads.
+    """
+    fakeicat.set_response("search", datafiles)
+    expected = tree(fakeclient.search("SELECT o FROM Object o"))
+    def search(query):
+        return list(threadclient.searchStream(query))
+    assert tree(search("SELECT o FROM Object o")) == expected
+    queries = ["SELECT o FROM Object o WHERE o.id > %d" % i
+               for i in range(8)]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(search, queries))
+    for r in results:
+        assert tree(r) == expected
+
+def test_threadsafe_transport(threadclient):
+    """Each thread uses its own transport, sharing the options and
+    the cookies.
+    """
+    transport = threadclient.options.transport
+    assert isinstance(transport, ThreadLocalTransport)
+    threadclient.options.timeout = 17
+    def get_transport():
+        return transport.transport
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        other = executor.submit(get_transport).result()
+    assert other is not transport.transport
+    assert other.options.timeout == transport.transport.options.timeout == 17
+    assert other.cookiejar is transport.transport.cookiejar
+
+def test_threadsafe_messages(fakeicat, threadclient):
+    """The last sent message is recorded separately in each thread.
+    """
+    fakeicat.set_response("search", datafiles)
+    assert threadclient.last_sent() is None
+    sent = []
+    def search():
+        threadclient.search("SELECT o FROM Object o")
+        sent.append(threadclient.last_sent())
+    thread = threading.Thread(target=search)
+    thread.start()
+    thread.join()
+    assert "SELECT o FROM Object o" in str(sent[0])
+    assert threadclient.last_sent() is None
+
+def test_threadsafe_clone(threadclient):
+    """The clone of a thread safe client is thread safe as well.
+    """
+    clone = threadclient.clone()
+    assert isinstance(clone.options.transport, ThreadLocalTransport)
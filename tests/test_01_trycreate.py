@@ -0,0 +1,66 @@
+"""Test Client.tryCreateMany() with a fake ICAT server.
+"""
+
+import pytest
+import icat
+
+
+@pytest.fixture(scope="function")
+def datasets(faketable):
+    faketable.add("Dataset", id=1, investigation=10, name="ds0007")
+    faketable.add("Dataset", id=2, investigation=10, name="ds0500")
+    return faketable
+
+def created(table):
+    """The names of the datasets in each createMany call.
+    """
+    return [ [ v['name'] for v in beans ]
+             for op, beans in table.calls if op == "createMany" ]
+
+def newdatasets(client, names):
+    inv = client.new("Investigation", id=10)
+    return [ client.new("Dataset", investigation=inv, name=n) for n in names ]
+
+
+def test_try_create_many(fakeclient, datasets):
+    """Each failing object costs one call.
+    """
+    objs = newdatasets(fakeclient, [ "ds%04d" % i for i in range(1000) ])
+    outcome = fakeclient.tryCreateMany(objs)
+    assert len(created(datasets)) == 3
+    assert len(created(datasets)[-1]) == 998
+    for i in (7, 500):
+        assert isinstance(outcome[i], icat.ICATObjectExistsError)
+        assert objs[i].id is None
+    ids = [ o for o in outcome if isinstance(o, int) ]
+    assert ids == list(range(1000, 1998))
+    assert [ o.id for o in objs if o.id is not None ] == ids
+
+def test_try_create_many_duplicate(fakeclient, datasets):
+    """Duplicates within the list are detected as well.
+    """
+    objs = newdatasets(fakeclient, ["a", "b", "a"])
+    outcome = fakeclient.tryCreateMany(objs)
+    assert outcome[:2] == [1000, 1001]
+    assert isinstance(outcome[2], icat.ICATObjectExistsError)
+
+def test_try_create_many_validate(fakeclient, datasets, monkeypatch):
+    """Objects failing validation are not sent.
+    """
+    def validate(obj):
+        if obj.name.startswith("x"):
+            raise ValueError("invalid name %s" % obj.name)
+    objs = newdatasets(fakeclient, ["a", "x", "b"])
+    monkeypatch.setattr(type(objs[0]), "validate", validate)
+    outcome = fakeclient.tryCreateMany(objs)
+    assert created(datasets) == [["a", "b"]]
+    assert isinstance(outcome[1], ValueError)
+    assert [outcome[0], outcome[2]] == [1000, 1001]
+
+def test_try_create_many_error(fakeclient, datasets):
+    """Errors not referring to an object are raised.
+    """
+    datasets.failure = ("SESSION", "Session expired")
+    with pytest.raises(icat.ICATSessionError):
+        fakeclient.tryCreateMany(newdatasets(fakeclient, ["a", "b"]))
+    assert len(created(datasets)) == 1
@@ -0,0 +1,131 @@
+"""Test the typemap created by icat.entities.getTypeMap() without
+connecting to an ICAT server.
+"""
+
+import threading
+import time
+import pytest
+from icat.entities import TypeMap, getTypeMap
+from icat.entity import Entity
+from conftest import mkobj, mkfield, FakeSchemaClient
+
+
+# Note: this is a small fake subset of the ICAT schema.
+entityInfo = {
+    'Parameter': mkobj("entityInfo", fields=[
+        mkfield("id", "ATTRIBUTE", "Long"),
+        mkfield("stringValue", "ATTRIBUTE", "String"),
+        mkfield("type", "ONE", "ParameterType"),
+    ]),
+    'ParameterType': mkobj("entityInfo", fields=[
+        mkfield("id", "ATTRIBUTE", "Long"),
+        mkfield("name", "ATTRIBUTE", "String"),
+    ]),
+    'Investigation': mkobj("entityInfo", fields=[
+        mkfield("id", "ATTRIBUTE", "Long"),
+        mkfield("name", "ATTRIBUTE", "String"),
+        mkfield("parameters", "MANY", "InvestigationParameter"),
+    ]),
+    'InvestigationParameter': mkobj("entityInfo", fields=[
+        mkfield("id", "ATTRIBUTE", "Long"),
+        mkfield("stringValue", "ATTRIBUTE", "String"),
+        mkfield("type", "ONE", "ParameterType"),
+        mkfield("investigation", "ONE", "Investigation"),
+    ]),
+}
+
+class SlowClient(FakeSchemaClient):
+    """Emulate the latency of the ICAT server.
+    """
+    def __init__(self, threadSafe=True):
+        super().__init__(entityInfo)
+        self.kwargs = dict(threadSafe=threadSafe)
+        self.threads = set()
+    def getEntityInfo(self, beanName):
+        self.threads.add(threading.get_ident())
+        time.sleep(0.05)
+        return super().getEntityInfo(beanName)
+
+
+def test_typemap_eager():
+    """Without the lazy flag, all entity classes are created right away.
+    """
+    client = FakeSchemaClient(entityInfo)
+    typemap = getTypeMap(client)
+    assert isinstance(typemap, TypeMap)
+    assert sorted(client.infoCalls) == sorted(entityInfo.keys())
+    assert typemap['entityBaseBean'] is Entity
+    assert typemap['investigationParameter'].BeanName == \
+        "InvestigationParameter"
+    assert typemap['investigationparameter'] is \
+        typemap['investigationParameter']
+    assert issubclass(typemap['investigationParameter'], typemap['parameter'])
+    assert typemap['investigation'].InstMRel == frozenset(['parameters'])
+    assert len(client.infoCalls) == len(entityInfo)
+
+def test_typemap_lazy():
+    """With the lazy flag, entity classes are only created on demand.
+    """
+    client = FakeSchemaClient(entityInfo)
+    typemap = getTypeMap(client, lazy=True)
+    assert client.infoCalls == []
+    assert 'investigation' in typemap
+    assert 'Investigation' not in typemap
+    assert 'dataset' not in typemap
+    assert set(typemap.keys()) == {
+        'entityBaseBean', 'entitybasebean', 'parameter',
+        'investigation', 'investigationParameter', 'investigationparameter',
+        'parameterType', 'parametertype',
+    }
+    assert len(typemap) == 8
+    assert client.infoCalls == []
+    assert typemap['parameterType'].BeanName == "ParameterType"
+    assert client.infoCalls == ['ParameterType']
+    # The parent class is created first.
+    cls = typemap['investigationparameter']
+    assert client.infoCalls == [
+        'ParameterType', 'Parameter', 'InvestigationParameter'
+    ]
+    assert issubclass(cls, typemap['parameter'])
+    assert typemap['investigationParameter'] is cls
+    assert len(client.infoCalls) == 3
+    with pytest.raises(KeyError):
+        typemap['dataset']
+    # Accessing the values creates the remaining classes.
+    assert len(set(typemap.values())) == len(entityInfo) + 1
+    assert sorted(client.infoCalls) == sorted(entityInfo.keys())
+
+def test_typemap_load_sequential():
+    """The entity info is only fetched concurrently with a thread safe
+    client.
+    """
+    client = SlowClient(threadSafe=False)
+    getTypeMap(client)
+    assert client.threads == {threading.get_ident()}
+    assert sorted(client.infoCalls) == sorted(entityInfo.keys())
+
+def test_typemap_load_concurrent():
+    """The entity info is fetched concurrently in load().
+
+    The result must not depend on the order in which the requests
+    complete.
+    """
+    client = SlowClient()
+    typemap = getTypeMap(client)
+    assert len(client.threads) > 1
+    assert sorted(client.infoCalls) == sorted(entityInfo.keys())
+    assert list(typemap.keys()) == [
+        'entityBaseBean', 'entitybasebean', 'parameter',
+        'investigation', 'investigationParameter', 'investigationparameter',
+        'parameterType', 'parametertype',
+    ]
+    reference = getTypeMap(FakeSchemaClient(entityInfo))
+    for name, cls in typemap.items():
+        ref = reference[name]
+        assert cls.__name__ == ref.__name__
+        assert cls.BeanName == ref.BeanName
+        assert cls.InstAttr == ref.InstAttr
+        assert cls.InstRel == ref.InstRel
+        assert cls.InstMRel == ref.InstMRel
+        assert [c.__name__ for c in cls.__mro__] == \
+            [c.__name__ for c in ref.__mro__]
@@ -0,0 +1,93 @@
+"""Test Client.searchUniqueKeys() with a fake ICAT server.
+"""
+
+import io
+import pytest
+import icat
+
+
+@pytest.fixture(scope="function")
+def table(faketable):
+    faketable.add("Facility", id=1, name="ESNF")
+    faketable.add("Investigation", id=10, facility=1, name="inv1", visitId="1")
+    faketable.add("Investigation", id=11, facility=1, name="inv2", visitId="1")
+    faketable.add("Dataset", id=100, investigation=10, name="ds1")
+    faketable.add("Dataset", id=101, investigation=10, name="ds2")
+    faketable.add("Dataset", id=102, investigation=11, name="ds1")
+    return faketable
+
+invkey = "Investigation_facility-(name-ESNF)_name-inv%d_visitId-1"
+dskey = ("Dataset_investigation-(facility-(name-ESNF)_name-inv%d_visitId-1)"
+         "_name-ds%d")
+
+
+def test_unique_keys(fakeclient, table):
+    """Resolve keys in one query per type.
+    """
+    keys = [dskey % (1, 2), dskey % (2, 1), dskey % (1, 1), invkey % 2]
+    objindex = {}
+    objs = fakeclient.searchUniqueKeys(keys, objindex)
+    assert [o.id for o in objs] == [101, 102, 100, 11]
+    assert len(table.queries) == 3
+    assert table.queries[0] == "SELECT o FROM Facility o WHERE (o.name = 'ESNF')"
+    assert " OR " in table.queries[2]
+    assert objindex["Facility_name-ESNF"].id == 1
+    assert objindex[invkey % 1].id == 10
+
+def test_unique_keys_chunksize(fakeclient, table):
+    """Large batches are split according to chunksize.
+    """
+    keys = [dskey % (1, 1), dskey % (1, 2), dskey % (2, 1)]
+    objs = fakeclient.searchUniqueKeys(keys, chunksize=2)
+    assert [o.id for o in objs] == [100, 101, 102]
+    assert len([q for q in table.queries if "FROM Dataset" in q]) == 2
+
+def test_unique_keys_index(fakeclient, table):
+    """Keys found in objindex are not searched.
+    """
+    objindex = {}
+    fakeclient.searchUniqueKeys([invkey % 1], objindex)
+    table.calls.clear()
+    objs = fakeclient.searchUniqueKeys([invkey % 1, dskey % (1, 1)], objindex)
+    assert [o.id for o in objs] == [10, 100]
+    assert len(table.queries) == 1
+
+def test_unique_keys_missing(fakeclient, table):
+    """Keys that are not found raise SearchResultError.
+    """
+    with pytest.raises(icat.SearchResultError):
+        fakeclient.searchUniqueKeys(["Facility_name-ESNF",
+                                     "Facility_name-XYZ"])
+    with pytest.raises(ValueError):
+        fakeclient.searchUniqueKeys(["Facility"])
+
+def test_unique_keys_dumpfile(fakeclient, table):
+    """The YAML dumpfile reader resolves the references in a data
+    chunk in advance, skipping those to objects defined in the chunk.
+    """
+    yaml = pytest.importorskip("yaml")
+    from icat.dumpfile_yaml import YAMLDumpFileReader
+    newkey = dskey % (2, 9)
+    refs = [dskey % (1, 1), dskey % (1, 2), dskey % (2, 1), newkey]
+    data = {
+        'dataset': {
+            newkey: { 'investigation': invkey % 2, 'name': "ds9" },
+        },
+        'datafile': {
+            'Datafile_%d' % i: { 'dataset': k, 'name': "f%d.dat" % i }
+            for i, k in enumerate(refs)
+        },
+    }
+    infile = io.StringIO(yaml.safe_dump(data))
+    reader = YAMLDumpFileReader(fakeclient, infile)
+    objindex = {}
+    objs = reader.getobjs_from_data(next(reader.getdata()), objindex)
+    _, dataset = next(objs)
+    assert dataset.investigation.id == 11
+    assert len(table.queries) == 3
+    dataset.id = 103
+    objindex[newkey] = dataset
+    datafiles = { o.name: o for _, o in objs }
+    assert [datafiles["f%d.dat" % i].dataset.id
+            for i in range(4)] == [100, 101, 102, 103]
+    assert len(table.queries) == 3
@@ -0,0 +1,69 @@
+"""Test Client.upsertMany() with a fake ICAT server.
+"""
+
+import pytest
+import icat
+
+
+@pytest.fixture(scope="function")
+def datasets(faketable):
+    faketable.add("Dataset", id=100, investigation=10,
+                  name="ds1", description="first")
+    faketable.add("Dataset", id=101, investigation=10,
+                  name="ds2", description="second")
+    return faketable
+
+def dataset(table, id):
+    obj = table.objects[id]
+    assert obj['investigation'] == 10
+    return (obj['name'], obj['description'])
+
+def newdatasets(client, values):
+    inv = client.new("Investigation", id=10)
+    return [ client.new("Dataset", investigation=inv, name=n, description=d)
+             for n, d in values ]
+
+values = [("ds3", "third"), ("ds1", "first"), ("ds2", "changed")]
+
+
+def test_upsert_overwrite(fakeclient, datasets):
+    """Create the missing, update only the changed objects.
+    """
+    objs = newdatasets(fakeclient, values)
+    ids = fakeclient.upsertMany(objs)
+    assert ids == [1000, 100, 101]
+    assert [ o.id for o in objs ] == ids
+    assert [ c[0] for c in datasets.calls ] == ["search", "update",
+                                                 "createMany"]
+    assert datasets.calls[1] == ("update", 101)
+    assert dataset(datasets, 101) == ("ds2", "changed")
+    assert dataset(datasets, 1000) == ("ds3", "third")
+
+def test_upsert_ignore(fakeclient, datasets):
+    """Existing objects are left alone.
+    """
+    objs = newdatasets(fakeclient, values)
+    assert fakeclient.upsertMany(objs, mode="IGNORE") == [1000, 100, 101]
+    assert [ c[0] for c in datasets.calls ] == ["search", "createMany"]
+    assert dataset(datasets, 101) == ("ds2", "second")
+
+def test_upsert_check(fakeclient, datasets):
+    """Differences raise an error before anything is created.
+    """
+    objs = newdatasets(fakeclient, values)
+    with pytest.raises(icat.ICATObjectExistsError):
+        fakeclient.upsertMany(objs, mode="CHECK")
+    assert [ c[0] for c in datasets.calls ] == ["search"]
+    objs = newdatasets(fakeclient, values[:2])
+    assert fakeclient.upsertMany(objs, mode="CHECK") == [1000, 100]
+
+def test_upsert_invalid(fakeclient, datasets):
+    """Invalid mode and objects having one to many relations.
+    """
+    objs = newdatasets(fakeclient, values)
+    with pytest.raises(ValueError):
+        fakeclient.upsertMany(objs, mode="THROW")
+    objs[0].datafiles = [fakeclient.new("Datafile", name="a.dat")]
+    with pytest.raises(ValueError):
+        fakeclient.upsertMany(objs)
+    assert not datasets.calls
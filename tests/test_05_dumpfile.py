@@ -108,7 +108,8 @@ def icatdump(client, f, backend):
         investsearch = Query(client, "Investigation", attributes="id",
                              order=["facility.name", "name", "visitId"])
         for i in client.searchChunked(investsearch):
-            dumpfile.writedata(getInvestigationQueries(client, i), chunksize=5)
+            dumpfile.writedata(getInvestigationQueries(client, i),
+                               chunksize="auto")
         dumpfile.writedata(getDataCollectionQueries(client))
         if 'dataPublication' in client.typemap:
             pubsearch = Query(client, "DataPublication", attributes="id",